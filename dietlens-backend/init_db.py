@@ -10,6 +10,12 @@ if __name__ == '__main__':
     # 初始化数据库
     DatabaseUtils.initialize_database(db, app)
     
+    # 已有数据库补齐新增字段、索引和唯一约束
+    DatabaseUtils.migrate_schema(db, app)
+    
+    # 回填旧识别记录的营养总量
+    DatabaseUtils.backfill_recognition_totals(db, app)
+    
     # 创建上传目录
     DatabaseUtils.create_upload_directories(app)
     
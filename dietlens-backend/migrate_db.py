@@ -0,0 +1,16 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.utils.database_utils import DatabaseUtils
+from src.models import db
+from src.main import app
+
+if __name__ == '__main__':
+    # 升级已有数据库（不清除数据），部署新版本后、启动服务前执行
+    DatabaseUtils.migrate_schema(db, app)
+    
+    # 回填旧识别记录的营养总量
+    DatabaseUtils.backfill_recognition_totals(db, app)
+    
+    print("数据库迁移完成")
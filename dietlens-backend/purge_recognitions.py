@@ -0,0 +1,38 @@
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.utils.database_utils import DatabaseUtils
+from src.utils.retention_scheduler import purge_lock
+from src.models import db
+from src.main import app
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='清理超过保存天数且未保存到日记的识别记录和图片')
+    parser.add_argument('--days', type=int, default=None, help='保存天数，默认使用 RECOGNITION_HISTORY_DAYS')
+    parser.add_argument('--batch-size', type=int, default=None, help='每批删除的识别记录数')
+    parser.add_argument('--pause', type=float, default=None, help='每批之间暂停的秒数')
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不删除')
+    parser.add_argument('--no-orphans', action='store_true', help='不清理没有记录引用的旧图片')
+    args = parser.parse_args()
+    
+    # 与进程内的定时清理共用文件锁，避免同时执行
+    with purge_lock(app.config.get('RECOGNITION_PURGE_LOCK_FILE')) as acquired:
+        if not acquired:
+            print("其他进程正在清理识别记录，本次跳过")
+            sys.exit(0)
+        
+        # 清理过期识别记录
+        report = DatabaseUtils.purge_expired_recognitions(
+            db, app,
+            days=args.days,
+            batch_size=args.batch_size,
+            pause=args.pause,
+            dry_run=args.dry_run,
+            sweep_orphans=not args.no_orphans
+        )
+        
+        print(f"共删除 {report['recognitions']} 条识别记录、{report['recognizedFoods']} 条识别食物、"
+              f"{report['files'] + report['orphanFiles']} 个图片文件、{report['cacheEntries']} 条过期识别缓存，"
+              f"释放 {report['bytes'] / 1024 / 1024:.2f} MB")
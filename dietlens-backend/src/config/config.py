@@ -11,11 +11,38 @@ class Config:
     # 文件上传配置
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'src/static/uploads')
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB 最大上传限制
+    UPLOAD_SPOOL_THRESHOLD = 4 * 1024 * 1024  # 上传文件超过该大小才落盘到临时文件
     ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png'}
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')  # 上传文件存储：local（磁盘）、memory（进程内对象存储替身）
+    UPLOAD_DELETE_GRACE_SECONDS = 3600  # 清理未被引用的上传文件时，跳过该时间内写入或重复上传过的文件
     
     # OpenAI API配置
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', 'your_openai_api_key_here')
     OPENAI_API_MODEL = os.getenv('OPENAI_API_MODEL', 'gpt-4o-mini')
+    OPENAI_API_BASE = os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')
+    
+    # 识别后端：openai（真实接口）、stub（本地桩服务）、replay（回放录制样例）
+    RECOGNITION_BACKEND = os.getenv('RECOGNITION_BACKEND', 'openai')
+    RECOGNITION_STUB_URL = os.getenv('RECOGNITION_STUB_URL', 'http://127.0.0.1:8089/v1')
+    RECOGNITION_FIXTURES_DIR = os.getenv('RECOGNITION_FIXTURES_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'utils', 'recognition_fixtures'))
+    RECOGNITION_RECORD_FIXTURES = os.getenv('RECOGNITION_RECORD_FIXTURES', 'false').lower() == 'true'  # 录制真实识别结果用于回放
+    RECOGNITION_MAX_TOKENS = 300
+    # 识别响应模式：text（自由文本中提取JSON）、json_schema（严格JSON Schema结构化输出 + 精简提示）
+    RECOGNITION_RESPONSE_MODE = os.getenv('RECOGNITION_RESPONSE_MODE', 'text')
+    RECOGNITION_SCHEMA_MAX_TOKENS = 400  # 结构化输出模式的 max_tokens（约可容纳 6-8 种食物）
+    # 单用户限流：同时进行中的识别数，以及滑动窗口内的 token 预算（0 表示不限）
+    RECOGNITION_USER_MAX_IN_FLIGHT = int(os.getenv('RECOGNITION_USER_MAX_IN_FLIGHT', 2))
+    # gpt-4o-mini 按高清模式计费，一张最长边 1024 像素的图片约 25k 输入 token；预算默认不开启
+    RECOGNITION_USER_TOKEN_BUDGET = int(os.getenv('RECOGNITION_USER_TOKEN_BUDGET', 0))
+    RECOGNITION_USER_BUDGET_WINDOW = 3600  # 预算窗口（秒）
+    RECOGNITION_ESTIMATED_TOKENS = int(os.getenv('RECOGNITION_ESTIMATED_TOKENS', 26000))  # 每次识别预扣的 token 数，调用结束后按实际用量结算
+    # 前面的反向代理层数：按 X-Forwarded-For 取客户端地址（直接对外提供服务时设为 0，避免伪造）
+    TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 1))
+    FOOD_MATCH_MIN_SCORE = 0.6  # 识别结果与食物库名称模糊匹配的最低相似度
+    FOOD_MATCH_CONFIRM_SCORE = 0.9  # 低于该相似度的模糊匹配不自动写入，作为建议返回给客户端确认
+    FOOD_INDEX_REFRESH_SECONDS = 60  # 食物名称索引增量刷新间隔（秒）
+    FOOD_CATALOG_VERSION_CHECK_SECONDS = 5  # 食物库缓存检查跨进程版本号的间隔（秒）
+    SEARCH_FUZZY_MIN_RESULTS = 3  # 精确搜索结果少于该数量时追加容错（错别字）结果
     
     # JWT配置
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt_secret_key_change_in_production')
@@ -32,6 +59,36 @@ class Config:
     
     # 食物识别配置
     RECOGNITION_HISTORY_DAYS = 30  # 识别历史保存天数
+    RECOGNITION_PURGE_BATCH_SIZE = 500  # 过期识别记录每批删除条数
+    RECOGNITION_PURGE_PAUSE_SECONDS = 0.2  # 每批之间的间隔，避免长时间占用热点表
+    RECOGNITION_PURGE_INTERVAL_HOURS = float(os.getenv('RECOGNITION_PURGE_INTERVAL_HOURS', 0))  # 定时清理间隔，0 表示不在进程内定时执行
+    RECOGNITION_PURGE_LOCK_FILE = os.getenv('RECOGNITION_PURGE_LOCK_FILE', os.path.join(UPLOAD_FOLDER, '.purge.lock'))  # 同一台机器上的多个进程只有持有该文件锁的一个执行清理
+    RECOGNITION_WORKERS = int(os.getenv('RECOGNITION_WORKERS', 4))  # 异步识别工作线程数
+    RECOGNITION_QUEUE_SIZE = int(os.getenv('RECOGNITION_QUEUE_SIZE', 32))  # 排队+执行中的识别任务上限
+    RECOGNITION_JOB_TIMEOUT = 900  # 超过该秒数仍处于排队或识别中的记录视为中断（如进程重启），标记为失败
+    RECOGNITION_BATCH_MAX_IMAGES = 10  # 批量识别单次最多图片数
+    RECOGNITION_BATCH_CONCURRENCY = 4  # 批量识别单次请求的并发上限
+    RECOGNITION_GLOBAL_CONCURRENCY = int(os.getenv('RECOGNITION_GLOBAL_CONCURRENCY', 16))  # 所有批量识别请求共享的并发上限
+    RECOGNITION_CACHE_SIZE = 512  # 进程内识别结果缓存条数
+    RECOGNITION_CACHE_TTL = 7 * 24 * 3600  # 识别结果缓存有效期（秒）
+    RECOGNITION_PHASH_THRESHOLD = int(os.getenv('RECOGNITION_PHASH_THRESHOLD', 0))  # 近似重复图片的汉明距离阈值，0 表示关闭（默认关闭，开启后复用结果会在响应中标明来源）
+    RECOGNITION_PHASH_WINDOW_HOURS = 24  # 只与该时间窗口内的识别记录比较
+    RECOGNITION_IMAGE_MAX_EDGE = 1024  # 上传识别前图片最长边（像素）
+    RECOGNITION_IMAGE_FORMAT = os.getenv('RECOGNITION_IMAGE_FORMAT', 'JPEG')  # 重新编码格式：JPEG 或 WEBP
+    RECOGNITION_IMAGE_QUALITY = 80  # 重新编码质量
+    
+    # 视觉识别接口HTTP客户端配置
+    VISION_API_POOL_SIZE = int(os.getenv('VISION_API_POOL_SIZE', RECOGNITION_WORKERS * 2))  # 连接池大小，覆盖请求线程和后台识别线程
+    VISION_API_CONNECT_TIMEOUT = 5  # 连接超时（秒）
+    VISION_API_READ_TIMEOUT = 60  # 读取超时（秒）
+    VISION_API_QUEUE_TIMEOUT = 10  # 等待空闲连接的最长时间（秒），超时后直接返回服务繁忙
+    VISION_API_MAX_RETRIES = 2  # 429/5xx/网络错误的最大重试次数
+    VISION_API_BACKOFF_BASE = 0.5  # 指数退避基数（秒）
+    VISION_API_BACKOFF_MAX = 8  # 单次退避上限（秒）
+    VISION_API_RETRY_AFTER_MAX = 10  # Retry-After 超过该值（秒）时不再重试
+    VISION_API_BREAKER_THRESHOLD = 5  # 连续失败多少次后熔断
+    VISION_API_BREAKER_RESET_TIMEOUT = 30  # 熔断后多久进入半开状态（秒）
+    VISION_API_BREAKER_HALF_OPEN_CALLS = 1  # 半开状态允许的试探调用数
     
     # 营养目标默认值
     DEFAULT_CALORIES = 2000
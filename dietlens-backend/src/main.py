@@ -4,7 +4,12 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+import io
+import mimetypes
+from flask import Flask, Request, send_from_directory, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.middleware.proxy_fix import ProxyFix
+from tempfile import SpooledTemporaryFile
 from src.models import db
 from src.routes.auth import auth_bp
 from src.routes.food_recognition import food_recognition_bp
@@ -13,13 +18,30 @@ from src.routes.food_search import food_search_bp
 from src.routes.nutrition_goals import nutrition_goals_bp
 from src.routes.openai_api import openai_api_bp
 from src.config.config import config
+from src.utils.retention_scheduler import start_purge_scheduler
+from src.utils.storage import ContentStore, get_content_store
+from src.utils.food_catalog import food_catalog
+from src.utils.recognition_jobs import fail_stale_recognitions
+
+UPLOAD_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+class SpooledRequest(Request):
+    """上传文件在 UPLOAD_SPOOL_THRESHOLD 以内时保存在内存中，超过后才写入临时文件"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=config['default'].UPLOAD_SPOOL_THRESHOLD, mode='rb+')
 
 def create_app(config_name='default'):
     app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.request_class = SpooledRequest
     
     # 加载配置
     app.config.from_object(config[config_name])
     
+    # 部署在 Nginx 之后时，request.remote_addr 取 X-Forwarded-For 中的客户端地址
+    if app.config['TRUSTED_PROXY_COUNT']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_COUNT'])
+    
     # 确保上传目录存在
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
@@ -56,38 +78,31 @@ def create_app(config_name='default'):
     #     except FileNotFoundError:
     #         return "File not found", 404
         # 替换现有的上传文件路由
-    @app.route('/static/uploads/recognition/<filename>')
-    def uploaded_file(filename):
-        """服务上传的文件"""
+    @app.route('/static/uploads/<path:key>')
+    def uploaded_file(key):
+        """服务上传的文件，URL 直接映射到存储键"""
         try:
-            # 首先在根上传目录查找
-            root_file = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            if os.path.exists(root_file):
-                return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+            store = get_content_store()
+            # 内容寻址的文件内容不会变化，可长期缓存
+            max_age = UPLOAD_IMMUTABLE_MAX_AGE if ContentStore.digest_from_key(key) else None
             
-            # 然后在 recognition 子目录查找
-            recognition_file = os.path.join(app.config['UPLOAD_FOLDER'], 'recognition', filename)
-            if os.path.exists(recognition_file):
-                return send_from_directory(
-                    os.path.join(app.config['UPLOAD_FOLDER'], 'recognition'), 
-                    filename
-                )
-            return "File not found", 404
+            # 磁盘后端交给 send_from_directory（防路径穿越，不存在时抛出 NotFound），不做额外的存在性探测
+            root = getattr(store.backend, 'root', None)
+            if root is not None:
+                return send_from_directory(root, key, max_age=max_age)
             
-        except Exception as e:
-            print(f"Error serving file {filename}: {str(e)}")
-            return "Internal server error", 500
-        
-    @app.route('/static/uploads/community/<filename>')
-    def community_uploaded_file(filename):
-        """服务社区上传的文件"""
-        try:
-            community_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'community')
-            if os.path.exists(community_folder):
-                return send_from_directory(community_folder, filename)
+            data = store.read(key)
+            return send_file(
+                io.BytesIO(data),
+                mimetype=mimetypes.guess_type(key)[0] or 'application/octet-stream',
+                etag=ContentStore.digest_from_key(key) or True,
+                max_age=max_age,
+                download_name=os.path.basename(key)
+            )
+        except (FileNotFoundError, NotFound):
             return "File not found", 404
         except Exception as e:
-            print(f"Error serving community file {filename}: {str(e)}")
+            print(f"Error serving file {key}: {str(e)}")
             return "Internal server error", 500
 
     # 注册蓝图
@@ -101,6 +116,22 @@ def create_app(config_name='default'):
     # 创建数据库表
     with app.app_context():
         db.create_all()
+        
+        # 预先加载食物库缓存，搜索类接口不再逐次查询数据库
+        try:
+            food_catalog.warm()
+        except Exception as e:
+            print(f"Error in warming food catalog: {str(e)}")
+        
+        # 上次运行时中断的异步识别任务不会再执行，标记为失败
+        try:
+            fail_stale_recognitions()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error in failing stale recognitions: {str(e)}")
+    
+    # 定时清理过期识别记录（RECOGNITION_PURGE_INTERVAL_HOURS 为 0 时不启动）
+    app.extensions['recognition_purge_scheduler'] = start_purge_scheduler(app, db)
     
     return app
 
@@ -1,4 +1,4 @@
 from src.models.user import db, User
-from src.models.food import Food, FoodNutrition, FoodServingSize, FoodCategory, FavoriteFood, RecentViewedFood, FoodTag, FoodTagAssociation
+from src.models.food import Food, FoodNutrition, FoodServingSize, FoodCategory, FavoriteFood, RecentViewedFood, FoodTag, FoodTagAssociation, CatalogVersion
 from src.models.community import Post, Comment, PostLike, CommentLike, PostImage, PostTag, PostTagAssociation
-from src.models.nutrition import FoodRecognition, RecognizedFood, NutritionGoal, UserProfile, DailyIntake, Meal, FoodEntry
+from src.models.nutrition import FoodRecognition, RecognizedFood, RecognitionCacheEntry, NutritionGoal, UserProfile, DailyIntake, Meal, FoodEntry
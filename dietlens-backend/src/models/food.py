@@ -124,3 +124,15 @@ class RecentViewedFood(db.Model):
     
     def __repr__(self):
         return f'<RecentViewedFood {self.food_id} for {self.user_id}>'
+
+
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_versions'
+    
+    # 每行对应一份进程内缓存的数据，写入方递增版本号，其他进程据此判断缓存是否过期
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CatalogVersion {self.name}={self.version}>'
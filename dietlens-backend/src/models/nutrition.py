@@ -4,6 +4,20 @@ import uuid
 
 class FoodRecognition(db.Model):
     __tablename__ = 'food_recognitions'
+    __table_args__ = (
+        # 历史记录按用户和时间游标分页
+        db.Index('ix_food_recognitions_user_created_id', 'user_id', 'created_at', 'id'),
+        # 过期识别记录清理按时间扫描
+        db.Index('ix_food_recognitions_created_id', 'created_at', 'id'),
+        # 中断的异步识别任务按状态和时间查找
+        db.Index('ix_food_recognitions_status_created', 'status', 'created_at'),
+    )
+    
+    # 识别状态
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
     
     id = db.Column(db.String(36), primary_key=True)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
@@ -11,6 +25,17 @@ class FoodRecognition(db.Model):
     meal_type = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     saved_to_diary = db.Column(db.Boolean, default=False)
+    diary_entry = db.Column(db.Text)  # 保存到日记时的结果（JSON），重复保存时直接返回
+    status = db.Column(db.String(20), default=STATUS_DONE)
+    error_message = db.Column(db.Text)
+    image_phash = db.Column(db.String(16), index=True)  # 图片感知哈希（dHash）
+    # 识别到的食物营养总量（冗余存储，随食物增删改同步更新）；
+    # 不设默认值，NULL 表示新增字段前的旧记录，由回填脚本计算
+    total_calories = db.Column(db.Float)
+    total_protein = db.Column(db.Float)
+    total_carbs = db.Column(db.Float)
+    total_fat = db.Column(db.Float)
+    total_fiber = db.Column(db.Float)
     
     # 关系
     recognized_foods = db.relationship('RecognizedFood', backref='recognition', lazy=True, cascade="all, delete-orphan")
@@ -20,6 +45,27 @@ class FoodRecognition(db.Model):
         self.user_id = user_id
         self.image_url = image_url
         self.meal_type = kwargs.get('meal_type')
+        self.status = kwargs.get('status', self.STATUS_DONE)
+        self.image_phash = kwargs.get('image_phash')
+        # 新记录的营养总量一律由 update_totals 写入，尚未识别出食物时为 0
+        self.update_totals([])
+    
+    def update_totals(self, recognized_foods):
+        """根据识别到的食物重新计算营养总量"""
+        self.total_calories = sum(food.calories or 0 for food in recognized_foods)
+        self.total_protein = sum(food.protein or 0 for food in recognized_foods)
+        self.total_carbs = sum(food.carbs or 0 for food in recognized_foods)
+        self.total_fat = sum(food.fat or 0 for food in recognized_foods)
+        self.total_fiber = sum(food.fiber or 0 for food in recognized_foods)
+    
+    def total_nutrition(self):
+        return {
+            "calories": self.total_calories or 0,
+            "protein": self.total_protein or 0,
+            "carbs": self.total_carbs or 0,
+            "fat": self.total_fat or 0,
+            "fiber": self.total_fiber or 0
+        }
     
     def __repr__(self):
         return f'<FoodRecognition {self.id}>'
@@ -49,6 +95,18 @@ class RecognizedFood(db.Model):
         return f'<RecognizedFood {self.name} in {self.recognition_id}>'
 
 
+class RecognitionCacheEntry(db.Model):
+    __tablename__ = 'recognition_cache'
+    
+    image_hash = db.Column(db.String(64), primary_key=True)  # 图片内容的 SHA-256
+    result = db.Column(db.Text, nullable=False)  # 识别结果 JSON
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)  # 按创建时间清理过期缓存
+    hit_count = db.Column(db.Integer, default=0)
+    
+    def __repr__(self):
+        return f'<RecognitionCacheEntry {self.image_hash[:12]}>'
+
+
 class NutritionGoal(db.Model):
     __tablename__ = 'nutrition_goals'
     
@@ -85,6 +143,9 @@ class UserProfile(db.Model):
 
 class DailyIntake(db.Model):
     __tablename__ = 'daily_intakes'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'date', name='uq_daily_intakes_user_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
@@ -99,6 +160,9 @@ class DailyIntake(db.Model):
 
 class Meal(db.Model):
     __tablename__ = 'meals'
+    __table_args__ = (
+        db.UniqueConstraint('daily_intake_id', 'name', name='uq_meals_daily_intake_name'),
+    )
     
     id = db.Column(db.String(36), primary_key=True)
     daily_intake_id = db.Column(db.Integer, db.ForeignKey('daily_intakes.id'), nullable=False)
@@ -3,6 +3,7 @@ from datetime import datetime
 import uuid
 
 from src.models import db, Post, PostImage, PostTag, PostTagAssociation, Comment, PostLike, CommentLike, User
+from src.utils.storage import get_content_store
 
 community_bp = Blueprint('community', __name__)
 
@@ -277,10 +278,12 @@ def create_post():
                 
                 image_file.seek(0)  # 重置文件指针
                 
-                # 保存图片（实际项目中应上传到云存储）
-                filename = f"{post.id}_{i}_{image_file.filename}"
-                image_path = f"src/static/uploads/community/{filename}"  # 相对路径
-                image_file.save(image_path)
+                # 按内容哈希保存图片，相同图片只存一份
+                try:
+                    stored = get_content_store().save_upload('community', image_file)
+                except ValueError:
+                    db.session.rollback()
+                    return make_response(400, "图片格式不支持", error="UNSUPPORTED_FORMAT")
                 
                 # 获取对应的说明文字
                 caption = image_captions[i] if i < len(image_captions) else None
@@ -288,7 +291,7 @@ def create_post():
                 # 创建图片记录
                 post_image = PostImage(
                     post_id=post.id,
-                    url=f"/static/uploads/community/{filename}",  # 返回相对路径
+                    url=stored.url,  # 返回相对路径
                     caption=caption,
                     order=i
                 )
@@ -1,12 +1,27 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 import os
+import io
+import base64
+import hashlib
+import time
 import uuid
 from datetime import datetime
 from werkzeug.utils import secure_filename
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 import json
 
 from src.config.config import config
 from src.models import db, FoodRecognition, RecognizedFood, Food, User
+from src.utils.recognition_jobs import recognition_job_queue, map_concurrently
+from src.utils.recognition_cache import recognition_cache
+from src.utils.image_hash import dhash, hamming_distance, near_duplicate_index
+from src.utils.image_preprocess import preprocess_stats
+from src.utils.recognition_backend import get_recognition_backend, recognition_call_stats, pop_call_usage
+from src.utils.user_limiter import user_recognition_limiter, LimitExceeded
+from src.utils.food_matcher import food_name_index
+from src.utils.food_catalog import food_catalog
+from src.utils.storage import ContentStore, get_content_store
 
 food_recognition_bp = Blueprint('food_recognition', __name__)
 
@@ -27,78 +42,206 @@ def make_response(status, message, data=None, error=None):
         response["error"] = error
     return jsonify(response)
 
-# 辅助函数：调用OpenAI API进行食物识别
-def recognize_food_with_openai(image_path):
-    """
-    使用OpenAI API识别图片中的食物
-    这里是一个示例实现，实际项目中需要根据OpenAI API的具体要求进行调整
-    """
-    import requests
-    import base64
-    import os
-    
-    # 读取图片并转为base64
-    with open(image_path, "rb") as image_file:
-        base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-    
-    # 构建API请求
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {config['default'].OPENAI_API_KEY}"
+# 辅助函数：识别请求超过用户限流时的 429 响应
+def limit_exceeded_response(exc, user_id):
+    messages = {
+        "concurrency": "当前识别请求过多，请等待进行中的识别完成",
+        "budget": "识别额度已用完，请稍后再试"
     }
+    response = make_response(429, messages.get(exc.reason, "请求过于频繁"), error="RATE_LIMITED", data={
+        "reason": exc.reason,
+        "retryAfter": exc.retry_after,
+        "usage": user_recognition_limiter.usage(user_id)
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(exc.retry_after)
+    return response
+
+# 辅助函数：按存储键读取图片及其内容哈希（内容寻址的键中已包含哈希，无需重新计算）
+def load_recognition_image(image_key):
+    image_data = get_content_store().read(image_key)
+    image_hash = ContentStore.digest_from_key(image_key) or hashlib.sha256(image_data).hexdigest()
+    return image_data, image_hash
+
+# 辅助函数：带内容哈希缓存的食物识别，相同图片不重复调用上游接口；
+# 传入 user_id 时按实际 token 用量结算该用户的预算
+def recognize_food(image_key, user_id=None):
+    image_hash = ContentStore.digest_from_key(image_key)
+    image_data = None
+    if not image_hash:
+        image_data, image_hash = load_recognition_image(image_key)
     
-    payload = {
-        "model": config['default'].OPENAI_API_MODEL,
-        "messages": [
-            {
-                "role": "system",
-                "content": "你是一个专业的食物识别助手，能够精确识别图片中的食物，并提供详细的营养成分信息。"
-            },
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "请识别这张图片中的食物，并提供以下信息：\n1. 食物名称\n2. 大致份量（如1碗、2片等）\n3. 估计重量（克）\n4. 热量（千卡）\n5. 蛋白质（克）\n6. 碳水化合物（克）\n7. 脂肪（克）\n8. 膳食纤维（克）\n9. 识别置信度（0-1之间的小数）\n\n请以JSON格式返回，格式如下：\n{\"foods\": [{\"name\": \"食物名称\", \"amount\": \"份量描述\", \"weight\": 重量, \"calories\": 热量, \"protein\": 蛋白质, \"carbs\": 碳水, \"fat\": 脂肪, \"fiber\": 纤维, \"confidence\": 置信度}]}"},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                    # {"type": "image_url", "image_url": {"url": f"{image_path}"}}
-                ]
-            }
-        ],
-        "max_tokens": 300
+    cached_result = recognition_cache.get(image_hash)
+    if cached_result is not None:
+        if user_id:
+            user_recognition_limiter.settle(user_id, 0)
+        return cached_result
+    
+    if image_data is None:
+        image_data = get_content_store().read(image_key)
+    
+    pop_call_usage()
+    recognition_result = get_recognition_backend().recognize(image_data)
+    if user_id:
+        user_recognition_limiter.settle(user_id, pop_call_usage())
+    if "error" not in recognition_result:
+        recognition_cache.set(image_hash, recognition_result)
+    return recognition_result
+
+# 辅助函数：识别出的单个食物的响应格式；匹配分数不够高时 id 为空，附带待确认的建议食物
+def food_item_data(food_item, match):
+    data = {
+        "id": food_name_index.confirmed(match),
+        "name": food_item.get("name"),
+        "amount": food_item.get("amount"),
+        "weight": food_item.get("weight"),
+        "unit": "g",
+        "calories": food_item.get("calories"),
+        "protein": food_item.get("protein"),
+        "carbs": food_item.get("carbs"),
+        "fat": food_item.get("fat"),
+        "fiber": food_item.get("fiber"),
+        "confidence": food_item.get("confidence")
     }
+    suggestion = food_name_index.suggestion(match)
+    if suggestion:
+        data["suggestedFood"] = suggestion
+    return data
+
+# 辅助函数：根据识别结果写入识别到的食物，返回响应用的食物列表和总营养
+def apply_recognition_result(recognition, recognition_result):
+    foods_data = []
+    recognized_foods = []
+    food_items = recognition_result.get("foods", [])
     
-    # 发送请求到OpenAI API
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
+    # 一次性将所有识别出的名称匹配到食物库
+    matches = food_name_index.match_many([food_item.get("name") for food_item in food_items])
     
-    if response.status_code == 200:
-        result = response.json()
-        # 提取JSON响应
-        content = result["choices"][0]["message"]["content"]
+    for food_item in food_items:
+        food_name = food_item.get("name")
+        match = matches.get(food_name)
+        # 只有精确、别名或高分匹配直接关联食物库，低分匹配作为建议返回
+        food_id = food_name_index.confirmed(match)
         
-        # 从文本中提取JSON部分
-        try:
-            # 尝试直接解析整个内容
-            food_data = json.loads(content)
-        except json.JSONDecodeError:
-            # 如果失败，尝试从文本中提取JSON部分
-            import re
-            json_match = re.search(r'```json\n(.*?)\n```', content, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                # 尝试找到 { 和 } 之间的内容
-                json_match = re.search(r'{.*}', content, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                else:
-                    return {"error": "无法从响应中提取JSON数据"}
-            
-            try:
-                food_data = json.loads(json_str)
-            except json.JSONDecodeError:
-                return {"error": "无法解析提取的JSON数据"}
-        return food_data
-    else:
-        return {"error": f"API请求失败: {response.status_code} - {response.text}"}
+        recognized_food = RecognizedFood(
+            recognition_id=recognition.id,
+            food_id=food_id,
+            name=food_name,
+            amount=food_item.get("amount"),
+            weight=food_item.get("weight"),
+            unit="g",
+            calories=food_item.get("calories"),
+            protein=food_item.get("protein"),
+            carbs=food_item.get("carbs"),
+            fat=food_item.get("fat"),
+            fiber=food_item.get("fiber"),
+            confidence=food_item.get("confidence")
+        )
+        db.session.add(recognized_food)
+        recognized_foods.append(recognized_food)
+        
+        # 构建响应数据
+        foods_data.append(food_item_data(food_item, match))
+    
+    # 营养总量与食物在同一事务中写入识别记录
+    recognition.update_totals(recognized_foods)
+    
+    return foods_data, recognition.total_nutrition()
+
+# 辅助函数：将已有识别记录的食物转换为识别结果格式
+def recognition_result_from_foods(recognized_foods):
+    return {
+        "foods": [{
+            "name": food.name,
+            "amount": food.amount,
+            "weight": food.weight,
+            "calories": food.calories,
+            "protein": food.protein,
+            "carbs": food.carbs,
+            "fat": food.fat,
+            "fiber": food.fiber,
+            "confidence": food.confidence
+        } for food in recognized_foods]
+    }
+
+# 辅助函数：查找同一用户最近上传的近似重复图片，返回 (识别记录, 汉明距离) 或 None
+def find_near_duplicate(user_id, image_phash):
+    match = near_duplicate_index.find(user_id, image_phash)
+    if not match:
+        return None
+    
+    recognition_id, distance = match
+    source = FoodRecognition.query.get(recognition_id)
+    if not source or source.status != FoodRecognition.STATUS_DONE:
+        return None
+    return source, distance
+
+# 辅助函数：按内容哈希保存识别图片并计算感知哈希，返回 (存储键, 相对URL, 感知哈希)
+def save_recognition_image(file):
+    image_data = file.read()
+    stored = get_content_store().save('recognition', image_data, ContentStore.upload_extension(file.filename))
+    
+    # 计算感知哈希，失败时不影响识别
+    try:
+        image_phash = dhash(io.BytesIO(image_data))
+    except Exception as e:
+        print(f"Error in computing image hash: {str(e)}")
+        image_phash = None
+    
+    return stored.key, stored.url, image_phash
+
+# 辅助函数：删除没有识别记录引用的上传图片（识别失败、未创建记录时调用）；
+# 相同内容的图片共用一个文件，仍被其他记录引用或在宽限期内被重复上传时保留
+def discard_recognition_images(image_urls):
+    image_urls = set(image_urls)
+    if not image_urls:
+        return
+    referenced = {row.image_url for row in FoodRecognition.query.with_entities(FoodRecognition.image_url)
+                                                                .filter(FoodRecognition.image_url.in_(list(image_urls))).all()}
+    store = get_content_store()
+    for image_url in image_urls - referenced:
+        key = ContentStore.key_from_url(image_url)
+        if key:
+            # 宽限期内的文件可能正被其他请求以相同内容上传，留给定时清理回收
+            store.delete(key, min_age=config['default'].UPLOAD_DELETE_GRACE_SECONDS)
+
+# 后台任务：执行识别并更新识别记录状态，结束后释放用户的识别名额
+def run_recognition_job(recognition_id, image_key, user_id):
+    try:
+        execute_recognition_job(recognition_id, image_key, user_id)
+    finally:
+        user_recognition_limiter.release(user_id)
+
+def execute_recognition_job(recognition_id, image_key, user_id):
+    recognition = FoodRecognition.query.get(recognition_id)
+    if not recognition:
+        return
+    
+    recognition.status = FoodRecognition.STATUS_RUNNING
+    db.session.commit()
+    
+    try:
+        recognition_result = recognize_food(image_key, user_id)
+        
+        if "error" in recognition_result:
+            recognition.status = FoodRecognition.STATUS_FAILED
+            recognition.error_message = str(recognition_result["error"])
+        else:
+            apply_recognition_result(recognition, recognition_result)
+            recognition.status = FoodRecognition.STATUS_DONE
+        db.session.commit()
+        
+        if recognition.status == FoodRecognition.STATUS_DONE and recognition.image_phash:
+            near_duplicate_index.add(recognition.user_id, recognition.image_phash, recognition.id, recognition.created_at)
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in recognition job {recognition_id}: {str(e)}")
+        recognition = FoodRecognition.query.get(recognition_id)
+        if recognition:
+            recognition.status = FoodRecognition.STATUS_FAILED
+            recognition.error_message = str(e)
+            db.session.commit()
 
 @food_recognition_bp.route('/analyze', methods=['POST'])
 def analyze_food():
@@ -113,6 +256,10 @@ def analyze_food():
     file = request.files['image']
     user_id = request.form['userId']
     meal_type = request.form.get('mealType')
+    # 异步模式：立即返回任务ID，通过 /<recognitionId>/status 轮询结果
+    async_mode = request.form.get('async', 'false').lower() == 'true'
+    # 近似重复检测（RECOGNITION_PHASH_THRESHOLD 大于 0 时生效）：传 dedupe=false 时强制调用识别服务
+    dedupe = request.form.get('dedupe', 'true').lower() != 'false'
     
     # 检查文件是否有效
     if file.filename == '':
@@ -126,90 +273,121 @@ def analyze_food():
     # if not user:
     #     return make_response(404, "用户不存在", error="USER_NOT_FOUND")
     
+    # 单用户并发和预算限制，在保存图片之前拒绝
+    try:
+        user_recognition_limiter.acquire(user_id)
+    except LimitExceeded as e:
+        return limit_exceeded_response(e, user_id)
+    # 异步任务提交成功后由后台任务释放名额
+    release_slot = True
+    
     try:
         # 保存上传的图片
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        new_filename = f"{user_id}_{timestamp}_{filename}"
+        image_key, image_url, image_phash = save_recognition_image(file)
         
-        # 确保上传目录存在
-        upload_folder = os.path.join(config['default'].UPLOAD_FOLDER, 'recognition')
-        os.makedirs(upload_folder, exist_ok=True)
+        # 同一用户最近有近似重复的图片时直接复用其识别结果
+        duplicate = find_near_duplicate(user_id, image_phash) if dedupe and image_phash else None
+        if duplicate:
+            source, distance = duplicate
+            recognized_foods = RecognizedFood.query.filter_by(recognition_id=source.id).all()
+            
+            recognition = FoodRecognition(
+                user_id=user_id,
+                image_url=image_url,
+                meal_type=meal_type,
+                image_phash=image_phash
+            )
+            db.session.add(recognition)
+            
+            foods_data, total_nutrition = apply_recognition_result(
+                recognition, recognition_result_from_foods(recognized_foods)
+            )
+            db.session.commit()
+            near_duplicate_index.add(user_id, image_phash, recognition.id, recognition.created_at)
+            user_recognition_limiter.settle(user_id, 0)
+            
+            response_data = {
+                "recognitionId": recognition.id,
+                "foods": foods_data,
+                "totalNutrition": total_nutrition,
+                "imageUrl": image_url,
+                "status": recognition.status,
+                "nearDuplicateOf": {
+                    "recognitionId": source.id,
+                    "distance": distance
+                }
+            }
+            return make_response(200, "识别成功（复用近似图片的识别结果）", data=response_data)
         
-        file_path = os.path.join(upload_folder, new_filename)
-        file.save(file_path)
+        if async_mode:
+            # 创建待处理的识别记录并加入任务队列
+            recognition = FoodRecognition(
+                user_id=user_id,
+                image_url=image_url,
+                meal_type=meal_type,
+                status=FoodRecognition.STATUS_PENDING,
+                image_phash=image_phash
+            )
+            db.session.add(recognition)
+            db.session.commit()
+            
+            queued = recognition_job_queue.submit(
+                current_app._get_current_object(),
+                run_recognition_job,
+                recognition.id,
+                image_key,
+                user_id
+            )
+            if not queued:
+                # 没有执行识别：删除待处理记录和图片，退还预扣的预算（名额在 finally 中释放）
+                db.session.delete(recognition)
+                db.session.commit()
+                user_recognition_limiter.settle(user_id, 0)
+                try:
+                    discard_recognition_images([image_url])
+                except Exception as e:
+                    print(f"Error in discarding queued image: {str(e)}")
+                response = make_response(503, "识别队列已满，请稍后重试", error="QUEUE_FULL")
+                response.status_code = 503
+                return response
+            release_slot = False
+            
+            response_data = {
+                "jobId": recognition.id,
+                "recognitionId": recognition.id,
+                "status": recognition.status,
+                "imageUrl": image_url
+            }
+            return make_response(202, "识别任务已提交", data=response_data)
+        
+        # 调用OpenAI API进行食物识别（优先使用缓存）
+        recognition_result = recognize_food(image_key, user_id)
         
-        # 调用OpenAI API进行食物识别
-        recognition_result = recognize_food_with_openai(file_path)
+        if recognition_result.get("busy"):
+            response = make_response(503, "识别服务繁忙，请稍后重试", error="SERVICE_BUSY")
+            response.status_code = 503
+            return response
         
         if "error" in recognition_result:
             return make_response(500, f"识别服务暂时不可用{recognition_result}", error="RECOGNITION_FAILED")
         
         # 创建识别记录
-        image_url = f"/static/uploads/recognition/{new_filename}"  # 相对URL路径
         recognition = FoodRecognition(
             user_id=user_id,
             image_url=image_url,
-            meal_type=meal_type
+            meal_type=meal_type,
+            image_phash=image_phash
         )
         db.session.add(recognition)
         
         # 添加识别到的食物
-        total_nutrition = {
-            "calories": 0,
-            "protein": 0,
-            "carbs": 0,
-            "fat": 0,
-            "fiber": 0
-        }
-        
-        foods_data = []
-        
-        for food_item in recognition_result.get("foods", []):
-            # 查找数据库中是否有匹配的食物
-            food_name = food_item.get("name")
-            food = Food.query.filter_by(name=food_name).first()
-            
-            recognized_food = RecognizedFood(
-                recognition_id=recognition.id,
-                food_id=food.id if food else None,
-                name=food_name,
-                amount=food_item.get("amount"),
-                weight=food_item.get("weight"),
-                unit="g",
-                calories=food_item.get("calories"),
-                protein=food_item.get("protein"),
-                carbs=food_item.get("carbs"),
-                fat=food_item.get("fat"),
-                fiber=food_item.get("fiber"),
-                confidence=food_item.get("confidence")
-            )
-            db.session.add(recognized_food)
-            
-            # 累加营养成分
-            total_nutrition["calories"] += food_item.get("calories", 0)
-            total_nutrition["protein"] += food_item.get("protein", 0)
-            total_nutrition["carbs"] += food_item.get("carbs", 0)
-            total_nutrition["fat"] += food_item.get("fat", 0)
-            total_nutrition["fiber"] += food_item.get("fiber", 0)
-            
-            # 构建响应数据
-            foods_data.append({
-                "id": food.id if food else None,
-                "name": food_name,
-                "amount": food_item.get("amount"),
-                "weight": food_item.get("weight"),
-                "unit": "g",
-                "calories": food_item.get("calories"),
-                "protein": food_item.get("protein"),
-                "carbs": food_item.get("carbs"),
-                "fat": food_item.get("fat"),
-                "fiber": food_item.get("fiber"),
-                "confidence": food_item.get("confidence")
-            })
+        foods_data, total_nutrition = apply_recognition_result(recognition, recognition_result)
         
         db.session.commit()
         
+        if image_phash:
+            near_duplicate_index.add(user_id, image_phash, recognition.id, recognition.created_at)
+        
         # 构建响应
         response_data = {
             "recognitionId": recognition.id,
@@ -224,6 +402,388 @@ def analyze_food():
         db.session.rollback()
         print(f"Error in food recognition: {str(e)}")
         return make_response(500, f"识别过程失败{str(e)}", error="RECOGNITION_FAILED")
+    finally:
+        if release_slot:
+            user_recognition_limiter.release(user_id)
+
+
+# 辅助函数：格式化一条 SSE 事件
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@food_recognition_bp.route('/analyze-stream', methods=['POST'])
+def analyze_food_stream():
+    """
+    上传食物图片并以 SSE 流式返回识别结果
+
+    事件顺序：recognition（记录ID）-> food（每识别出一个食物推送一次）-> done（写库后的完整结果和营养总量）；
+    失败时推送 error 事件
+    """
+    if 'image' not in request.files:
+        return make_response(400, "缺少图片文件", error="INVALID_IMAGE")
+    
+    if 'userId' not in request.form:
+        return make_response(400, "缺少用户ID", error="USER_NOT_FOUND")
+    
+    file = request.files['image']
+    user_id = request.form['userId']
+    meal_type = request.form.get('mealType')
+    
+    if file.filename == '':
+        return make_response(400, "未选择文件", error="INVALID_IMAGE")
+    
+    if not allowed_file(file.filename):
+        return make_response(400, "图片格式不支持", error="UNSUPPORTED_FORMAT")
+    
+    try:
+        user_recognition_limiter.acquire(user_id)
+    except LimitExceeded as e:
+        return limit_exceeded_response(e, user_id)
+    
+    try:
+        image_key, image_url, image_phash = save_recognition_image(file)
+        
+        recognition = FoodRecognition(
+            user_id=user_id,
+            image_url=image_url,
+            meal_type=meal_type,
+            status=FoodRecognition.STATUS_RUNNING,
+            image_phash=image_phash
+        )
+        db.session.add(recognition)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        user_recognition_limiter.release(user_id)
+        print(f"Error in food recognition stream: {str(e)}")
+        return make_response(500, f"识别过程失败{str(e)}", error="RECOGNITION_FAILED")
+    
+    recognition_id = recognition.id
+    
+    def generate():
+        events = None
+        settled = False
+        finished = False
+        try:
+            yield sse_event("recognition", {"recognitionId": recognition_id, "imageUrl": image_url})
+            
+            image_data, image_hash = load_recognition_image(image_key)
+            
+            # 命中缓存时直接逐条推送缓存结果
+            cached_result = recognition_cache.get(image_hash)
+            if cached_result is not None:
+                events = [("food", food_item) for food_item in cached_result.get("foods", [])]
+                events.append(("result", cached_result))
+            else:
+                pop_call_usage()
+                events = get_recognition_backend().recognize_stream(image_data)
+            
+            recognition_result = None
+            for event, payload in events:
+                if event == "food":
+                    match = food_name_index.match(payload.get("name"))
+                    yield sse_event("food", food_item_data(payload, match))
+                else:
+                    recognition_result = payload
+            user_recognition_limiter.settle(user_id, pop_call_usage() if cached_result is None else 0)
+            settled = True
+            
+            current = FoodRecognition.query.get(recognition_id)
+            if recognition_result is None or "error" in recognition_result:
+                error_message = str(recognition_result["error"]) if recognition_result else "识别没有返回结果"
+                current.status = FoodRecognition.STATUS_FAILED
+                current.error_message = error_message
+                db.session.commit()
+                finished = True
+                yield sse_event("error", {"recognitionId": recognition_id, "error": "RECOGNITION_FAILED", "message": error_message})
+                return
+            
+            if cached_result is None:
+                recognition_cache.set(image_hash, recognition_result)
+            
+            foods_data, total_nutrition = apply_recognition_result(current, recognition_result)
+            current.status = FoodRecognition.STATUS_DONE
+            db.session.commit()
+            finished = True
+            
+            if image_phash:
+                near_duplicate_index.add(user_id, image_phash, recognition_id, current.created_at)
+            
+            yield sse_event("done", {
+                "recognitionId": recognition_id,
+                "foods": foods_data,
+                "totalNutrition": total_nutrition,
+                "imageUrl": image_url,
+                "status": FoodRecognition.STATUS_DONE
+            })
+            
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error in food recognition stream: {str(e)}")
+            current = FoodRecognition.query.get(recognition_id)
+            if current:
+                current.status = FoodRecognition.STATUS_FAILED
+                current.error_message = str(e)
+                db.session.commit()
+            finished = True
+            yield sse_event("error", {"recognitionId": recognition_id, "error": "RECOGNITION_FAILED", "message": str(e)})
+        finally:
+            # 客户端中途断开时在 yield 处收到 GeneratorExit（不被 except Exception 捕获），在这里收尾：
+            # 关闭上游流式响应，结算预算，并把仍在进行中的识别记录标记为失败
+            if hasattr(events, 'close'):
+                events.close()
+            if not settled:
+                # 已调用上游时可能已经消耗了 token，但拿不到实际用量，按预估用量结算
+                user_recognition_limiter.settle(user_id, user_recognition_limiter.estimated_tokens if hasattr(events, 'close') else 0)
+            if not finished:
+                try:
+                    db.session.rollback()
+                    FoodRecognition.query.filter_by(id=recognition_id, status=FoodRecognition.STATUS_RUNNING).update({
+                        FoodRecognition.status: FoodRecognition.STATUS_FAILED,
+                        FoodRecognition.error_message: "客户端断开连接，识别已取消"
+                    }, synchronize_session=False)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error in cancelling recognition stream {recognition_id}: {str(e)}")
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    # 响应关闭时释放名额（客户端提前断开时生成器可能不会执行）
+    response.call_on_close(lambda: user_recognition_limiter.release(user_id))
+    response.headers['Cache-Control'] = 'no-cache'
+    # 关闭反向代理缓冲，保证事件即时送达
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@food_recognition_bp.route('/analyze-batch', methods=['POST'])
+def analyze_food_batch():
+    """批量上传食物图片并识别，多张图片并发调用识别服务"""
+    images = request.files.getlist('images')
+    
+    if not images:
+        return make_response(400, "缺少图片文件", error="INVALID_IMAGE")
+    
+    if 'userId' not in request.form:
+        return make_response(400, "缺少用户ID", error="USER_NOT_FOUND")
+    
+    max_images = config['default'].RECOGNITION_BATCH_MAX_IMAGES
+    if len(images) > max_images:
+        return make_response(400, f"单次最多上传{max_images}张图片", error="TOO_MANY_IMAGES")
+    
+    for file in images:
+        if file.filename == '':
+            return make_response(400, "未选择文件", error="INVALID_IMAGE")
+        if not allowed_file(file.filename):
+            return make_response(400, "图片格式不支持", error="UNSUPPORTED_FORMAT")
+    
+    user_id = request.form['userId']
+    meal_type = request.form.get('mealType')
+    dedupe = request.form.get('dedupe', 'true').lower() != 'false'
+    
+    max_concurrency = config['default'].RECOGNITION_BATCH_CONCURRENCY
+    try:
+        concurrency = max(1, min(int(request.form.get('concurrency', max_concurrency)), max_concurrency))
+    except ValueError:
+        return make_response(400, "并发数无效", error="INVALID_REQUEST")
+    
+    # 批量请求按用户剩余的并发名额降低并发数（至少 1 个），预算按图片数预扣
+    concurrency = min(concurrency, len(images))
+    try:
+        concurrency = user_recognition_limiter.acquire(user_id, count=concurrency, calls=len(images), partial=True)
+    except LimitExceeded as e:
+        return limit_exceeded_response(e, user_id)
+    
+    try:
+        started = time.perf_counter()
+        saved_images = [save_recognition_image(file) for file in images]
+        
+        # 每张图片的识别来源：('upstream', None) 或 ('duplicate', (来源识别记录ID, 食物结果, 汉明距离)) 或 ('batch', 批内图片下标)
+        sources = []
+        upstream_indexes = []
+        for index, (image_key, image_url, image_phash) in enumerate(saved_images):
+            duplicate = find_near_duplicate(user_id, image_phash) if dedupe and image_phash else None
+            if duplicate:
+                source, distance = duplicate
+                recognized_foods = RecognizedFood.query.filter_by(recognition_id=source.id).all()
+                sources.append(('duplicate', (source.id, recognition_result_from_foods(recognized_foods), distance)))
+                continue
+            
+            # 同一批次内的近似重复图片只识别一次
+            batch_source = None
+            if dedupe and image_phash and near_duplicate_index.threshold > 0:
+                for other in upstream_indexes:
+                    other_phash = saved_images[other][2]
+                    if other_phash and hamming_distance(image_phash, other_phash) <= near_duplicate_index.threshold:
+                        batch_source = other
+                        break
+            if batch_source is not None:
+                sources.append(('batch', batch_source))
+            else:
+                sources.append(('upstream', None))
+                upstream_indexes.append(index)
+        
+        # 不需要调用识别服务的图片退还预扣的预算
+        user_recognition_limiter.settle(user_id, 0, count=len(saved_images) - len(upstream_indexes))
+        
+        # 并发调用识别服务
+        upstream_results = map_concurrently(
+            current_app._get_current_object(),
+            lambda image_key: recognize_food(image_key, user_id),
+            [saved_images[index][0] for index in upstream_indexes],
+            concurrency
+        )
+        results_by_index = dict(zip(upstream_indexes, upstream_results))
+        
+        # 所有识别记录在同一个事务中写入
+        items = []
+        created = []
+        for index, (image_key, image_url, image_phash) in enumerate(saved_images):
+            kind, source = sources[index]
+            item = {
+                "index": index,
+                "filename": images[index].filename,
+                "imageUrl": image_url
+            }
+            
+            if kind == 'duplicate':
+                source_id, recognition_result, distance = source
+                item["nearDuplicateOf"] = {"recognitionId": source_id, "distance": distance}
+            else:
+                recognition_result = results_by_index[source if kind == 'batch' else index]
+                if kind == 'batch':
+                    item["nearDuplicateOf"] = {"index": source}
+            
+            if isinstance(recognition_result, Exception) or "error" in recognition_result:
+                error = recognition_result if isinstance(recognition_result, Exception) else recognition_result["error"]
+                item["status"] = FoodRecognition.STATUS_FAILED
+                item["error"] = str(error)
+                items.append(item)
+                continue
+            
+            recognition = FoodRecognition(
+                user_id=user_id,
+                image_url=image_url,
+                meal_type=meal_type,
+                image_phash=image_phash
+            )
+            db.session.add(recognition)
+            foods_data, total_nutrition = apply_recognition_result(recognition, recognition_result)
+            created.append(recognition)
+            
+            item["status"] = FoodRecognition.STATUS_DONE
+            item["recognitionId"] = recognition.id
+            item["foods"] = foods_data
+            item["totalNutrition"] = total_nutrition
+            items.append(item)
+        
+        db.session.commit()
+        
+        for recognition in created:
+            if recognition.image_phash:
+                near_duplicate_index.add(user_id, recognition.image_phash, recognition.id, recognition.created_at)
+        
+        # 识别失败的图片没有对应的识别记录，立即删除，不等定时清理
+        try:
+            discard_recognition_images(item["imageUrl"] for item in items if item["status"] == FoodRecognition.STATUS_FAILED)
+        except Exception as e:
+            print(f"Error in discarding failed batch images: {str(e)}")
+        
+        response_data = {
+            "items": items,
+            "succeeded": len(created),
+            "failed": len(items) - len(created),
+            "elapsedMs": round((time.perf_counter() - started) * 1000, 1)
+        }
+        
+        return make_response(200, "批量识别完成", data=response_data)
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in batch food recognition: {str(e)}")
+        return make_response(500, f"批量识别过程失败{str(e)}", error="RECOGNITION_FAILED")
+    finally:
+        user_recognition_limiter.release(user_id, count=concurrency)
+
+
+@food_recognition_bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """获取识别结果缓存的命中统计"""
+    return make_response(200, "获取成功", data=recognition_cache.stats())
+
+
+@food_recognition_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """获取识别链路的运行指标"""
+    backend = get_recognition_backend()
+    client = backend.client
+    response_data = {
+        "jobs": recognition_job_queue.stats(),
+        "cache": recognition_cache.stats(),
+        "imagePreprocess": preprocess_stats.snapshot(),
+        "backend": backend.name,
+        "recognitionCalls": recognition_call_stats.snapshot(),
+        "userLimiter": user_recognition_limiter.stats(),
+        "foodCatalog": food_catalog.stats(),
+        "httpPool": client.stats() if client else None,
+        "circuitBreaker": client.breaker.stats() if client and client.breaker else None
+    }
+    return make_response(200, "获取成功", data=response_data)
+
+
+@food_recognition_bp.route('/usage', methods=['GET'])
+def get_recognition_usage():
+    """获取用户当前的识别并发数和 token 预算用量"""
+    user_id = request.args.get('userId')
+    if not user_id:
+        return make_response(400, "缺少用户ID", error="INVALID_REQUEST")
+    return make_response(200, "获取成功", data=user_recognition_limiter.usage(user_id))
+
+
+@food_recognition_bp.route('/<recognition_id>/status', methods=['GET'])
+def get_recognition_status(recognition_id):
+    """查询异步识别任务状态，完成后返回识别结果"""
+    try:
+        recognition = FoodRecognition.query.get(recognition_id)
+        
+        if not recognition:
+            return make_response(404, "识别记录不存在", error="RECOGNITION_NOT_FOUND")
+        
+        response_data = {
+            "jobId": recognition.id,
+            "recognitionId": recognition.id,
+            "status": recognition.status,
+            "imageUrl": recognition.image_url
+        }
+        
+        if recognition.status == FoodRecognition.STATUS_FAILED:
+            response_data["error"] = recognition.error_message
+        elif recognition.status == FoodRecognition.STATUS_DONE:
+            recognized_foods = RecognizedFood.query.filter_by(recognition_id=recognition_id).all()
+            
+            foods_data = []
+            for food in recognized_foods:
+                foods_data.append({
+                    "id": food.food_id,
+                    "name": food.name,
+                    "amount": food.amount,
+                    "weight": food.weight,
+                    "unit": food.unit,
+                    "calories": food.calories,
+                    "protein": food.protein,
+                    "carbs": food.carbs,
+                    "fat": food.fat,
+                    "fiber": food.fiber,
+                    "confidence": food.confidence
+                })
+            
+            response_data["foods"] = foods_data
+            response_data["totalNutrition"] = recognition.total_nutrition()
+        
+        return make_response(200, "获取成功", data=response_data)
+        
+    except Exception as e:
+        print(f"Error in getting recognition status: {str(e)}")
+        return make_response(500, "获取识别状态失败", error="FETCH_FAILED")
 
 
 @food_recognition_bp.route('/adjust', methods=['PUT'])
@@ -237,53 +797,68 @@ def adjust_recognition():
     recognition_id = data['recognitionId']
     adjustments = data['adjustments']
     
-    # 检查识别记录是否存在
-    with db.session.no_autoflush:
-        recognition = FoodRecognition.query.get(recognition_id)
+    # 检查识别记录是否存在，识别到的食物随记录一次加载
+    recognition = FoodRecognition.query.options(selectinload(FoodRecognition.recognized_foods)) \
+                                       .filter_by(id=recognition_id).first()
     if not recognition:
         return make_response(404, "识别记录不存在", error="RECOGNITION_NOT_FOUND")
     
     try:
-        # 处理调整
-        for adjustment in adjustments:
-            action = adjustment.get('action')
-            
-            if action == 'update':
+        recognized_foods = list(recognition.recognized_foods)
+        
+        # 新增的食物及其营养信息一次查询加载
+        add_food_ids = {adjustment.get('foodId') for adjustment in adjustments
+                        if adjustment.get('action') == 'add' and adjustment.get('foodId')}
+        foods_by_id = {}
+        if add_food_ids:
+            foods = Food.query.options(selectinload(Food.nutrition)) \
+                              .filter(Food.id.in_(add_food_ids)).all()
+            foods_by_id = {food.id: food for food in foods}
+        
+        def find_recognized_food(food_id):
+            for recognized_food in recognized_foods:
+                if recognized_food.food_id == food_id:
+                    return recognized_food
+            return None
+        
+        # 在内存中按顺序应用全部调整
+        with db.session.no_autoflush:
+            for adjustment in adjustments:
+                action = adjustment.get('action')
                 food_id = adjustment.get('foodId')
-                with db.session.no_autoflush:
-                    recognized_food = RecognizedFood.query.filter_by(recognition_id=recognition_id, food_id=food_id).first()
                 
-                if recognized_food:
-                    # 更新属性
+                if action == 'update':
+                    recognized_food = find_recognized_food(food_id)
+                    if not recognized_food:
+                        continue
+                    
                     if 'amount' in adjustment:
                         recognized_food.amount = adjustment['amount']
                     if 'weight' in adjustment:
-                        recognized_food.weight = adjustment['weight']
+                        new_weight = adjustment['weight']
+                        old_weight = recognized_food.weight
                         
-                        # 根据重量调整营养成分
-                        if recognized_food.weight > 0:
-                            weight_ratio = adjustment['weight'] / recognized_food.weight
-                            recognized_food.calories *= weight_ratio
-                            recognized_food.protein *= weight_ratio
-                            recognized_food.carbs *= weight_ratio
-                            recognized_food.fat *= weight_ratio
-                            recognized_food.fiber *= weight_ratio
-            
-            elif action == 'remove':
-                food_id = adjustment.get('foodId')
-                with db.session.no_autoflush:
-                    recognized_food = RecognizedFood.query.filter_by(recognition_id=recognition_id, food_id=food_id).first()
+                        # 先按新旧重量之比调整营养成分，再写入新重量
+                        if old_weight and old_weight > 0:
+                            weight_ratio = new_weight / old_weight
+                            recognized_food.calories = (recognized_food.calories or 0) * weight_ratio
+                            recognized_food.protein = (recognized_food.protein or 0) * weight_ratio
+                            recognized_food.carbs = (recognized_food.carbs or 0) * weight_ratio
+                            recognized_food.fat = (recognized_food.fat or 0) * weight_ratio
+                            recognized_food.fiber = (recognized_food.fiber or 0) * weight_ratio
+                        recognized_food.weight = new_weight
                 
-                if recognized_food:
-                    with db.session.no_autoflush:
-                        db.session.delete(recognized_food)
-            
-            elif action == 'add':
-                food_id = adjustment.get('foodId')
-                with db.session.no_autoflush:
-                    food = Food.query.get(food_id)
+                elif action == 'remove':
+                    recognized_food = find_recognized_food(food_id)
+                    if recognized_food:
+                        recognized_foods.remove(recognized_food)
+                        recognition.recognized_foods.remove(recognized_food)
                 
-                if food:
+                elif action == 'add':
+                    food = foods_by_id.get(food_id)
+                    if not food:
+                        continue
+                    
                     # 获取食物的营养信息
                     nutrition = food.nutrition
                     
@@ -302,27 +877,17 @@ def adjust_recognition():
                         protein=nutrition.protein * weight_ratio if nutrition else 0,
                         carbs=nutrition.carbs * weight_ratio if nutrition else 0,
                         fat=nutrition.fat * weight_ratio if nutrition else 0,
-                        fiber=nutrition.fiber * weight_ratio if nutrition else 0,
+                        fiber=(nutrition.fiber or 0) * weight_ratio if nutrition else 0,
                         confidence=1.0  # 手动添加的食物置信度为1
                     )
-                    with db.session.no_autoflush:
-                        db.session.add(new_food)
-        with db.session.no_autoflush:
-            db.session.commit()
+                    recognized_foods.append(new_food)
+                    recognition.recognized_foods.append(new_food)
         
-        # 重新计算总营养成分
-        with db.session.no_autoflush:
-            recognized_foods = RecognizedFood.query.filter_by(recognition_id=recognition_id).all()
-        
-        total_nutrition = {
-            "calories": sum(food.calories or 0 for food in recognized_foods),
-            "protein": sum(food.protein or 0 for food in recognized_foods),
-            "carbs": sum(food.carbs or 0 for food in recognized_foods),
-            "fat": sum(food.fat or 0 for food in recognized_foods),
-            "fiber": sum(food.fiber or 0 for food in recognized_foods)
-        }
+        # 重新计算总营养成分，与调整在同一事务中一次写入
+        recognition.update_totals(recognized_foods)
+        total_nutrition = recognition.total_nutrition()
         
-        # 构建响应数据
+        # 构建响应数据（在提交前读取，避免提交后逐条重新加载）
         foods_data = []
         for food in recognized_foods:
             foods_data.append({
@@ -338,6 +903,8 @@ def adjust_recognition():
                 "fiber": food.fiber
             })
         
+        db.session.commit()
+        
         response_data = {
             "recognitionId": recognition_id,
             "foods": foods_data,
@@ -352,6 +919,27 @@ def adjust_recognition():
         print(f"Error in adjusting recognition: {str(e)}")
         return make_response(500, "调整过程失败", error="ADJUSTMENT_FAILED")
 
+# 辅助函数：查找或创建记录，并发创建时依赖唯一约束回退为查询
+def get_or_create(model, filters, **values):
+    instance = model.query.filter_by(**filters).first()
+    if instance:
+        return instance
+    
+    try:
+        with db.session.begin_nested():
+            instance = model(**filters, **values)
+            db.session.add(instance)
+        return instance
+    except IntegrityError:
+        return model.query.filter_by(**filters).first()
+
+# 辅助函数：识别记录已保存到日记时返回上次保存的结果
+def saved_diary_response(recognition):
+    response_data = json.loads(recognition.diary_entry) if recognition.diary_entry else {}
+    response_data["alreadySaved"] = True
+    response_data["recognitionId"] = recognition.id
+    return make_response(200, "识别结果已添加到饮食日记", data=response_data)
+
 @food_recognition_bp.route('/save-to-diary', methods=['POST'])
 def save_to_diary():
     """添加识别结果到用户日记"""
@@ -367,6 +955,8 @@ def save_to_diary():
     date_str = data['date']
     meal_type = data['mealType']
     note = data.get('note', '')
+    # 未匹配到食物库的食物默认不允许保存，显式传 skipUnmatched=true 时跳过这些食物
+    skip_unmatched = bool(data.get('skipUnmatched', False))
     
     # 检查用户是否存在
     user = User.query.get(user_id)
@@ -378,16 +968,48 @@ def save_to_diary():
     if not recognition:
         return make_response(404, "识别记录不存在", error="RECOGNITION_NOT_FOUND")
     
+    # 已保存过的识别记录直接返回上次的结果，客户端重试不会重复写入
+    if recognition.saved_to_diary:
+        return saved_diary_response(recognition)
+    
     try:
         # 解析日期
         date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
         
+        recognized_foods = RecognizedFood.query.filter_by(recognition_id=recognition_id).all()
+        
+        # 识别时未匹配到的食物再匹配一次（食物库可能已新增），只自动采用高分匹配
+        unmatched_names = [food.name for food in recognized_foods if not food.food_id]
+        matches = food_name_index.match_many(unmatched_names) if unmatched_names else {}
+        unmatched_foods = [name for name in unmatched_names if not food_name_index.confirmed(matches.get(name))]
+        
+        # 仍有未匹配的食物时不保存，识别记录保持未保存状态，低分匹配作为建议返回；
+        # 用户通过 /adjust 替换（可选用建议的食物）或删除这些食物后可以重新保存
+        if unmatched_foods and not skip_unmatched:
+            suggestions = {}
+            for name in unmatched_foods:
+                suggestion = food_name_index.suggestion(matches.get(name))
+                if suggestion:
+                    suggestions[name] = suggestion
+            response = make_response(409, "部分食物未匹配到食物库，请先调整识别结果", error="UNMATCHED_FOODS", data={
+                "recognitionId": recognition_id,
+                "unmatchedFoods": unmatched_foods,
+                "suggestions": suggestions
+            })
+            response.status_code = 409
+            return response
+        
+        # 用条件更新抢占保存权，并发的重复请求只有一个能写入
+        claimed = FoodRecognition.query.filter(
+            FoodRecognition.id == recognition_id,
+            db.or_(FoodRecognition.saved_to_diary.is_(False), FoodRecognition.saved_to_diary.is_(None))
+        ).update({FoodRecognition.saved_to_diary: True}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            return saved_diary_response(FoodRecognition.query.get(recognition_id))
+        
         # 查找或创建当日摄入记录
-        daily_intake = DailyIntake.query.filter_by(user_id=user_id, date=date_obj).first()
-        if not daily_intake:
-            daily_intake = DailyIntake(user_id=user_id, date=date_obj)
-            db.session.add(daily_intake)
-            db.session.flush()  # 获取ID但不提交
+        daily_intake = get_or_create(DailyIntake, {"user_id": user_id, "date": date_obj})
         
         # 查找或创建餐次
         meal_names = {
@@ -397,45 +1019,46 @@ def save_to_diary():
             'snack': '零食'
         }
         
+        # 根据餐次类型设置默认时间
+        default_times = {
+            'breakfast': '08:00',
+            'lunch': '12:00',
+            'dinner': '18:00',
+            'snack': '15:00'
+        }
+        
         meal_name = meal_names.get(meal_type, meal_type)
-        meal = Meal.query.filter_by(daily_intake_id=daily_intake.id, name=meal_name).first()
-        
-        if not meal:
-            # 根据餐次类型设置默认时间
-            default_times = {
-                'breakfast': '08:00',
-                'lunch': '12:00',
-                'dinner': '18:00',
-                'snack': '15:00'
-            }
-            
-            meal = Meal(
-                daily_intake_id=daily_intake.id,
-                name=meal_name,
-                time=default_times.get(meal_type, '12:00')
-            )
-            db.session.add(meal)
-            db.session.flush()  # 获取ID但不提交
+        meal = get_or_create(
+            Meal,
+            {"daily_intake_id": daily_intake.id, "name": meal_name},
+            time=default_times.get(meal_type, '12:00')
+        )
         
         # 将识别到的食物添加到餐次中
-        recognized_foods = RecognizedFood.query.filter_by(recognition_id=recognition_id).all()
-        
+        entry_rows = []
         food_entries = []
         total_calories = 0
         
         for recognized_food in recognized_foods:
-            food_entry = FoodEntry(
-                meal_id=meal.id,
-                food_id=recognized_food.food_id or 'unknown',  # 如果没有匹配到食物ID，使用占位符
-                amount=recognized_food.amount,
-                weight=recognized_food.weight,
-                calories=recognized_food.calories,
-                protein=recognized_food.protein,
-                carbs=recognized_food.carbs,
-                fat=recognized_food.fat,
-                fiber=recognized_food.fiber
-            )
-            db.session.add(food_entry)
+            if not recognized_food.food_id:
+                food_id = food_name_index.confirmed(matches.get(recognized_food.name))
+                if not food_id:
+                    # 调用方要求跳过的未匹配食物，在响应的 unmatchedFoods 中列出
+                    continue
+                recognized_food.food_id = food_id
+            
+            entry_rows.append({
+                "id": f"food_entry_{str(uuid.uuid4())[:8]}",
+                "meal_id": meal.id,
+                "food_id": recognized_food.food_id,
+                "amount": recognized_food.amount,
+                "weight": recognized_food.weight,
+                "calories": recognized_food.calories,
+                "protein": recognized_food.protein,
+                "carbs": recognized_food.carbs,
+                "fat": recognized_food.fat,
+                "fiber": recognized_food.fiber
+            })
             
             food_entries.append({
                 "id": recognized_food.food_id,
@@ -446,10 +1069,9 @@ def save_to_diary():
             
             total_calories += recognized_food.calories or 0
         
-        # 标记识别记录已保存到日记
-        recognition.saved_to_diary = True
-        
-        db.session.commit()
+        # 所有日记条目用一条批量插入语句写入
+        if entry_rows:
+            db.session.execute(db.insert(FoodEntry), entry_rows)
         
         # 构建响应
         response_data = {
@@ -457,9 +1079,16 @@ def save_to_diary():
             "date": date_str,
             "mealType": meal_type,
             "foods": food_entries,
+            "unmatchedFoods": unmatched_foods,
             "totalCalories": total_calories
         }
         
+        # 记录保存结果，重复请求时直接返回
+        recognition.saved_to_diary = True
+        recognition.diary_entry = json.dumps(response_data, ensure_ascii=False)
+        
+        db.session.commit()
+        
         return make_response(200, "已添加到饮食日记", data=response_data)
         
     except ValueError:
@@ -486,14 +1115,6 @@ def get_recognition_detail(recognition_id):
         
         # 构建食物数据
         foods_data = []
-        total_nutrition = {
-            "calories": 0,
-            "protein": 0,
-            "carbs": 0,
-            "fat": 0,
-            "fiber": 0
-        }
-        
         for food in recognized_foods:
             food_data = {
                 "id": food.food_id,
@@ -509,13 +1130,6 @@ def get_recognition_detail(recognition_id):
                 "confidence": food.confidence
             }
             foods_data.append(food_data)
-            
-            # 累加营养成分
-            total_nutrition["calories"] += food.calories or 0
-            total_nutrition["protein"] += food.protein or 0
-            total_nutrition["carbs"] += food.carbs or 0
-            total_nutrition["fat"] += food.fat or 0
-            total_nutrition["fiber"] += food.fiber or 0
         
         # 构建响应数据
         response_data = {
@@ -524,8 +1138,9 @@ def get_recognition_detail(recognition_id):
             "imageUrl": recognition.image_url,  # 返回文件名而不是完整路径
             "mealType": recognition.meal_type,
             "foods": foods_data,
-            "totalNutrition": total_nutrition,
-            "savedToDiary": recognition.saved_to_diary
+            "totalNutrition": recognition.total_nutrition(),
+            "savedToDiary": recognition.saved_to_diary,
+            "status": recognition.status
         }
         return make_response(200, "获取成功", data=response_data)
         
@@ -535,60 +1150,121 @@ def get_recognition_detail(recognition_id):
 
 
 
+# 辅助函数：历史记录分页游标（对客户端不透明）
+def encode_history_cursor(recognition):
+    payload = json.dumps({"t": recognition.created_at.isoformat(), "id": recognition.id})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_history_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(payload["t"]), str(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
 @food_recognition_bp.route('/history', methods=['GET'])
 def get_history():
     """获取用户识别历史"""
     user_id = request.args.get('userId')
     limit = int(request.args.get('limit', 10))
     offset = int(request.args.get('offset', 0))
+    # 游标分页：传入上一页返回的 nextCursor，按 (created_at, id) 定位，不受新增记录影响
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('includeTotal', 'false').lower() == 'true'
+    sort = request.args.get('sort', 'date_desc')
+    min_calories = request.args.get('minCalories', type=float)
+    max_calories = request.args.get('maxCalories', type=float)
     
     if not user_id:
         return make_response(400, "缺少用户ID", error="INVALID_REQUEST")
     
+    # 验证排序方式
+    sort_options = {
+        'date_desc': FoodRecognition.created_at.desc(),
+        'calories_desc': FoodRecognition.total_calories.desc(),
+        'calories_asc': FoodRecognition.total_calories.asc()
+    }
+    if sort not in sort_options:
+        return make_response(400, "无效的排序方式", error="INVALID_SORT")
+    
+    # 游标分页只支持按时间排序
+    keyset_mode = sort == 'date_desc' and not offset
+    if cursor and not keyset_mode:
+        return make_response(400, "游标分页只支持按时间排序且不能与offset同时使用", error="INVALID_CURSOR")
+    
+    cursor_position = None
+    if cursor:
+        cursor_position = decode_history_cursor(cursor)
+        if not cursor_position:
+            return make_response(400, "无效的分页游标", error="INVALID_CURSOR")
+    
     # 检查用户是否存在
     user = User.query.get(user_id)
     if not user:
         return make_response(404, "用户不存在", error="USER_NOT_FOUND")
     
     try:
-        # 查询用户的识别历史
-        recognitions = FoodRecognition.query.filter_by(user_id=user_id) \
-                                         .order_by(FoodRecognition.created_at.desc()) \
-                                         .offset(offset).limit(limit).all()
+        # 按热量筛选和排序直接使用识别记录上的营养总量，不需要关联食物表
+        filters = [FoodRecognition.user_id == user_id]
+        if min_calories is not None:
+            filters.append(FoodRecognition.total_calories >= min_calories)
+        if max_calories is not None:
+            filters.append(FoodRecognition.total_calories <= max_calories)
+        
+        # 计数只在首页或显式要求时执行，翻页本身不扫描前面的记录
+        total_count = None
+        if not cursor or include_total:
+            total_count = db.session.query(db.func.count(FoodRecognition.id)) \
+                                    .filter(*filters).scalar()
         
-        total_count = FoodRecognition.query.filter_by(user_id=user_id).count()
+        if cursor_position:
+            # 使用 (user_id, created_at, id) 复合索引定位到上一页最后一条之后
+            cursor_created_at, cursor_id = cursor_position
+            filters.append(db.or_(
+                FoodRecognition.created_at < cursor_created_at,
+                db.and_(FoodRecognition.created_at == cursor_created_at, FoodRecognition.id < cursor_id)
+            ))
+        
+        # 查询用户的识别历史，识别到的食物用一条 IN 查询批量加载
+        recognition_query = FoodRecognition.query.filter(*filters) \
+                                                 .options(selectinload(FoodRecognition.recognized_foods)) \
+                                                 .order_by(sort_options[sort], FoodRecognition.created_at.desc(), FoodRecognition.id.desc())
+        if not keyset_mode:
+            recognition_query = recognition_query.offset(offset)
+        recognitions = recognition_query.limit(limit).all()
         
         history_items = []
         
         for recognition in recognitions:
-            # 获取识别到的食物
-            recognized_foods = RecognizedFood.query.filter_by(recognition_id=recognition.id).all()
-            
             foods_data = []
-            total_calories = 0
-            
-            for food in recognized_foods:
+            for food in recognition.recognized_foods:
                 foods_data.append({
                     "id": food.food_id,
                     "name": food.name,
                     "amount": food.amount
                 })
-                
-                total_calories += food.calories or 0
             
             history_items.append({
                 "recognitionId": recognition.id,
                 "date": recognition.created_at.isoformat(),
                 "imageUrl": recognition.image_url,
                 "foods": foods_data,
-                "totalCalories": total_calories,
+                "totalCalories": recognition.total_calories or 0,
+                "totalNutrition": recognition.total_nutrition(),
                 "savedToDiary": recognition.saved_to_diary,
-                "mealType": recognition.meal_type
+                "mealType": recognition.meal_type,
+                "status": recognition.status
             })
         
+        next_cursor = None
+        if keyset_mode and len(recognitions) == limit:
+            next_cursor = encode_history_cursor(recognitions[-1])
+        
         response_data = {
             "total": total_count,
-            "items": history_items
+            "items": history_items,
+            "nextCursor": next_cursor
         }
         
         return make_response(200, "获取成功", data=response_data)
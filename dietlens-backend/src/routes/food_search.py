@@ -1,7 +1,12 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
+import heapq
 
-from src.models import db, Food, FoodNutrition, FoodServingSize, FoodCategory, FavoriteFood, RecentViewedFood, User, FoodTag, FoodTagAssociation
+from src.config.config import config
+from src.models import db, Food, FoodNutrition, FoodServingSize, FoodCategory, FavoriteFood, RecentViewedFood, User
+from src.utils.food_matcher import food_name_index
+from src.utils.food_catalog import food_catalog, FoodRecord, bump_catalog_version
+from src.utils.storage import get_content_store
 
 food_search_bp = Blueprint('food_search', __name__)
 
@@ -17,6 +22,41 @@ def make_response(status, message, data=None, error=None):
         response["error"] = error
     return jsonify(response)
 
+# 辅助函数：一次查询得到用户收藏了其中哪些食物
+def favorite_food_ids(user_id, food_ids):
+    if not user_id or not food_ids:
+        return set()
+    rows = db.session.query(FavoriteFood.food_id).filter(
+        FavoriteFood.user_id == user_id,
+        FavoriteFood.food_id.in_(food_ids)
+    ).all()
+    return {food_id for food_id, in rows}
+
+# 辅助函数：批量记录最近查看，已有记录只更新时间，最后统一提交一次
+def record_recent_views(user_id, food_ids):
+    if not user_id or not food_ids:
+        return
+    now = datetime.utcnow()
+    existing = RecentViewedFood.query.filter(
+        RecentViewedFood.user_id == user_id,
+        RecentViewedFood.food_id.in_(food_ids)
+    ).all()
+    viewed = {view.food_id: view for view in existing}
+    for food_id in food_ids:
+        if food_id in viewed:
+            viewed[food_id].viewed_at = now
+        else:
+            db.session.add(RecentViewedFood(user_id=user_id, food_id=food_id))
+    db.session.commit()
+
+# 辅助函数：把索引命中的食物ID转换为缓存中的食物，只保留有营养信息且符合分类筛选的
+def filter_search_records(snapshot, food_ids, category):
+    return [
+        record for record in (snapshot.foods.get(food_id) for food_id in food_ids)
+        if record is not None and record.has_nutrition
+        and (not category or record.category == category)
+    ]
+
 @food_search_bp.route('/search', methods=['GET'])
 def search_foods():
     """搜索食物"""
@@ -33,78 +73,69 @@ def search_foods():
         return make_response(400, "无效的排序方式", error="INVALID_SORT")
     
     try:
-        # 构建查询
-        food_query = db.session.query(Food).join(FoodNutrition, Food.id == FoodNutrition.food_id)
+        snapshot = food_catalog.snapshot()
+        start, end = (page - 1) * limit, page * limit
+        fuzzy = False
         
-        # 应用搜索条件
         if query:
-            search_term = f"%{query}%"
-            food_query = food_query.filter(Food.name.like(search_term))
-        
-        # 应用分类筛选
-        if category:
-            food_query = food_query.filter(Food.category == category)
-        
-        # 应用排序
-        if sort == 'calories_asc':
-            food_query = food_query.order_by(FoodNutrition.calories.asc())
-        elif sort == 'calories_desc':
-            food_query = food_query.order_by(FoodNutrition.calories.desc())
-        elif sort == 'name_asc':
-            food_query = food_query.order_by(Food.name.asc())
-        elif sort == 'name_desc':
-            food_query = food_query.order_by(Food.name.desc())
-        else:  # relevance
-            if query:
-                # 相关性排序（简化版）
-                food_query = food_query.order_by(Food.popularity.desc())
+            # 关键词经倒排索引召回，相关性按 BM25 分数（同分时按人气）
+            scores = snapshot.search_index.search(query)
+            matched = filter_search_records(snapshot, scores, category)
+            
+            # 精确命中太少时追加容错结果，分数按编辑距离打折；容错结果排在全部精确结果之后
+            extra = {}
+            if len(matched) < config['default'].SEARCH_FUZZY_MIN_RESULTS:
+                fuzzy_scores = snapshot.search_index.fuzzy_search(query)
+                extra = {food_id: score for food_id, score in fuzzy_scores.items() if food_id not in scores}
+                if extra:
+                    fuzzy = True
+                    scores.update(extra)
+                    matched.extend(filter_search_records(snapshot, extra, category))
+            total = len(matched)
+            if sort == 'relevance':
+                # 只需排出当前页及之前的部分
+                foods = heapq.nsmallest(
+                    end, matched, key=lambda r: (r.id in extra, -scores[r.id], -r.popularity, r.name, r.id)
+                )[start:end]
             else:
-                food_query = food_query.order_by(Food.name.asc())
-        
-        # 计算总数和分页
-        total = food_query.count()
+                order = sort.rsplit('_', 1)[0] + '_asc'
+                matched.sort(key=snapshot.ORDER_KEYS[order], reverse=sort.endswith('_desc'))
+                foods = matched[start:end]
+        else:
+            # 没有关键词时在预先排好序的食物库缓存中筛选（只包含有营养信息的食物）
+            order = 'name_asc' if sort == 'relevance' else sort
+            matched = [
+                record for record in snapshot.ordered(order)
+                if record.has_nutrition and (not category or record.category == category)
+            ]
+            total = len(matched)
+            foods = matched[start:end]
+        
+        # 计算总页数
         total_pages = (total + limit - 1) // limit
         
-        foods = food_query.offset((page - 1) * limit).limit(limit).all()
+        food_ids = [record.id for record in foods]
+        
+        # 收藏状态一次查出，并记录最近查看
+        favorite_ids = favorite_food_ids(user_id, food_ids)
+        record_recent_views(user_id, food_ids)
         
         # 构建响应数据
         foods_data = []
-        for food in foods:
-            nutrition = food.nutrition
-            
-            # 获取默认份量
-            default_serving = next((s for s in food.serving_sizes if s.is_default), None)
-            serving_size = default_serving.name if default_serving else "100克"
-            
-            # 检查是否是收藏食物
-            is_favorite = False
-            if user_id:
-                favorite = FavoriteFood.query.filter_by(user_id=user_id, food_id=food.id).first()
-                is_favorite = favorite is not None
-            
-            # 记录最近查看
-            if user_id:
-                recent_view = RecentViewedFood.query.filter_by(user_id=user_id, food_id=food.id).first()
-                if recent_view:
-                    recent_view.viewed_at = datetime.utcnow()
-                else:
-                    new_view = RecentViewedFood(user_id=user_id, food_id=food.id)
-                    db.session.add(new_view)
-                db.session.commit()
-            
+        for record in foods:
             food_data = {
-                "id": food.id,
-                "name": food.name,
-                "category": food.category,
-                "categoryName": food.category_name,
-                "calories": nutrition.calories if nutrition else 0,
-                "protein": nutrition.protein if nutrition else 0,
-                "carbs": nutrition.carbs if nutrition else 0,
-                "fat": nutrition.fat if nutrition else 0,
-                "fiber": nutrition.fiber if nutrition else 0,
-                "servingSize": serving_size,
-                "imageUrl": food.image_url,
-                "isFavorite": is_favorite
+                "id": record.id,
+                "name": record.name,
+                "category": record.category,
+                "categoryName": record.category_name,
+                "calories": record.calories,
+                "protein": record.protein,
+                "carbs": record.carbs,
+                "fat": record.fat,
+                "fiber": record.fiber,
+                "servingSize": record.serving_size,
+                "imageUrl": record.image_url,
+                "isFavorite": record.id in favorite_ids
             }
             
             foods_data.append(food_data)
@@ -113,75 +144,70 @@ def search_foods():
             "total": total,
             "totalPages": total_pages,
             "currentPage": page,
+            "fuzzy": fuzzy,
             "foods": foods_data
         }
         
         return make_response(200, "搜索成功", data=response_data)
         
     except Exception as e:
+        db.session.rollback()
         print(f"Error in searching foods: {str(e)}")
         return make_response(500, "搜索失败", error="SEARCH_FAILED")
 
+@food_search_bp.route('/suggest', methods=['GET'])
+def suggest_foods():
+    """搜索框输入联想：按名称、别名、全拼或拼音首字母前缀匹配，返回人气最高的食物"""
+    query = request.args.get('query', '')
+    limit = int(request.args.get('limit', 10))
+    
+    try:
+        snapshot = food_catalog.snapshot()
+        
+        suggestions = []
+        for food_id, matched_by in snapshot.suggest_index.suggest(query, limit):
+            record = snapshot.foods.get(food_id)
+            if record is None:
+                continue
+            suggestions.append({
+                "id": record.id,
+                "name": record.name,
+                "categoryName": record.category_name,
+                "calories": record.calories,
+                "servingSize": record.serving_size,
+                "imageUrl": record.image_url,
+                "matchedBy": matched_by
+            })
+        
+        response_data = {
+            "query": query,
+            "suggestions": suggestions
+        }
+        
+        return make_response(200, "获取成功", data=response_data)
+        
+    except Exception as e:
+        print(f"Error in suggesting foods: {str(e)}")
+        return make_response(500, "获取联想结果失败", error="SUGGEST_FAILED")
+
 @food_search_bp.route('/foods/<food_id>', methods=['GET'])
 def get_food_detail(food_id):
     """获取食物详情"""
     user_id = request.args.get('userId')  # 实际应从认证信息中获取
     
-    food = Food.query.get(food_id)
+    food = food_catalog.get(food_id)
     
     if not food:
         return make_response(404, "食物不存在", error="FOOD_NOT_FOUND")
     
     try:
-        nutrition = food.nutrition
-        serving_sizes = food.serving_sizes
-        
-        # 获取食物标签
-        food_tags = db.session.query(FoodTag).join(FoodTagAssociation).filter(
-            FoodTagAssociation.food_id == food.id
-        ).all()
-        
         # 检查是否是收藏食物
         is_favorite = False
         if user_id:
-            favorite = FavoriteFood.query.filter_by(user_id=user_id, food_id=food.id).first()
-            is_favorite = favorite is not None
+            is_favorite = food.id in favorite_food_ids(user_id, [food.id])
             
             # 记录最近查看
-            recent_view = RecentViewedFood.query.filter_by(user_id=user_id, food_id=food.id).first()
-            if recent_view:
-                recent_view.viewed_at = datetime.utcnow()
-            else:
-                new_view = RecentViewedFood(user_id=user_id, food_id=food.id)
-                db.session.add(new_view)
-            db.session.commit()
-        
-        # 构建响应数据
-        serving_sizes_data = []
-        for serving in serving_sizes:
-            serving_data = {
-                "name": serving.name,
-                "weight": serving.weight,
-                "isDefault": serving.is_default
-            }
-            serving_sizes_data.append(serving_data)
-        
-        nutrition_data = {}
-        if nutrition:
-            nutrition_data = {
-                "calories": nutrition.calories,
-                "protein": nutrition.protein,
-                "carbs": nutrition.carbs,
-                "fat": nutrition.fat,
-                "fiber": nutrition.fiber,
-                "sugar": nutrition.sugar,
-                "sodium": nutrition.sodium,
-                "potassium": nutrition.potassium,
-                "vitaminA": nutrition.vitamin_a,
-                "vitaminC": nutrition.vitamin_c,
-                "calcium": nutrition.calcium,
-                "iron": nutrition.iron
-            }
+            record_recent_views(user_id, [food.id])
         
         food_data = {
             "id": food.id,
@@ -189,10 +215,10 @@ def get_food_detail(food_id):
             "category": food.category,
             "categoryName": food.category_name,
             "description": food.description,
-            "nutrition": nutrition_data,
-            "servingSizes": serving_sizes_data,
+            "nutrition": dict(food.nutrition),
+            "servingSizes": [dict(serving) for serving in food.serving_sizes],
             "imageUrl": food.image_url,
-            "tags": [tag.name for tag in food_tags],
+            "tags": list(food.tags),
             "popularity": food.popularity,
             "isFavorite": is_favorite
         }
@@ -200,31 +226,21 @@ def get_food_detail(food_id):
         return make_response(200, "获取成功", data=food_data)
         
     except Exception as e:
+        db.session.rollback()
         print(f"Error in getting food detail: {str(e)}")
         return make_response(500, "获取食物详情失败", error="FETCH_FAILED")
 
 @food_search_bp.route('/categories', methods=['GET'])
 def get_categories():
     """获取食物分类列表"""
-    # include_count = request.args.get('includeCount', 'false').lower() == 'true'
-    
     try:
-        categories = FoodCategory.query.all()
+        snapshot = food_catalog.snapshot()
         
         categories_data = []
-        for category in categories:
-            category_data = {
-                "id": category.id,
-                "name": category.name,
-                "description": category.description,
-                "imageUrl": category.image_url
-            }
-            
-            # if include_count:
-                # 计算该分类下的食物数量
-            count = Food.query.filter_by(category=category.id).count()
-            category_data["count"] = count
-            
+        for category in snapshot.categories.values():
+            category_data = dict(category)
+            # 该分类下的食物数量
+            category_data["count"] = snapshot.category_counts.get(category["id"], 0)
             categories_data.append(category_data)
         
         response_data = {
@@ -250,61 +266,47 @@ def get_category_foods(category_id):
     if sort not in valid_sort_options:
         return make_response(400, "无效的排序方式", error="INVALID_SORT")
     
-    # 检查分类是否存在
-    category = FoodCategory.query.get(category_id)
-    if not category:
-        return make_response(404, "分类不存在", error="CATEGORY_NOT_FOUND")
-    
     try:
-        # 构建查询
-        food_query = db.session.query(Food).join(FoodNutrition, Food.id == FoodNutrition.food_id).filter(Food.category == category_id)
-        
-        # 应用排序
-        if sort == 'name_asc':
-            food_query = food_query.order_by(Food.name.asc())
-        elif sort == 'name_desc':
-            food_query = food_query.order_by(Food.name.desc())
-        elif sort == 'calories_asc':
-            food_query = food_query.order_by(FoodNutrition.calories.asc())
-        elif sort == 'calories_desc':
-            food_query = food_query.order_by(FoodNutrition.calories.desc())
-        elif sort == 'popularity':
-            food_query = food_query.order_by(Food.popularity.desc())
+        snapshot = food_catalog.snapshot()
+        
+        # 检查分类是否存在
+        category = snapshot.categories.get(category_id)
+        if not category:
+            return make_response(404, "分类不存在", error="CATEGORY_NOT_FOUND")
+        
+        matched = [
+            record for record in snapshot.ordered(sort)
+            if record.category == category_id and record.has_nutrition
+        ]
         
         # 计算总数和分页
-        total = food_query.count()
+        total = len(matched)
         total_pages = (total + limit - 1) // limit
         
-        foods = food_query.offset((page - 1) * limit).limit(limit).all()
+        foods = matched[(page - 1) * limit:page * limit]
         
         # 构建响应数据
         foods_data = []
-        for food in foods:
-            nutrition = food.nutrition
-            
-            # 获取默认份量
-            default_serving = next((s for s in food.serving_sizes if s.is_default), None)
-            serving_size = default_serving.name if default_serving else "100克"
-            
+        for record in foods:
             food_data = {
-                "id": food.id,
-                "name": food.name,
-                "calories": nutrition.calories if nutrition else 0,
-                "protein": nutrition.protein if nutrition else 0,
-                "carbs": nutrition.carbs if nutrition else 0,
-                "fat": nutrition.fat if nutrition else 0,
-                "fiber": nutrition.fiber if nutrition else 0,
-                "servingSize": serving_size,
-                "imageUrl": food.image_url
+                "id": record.id,
+                "name": record.name,
+                "calories": record.calories,
+                "protein": record.protein,
+                "carbs": record.carbs,
+                "fat": record.fat,
+                "fiber": record.fiber,
+                "servingSize": record.serving_size,
+                "imageUrl": record.image_url
             }
             
             foods_data.append(food_data)
         
         response_data = {
             "category": {
-                "id": category.id,
-                "name": category.name,
-                "description": category.description
+                "id": category["id"],
+                "name": category["name"],
+                "description": category["description"]
             },
             "total": total,
             "totalPages": total_pages,
@@ -325,36 +327,25 @@ def get_popular_foods():
     user_id = request.args.get('userId')  # 实际应从认证信息中获取
     
     try:
-        # 查询热门食物
-        foods = Food.query.order_by(Food.popularity.desc()).limit(limit).all()
+        # 热门食物
+        foods = food_catalog.snapshot().ordered('popularity')[:limit]
+        favorite_ids = favorite_food_ids(user_id, [record.id for record in foods])
         
         # 构建响应数据
         foods_data = []
-        for food in foods:
-            nutrition = food.nutrition
-            
-            # 获取默认份量
-            default_serving = next((s for s in food.serving_sizes if s.is_default), None)
-            serving_size = default_serving.name if default_serving else "100克"
-            
-            # 检查是否是收藏食物
-            is_favorite = False
-            if user_id:
-                favorite = FavoriteFood.query.filter_by(user_id=user_id, food_id=food.id).first()
-                is_favorite = favorite is not None
-            
+        for record in foods:
             food_data = {
-                "id": food.id,
-                "name": food.name,
-                "category": food.category,
-                "categoryName": food.category_name,
-                "calories": nutrition.calories if nutrition else 0,
-                "protein": nutrition.protein if nutrition else 0,
-                "carbs": nutrition.carbs if nutrition else 0,
-                "fat": nutrition.fat if nutrition else 0,
-                "servingSize": serving_size,
-                "imageUrl": food.image_url,
-                "isFavorite": is_favorite
+                "id": record.id,
+                "name": record.name,
+                "category": record.category,
+                "categoryName": record.category_name,
+                "calories": record.calories,
+                "protein": record.protein,
+                "carbs": record.carbs,
+                "fat": record.fat,
+                "servingSize": record.serving_size,
+                "imageUrl": record.image_url,
+                "isFavorite": record.id in favorite_ids
             }
             
             foods_data.append(food_data)
@@ -546,10 +537,7 @@ def get_recent_foods():
 @food_search_bp.route('/custom', methods=['POST'])
 def add_custom_food():
     """添加自定义食物"""
-    import os
     import uuid
-    from werkzeug.utils import secure_filename
-    from src.config.config import config
     
     # 检查请求参数
     if 'name' not in request.form:
@@ -614,18 +602,12 @@ def add_custom_food():
                 
                 image_file.seek(0)  # 重置文件指针
                 
-                # 保存图片（实际项目中应上传到云存储）
-                filename = secure_filename(image_file.filename)
-                new_filename = f"{food_id}_{filename}"
-                
-                # 确保上传目录存在
-                upload_folder = os.path.join(config['default'].UPLOAD_FOLDER, 'custom')
-                os.makedirs(upload_folder, exist_ok=True)
-                
-                file_path = os.path.join(upload_folder, new_filename)
-                image_file.save(file_path)
-                
-                image_url = f"/uploads/custom/{new_filename}"  # 相对URL路径
+                # 按内容哈希保存图片，相同图片只存一份
+                try:
+                    stored = get_content_store().save_upload('custom', image_file)
+                except ValueError:
+                    return make_response(400, "图片格式不支持", error="UNSUPPORTED_FORMAT")
+                image_url = stored.url  # 相对URL路径
         
         # 创建食物记录
         food = Food(
@@ -663,8 +645,24 @@ def add_custom_food():
         )
         db.session.add(serving)
         
+        # 递增食物库版本号，其他进程据此刷新缓存
+        catalog_version = bump_catalog_version(db.session)
+        record = FoodRecord(food, nutrition, [serving], [])
+        
         db.session.commit()
         
+        # 更新识别结果匹配用的名称索引和本进程的食物库缓存；食物已经提交，缓存更新失败不影响创建结果
+        try:
+            food_name_index.add(food.id, food.name)
+        except Exception as e:
+            # 名称索引到刷新间隔时会按 created_at 增量加载到这条食物
+            print(f"Error in updating food name index: {str(e)}")
+        try:
+            food_catalog.put(record, catalog_version)
+        except Exception as e:
+            print(f"Error in updating food catalog: {str(e)}")
+            food_catalog.invalidate()
+        
         # 构建响应数据
         response_data = {
             "id": food.id,
@@ -1,11 +1,7 @@
 from flask import Blueprint, request, jsonify
-import os
-import base64
-import requests
-import json
-from werkzeug.utils import secure_filename
 
-from src.config.config import config
+from src.utils.recognition_backend import get_recognition_backend, pop_call_usage
+from src.utils.user_limiter import user_recognition_limiter, LimitExceeded
 
 openai_api_bp = Blueprint('openai_api', __name__)
 
@@ -21,80 +17,18 @@ def make_response(status, message, data=None, error=None):
         response["error"] = error
     return jsonify(response)
 
-def analyze_food_image(image_path):
+def analyze_food_image(image_data):
     """
     使用OpenAI API分析食物图片
     
     Args:
-        image_path: 图片文件路径
+        image_data: 图片内容（字节）
         
     Returns:
         dict: 包含识别结果的字典
     """
     try:
-        # 读取图片并转为base64
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-        
-        # 构建API请求
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {config['default'].OPENAI_API_KEY}"
-        }
-        
-        payload = {
-            "model": config['default'].OPENAI_API_MODEL,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "你是一个专业的食物识别助手，能够精确识别图片中的食物，并提供详细的营养成分信息。"
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "请识别这张图片中的食物，并提供以下信息：\n1. 食物名称\n2. 大致份量（如1碗、2片等）\n3. 估计重量（克）\n4. 热量（千卡）\n5. 蛋白质（克）\n6. 碳水化合物（克）\n7. 脂肪（克）\n8. 膳食纤维（克）\n9. 识别置信度（0-1之间的小数）\n\n请以JSON格式返回，格式如下：\n{\"foods\": [{\"name\": \"食物名称\", \"amount\": \"份量描述\", \"weight\": 重量, \"calories\": 热量, \"protein\": 蛋白质, \"carbs\": 碳水, \"fat\": 脂肪, \"fiber\": 纤维, \"confidence\": 置信度}]}"},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                    ]
-                }
-            ],
-            "max_tokens": 1000
-        }
-        
-        # 发送请求到OpenAI API
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-        
-        if response.status_code == 200:
-            result = response.json()
-            # 提取JSON响应
-            content = result["choices"][0]["message"]["content"]
-            
-            # 从文本中提取JSON部分
-            try:
-                # 尝试直接解析整个内容
-                food_data = json.loads(content)
-            except json.JSONDecodeError:
-                # 如果失败，尝试从文本中提取JSON部分
-                import re
-                json_match = re.search(r'```json\n(.*?)\n```', content, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1)
-                else:
-                    # 尝试找到 { 和 } 之间的内容
-                    json_match = re.search(r'{.*}', content, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(0)
-                    else:
-                        return {"error": "无法从响应中提取JSON数据"}
-                
-                try:
-                    food_data = json.loads(json_str)
-                except json.JSONDecodeError:
-                    return {"error": "无法解析提取的JSON数据"}
-            
-            return food_data
-        else:
-            return {"error": f"API请求失败: {response.status_code} - {response.text}"}
-    
+        return get_recognition_backend().recognize(image_data, max_tokens=1000)
     except Exception as e:
         return {"error": f"分析过程中出错: {str(e)}"}
 
@@ -118,24 +52,34 @@ def analyze_food():
     if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
         return make_response(400, "图片格式不支持", error="UNSUPPORTED_FORMAT")
     
+    # 直接在内存中处理上传的图片，不写临时文件；空文件在占用限流名额前拒绝
+    image_data = file.read()
+    if not image_data:
+        return make_response(400, "图片文件为空", error="INVALID_IMAGE")
+    
+    # 传了用户ID时按用户限流，否则按客户端地址（经反向代理时取 X-Forwarded-For，见 TRUSTED_PROXY_COUNT）
+    user_id = request.form.get('userId')
+    limit_key = f"user:{user_id}" if user_id else f"ip:{request.remote_addr}"
     try:
-        # 保存上传的图片
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        new_filename = f"temp_{timestamp}_{filename}"
-        
-        # 确保上传目录存在
-        upload_folder = os.path.join(config['default'].UPLOAD_FOLDER, 'temp')
-        os.makedirs(upload_folder, exist_ok=True)
-        
-        file_path = os.path.join(upload_folder, new_filename)
-        file.save(file_path)
-        
-        # 调用OpenAI API分析图片
-        result = analyze_food_image(file_path)
+        user_recognition_limiter.acquire(limit_key)
+    except LimitExceeded as e:
+        response = make_response(429, "请求过于频繁，请稍后再试", error="RATE_LIMITED", data={"retryAfter": e.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    
+    try:
+        # 调用OpenAI API分析图片，无论成功与否都按实际用量结算预扣的预算
+        pop_call_usage()
+        try:
+            result = analyze_food_image(image_data)
+        finally:
+            user_recognition_limiter.settle(limit_key, pop_call_usage())
         
-        # 删除临时文件
-        os.remove(file_path)
+        if result.get("busy"):
+            response = make_response(503, "识别服务繁忙，请稍后重试", error="SERVICE_BUSY")
+            response.status_code = 503
+            return response
         
         if "error" in result:
             return make_response(500, "分析失败", error="ANALYSIS_FAILED", data={"details": result["error"]})
@@ -144,3 +88,5 @@ def analyze_food():
         
     except Exception as e:
         return make_response(500, "分析过程中出错", error="ANALYSIS_ERROR", data={"details": str(e)})
+    finally:
+        user_recognition_limiter.release(limit_key)
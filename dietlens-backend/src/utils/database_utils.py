@@ -1,5 +1,21 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+import time
+
+# 已有数据库需要补齐的字段 (表名, 字段名)：db.create_all() 只建新表，不会修改已存在的表。
+# 字段类型取自模型定义，一律按可空、无默认值添加，旧数据由后面的回填步骤处理
+MIGRATION_COLUMNS = [
+    ('food_recognitions', 'status'),
+    ('food_recognitions', 'error_message'),
+    ('food_recognitions', 'image_phash'),
+    ('food_recognitions', 'diary_entry'),
+    # 营养总量：旧记录保持 NULL，由 backfill_recognition_totals 回填
+    ('food_recognitions', 'total_calories'),
+    ('food_recognitions', 'total_protein'),
+    ('food_recognitions', 'total_carbs'),
+    ('food_recognitions', 'total_fat'),
+    ('food_recognitions', 'total_fiber'),
+]
 
 class DatabaseUtils:
     """数据库工具类，提供数据库初始化和测试数据生成功能"""
@@ -11,12 +27,99 @@ class DatabaseUtils:
             db.create_all()
             print("数据库表已创建")
     
+    @staticmethod
+    def migrate_schema(db, app):
+        """
+        升级已有数据库：建新表，补齐新增字段，回填旧记录的识别状态，创建缺少的索引和唯一约束
+    
+        每一步都先检查是否已完成，可以重复执行。
+    
+        Returns:
+            dict: 迁移报告（新增的字段、索引、唯一约束，以及因存在重复数据而跳过的唯一约束）
+        """
+        from sqlalchemy import inspect, text
+        from src.models import FoodRecognition
+    
+        report = {"columns": [], "indexes": [], "uniqueConstraints": [], "skipped": []}
+    
+        with app.app_context():
+            db.create_all()
+            engine = db.engine
+            preparer = engine.dialect.identifier_preparer
+            tables = db.metadata.tables
+    
+            # 补齐字段
+            inspector = inspect(engine)
+            for table_name, column_name in MIGRATION_COLUMNS:
+                existing = {column['name'] for column in inspector.get_columns(table_name)}
+                if column_name in existing:
+                    continue
+                column = tables[table_name].c[column_name]
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        f"ALTER TABLE {preparer.quote(table_name)} ADD COLUMN {preparer.quote(column_name)} "
+                        f"{column.type.compile(dialect=engine.dialect)}"
+                    ))
+                report["columns"].append(f"{table_name}.{column_name}")
+                print(f"已添加字段 {table_name}.{column_name}")
+    
+            # 新增状态字段之前的识别记录都是同步识别完成的
+            with engine.begin() as conn:
+                conn.execute(
+                    db.update(FoodRecognition.__table__)
+                      .where(FoodRecognition.__table__.c.status.is_(None))
+                      .values(status=FoodRecognition.STATUS_DONE)
+                )
+    
+            # 补齐索引和唯一约束（唯一约束以同名唯一索引创建，MySQL 和 SQLite 中二者等价）
+            inspector = inspect(engine)
+            for table in db.metadata.sorted_tables:
+                existing = {index['name'] for index in inspector.get_indexes(table.name)}
+                existing |= {constraint['name'] for constraint in inspector.get_unique_constraints(table.name)}
+    
+                for index in sorted(table.indexes, key=lambda index: index.name):
+                    if index.name not in existing:
+                        index.create(bind=engine)
+                        report["indexes"].append(index.name)
+                        print(f"已创建索引 {index.name}")
+    
+                for constraint in table.constraints:
+                    if not isinstance(constraint, db.UniqueConstraint) or not constraint.name or constraint.name in existing:
+                        continue
+                    columns = [column.name for column in constraint.columns]
+                    duplicates = db.session.execute(
+                        db.select(db.func.count()).select_from(
+                            db.select(*[table.c[name] for name in columns])
+                              .group_by(*[table.c[name] for name in columns])
+                              .having(db.func.count() > 1)
+                              .subquery()
+                        )
+                    ).scalar()
+                    if duplicates:
+                        # 重复数据需要人工合并后重新执行迁移
+                        report["skipped"].append(constraint.name)
+                        print(f"跳过唯一约束 {constraint.name}：{table.name} 中有 {duplicates} 组重复的 {columns}")
+                        continue
+                    with engine.begin() as conn:
+                        conn.execute(text(
+                            f"CREATE UNIQUE INDEX {preparer.quote(constraint.name)} ON {preparer.quote(table.name)} "
+                            f"({', '.join(preparer.quote(name) for name in columns)})"
+                        ))
+                    report["uniqueConstraints"].append(constraint.name)
+                    print(f"已创建唯一约束 {constraint.name}")
+    
+            db.session.remove()
+    
+        print(f"数据库迁移完成: {report}")
+        return report
+    
     @staticmethod
     def generate_test_data(db, app, force=False):
         """生成测试数据，force=True 时会先清空现有数据再重新生成"""
         from src.models import User, Food, FoodCategory, FoodNutrition, FoodServingSize, NutritionGoal, UserProfile
         from werkzeug.security import generate_password_hash
         from sqlalchemy import text
+        from src.utils.food_catalog import bump_catalog_version
         
         with app.app_context():
             # 检查是否已有数据，如果不强制则跳过
@@ -165,6 +268,9 @@ class DatabaseUtils:
             )
             db.session.add(test_user_profile)
             
+            # 食物库已变化，通知各进程刷新食物库缓存
+            bump_catalog_version(db.session)
+            
             # 提交所有更改
             db.session.commit()
 
@@ -172,6 +278,169 @@ class DatabaseUtils:
 
             print("测试数据生成完成")
     
+    @staticmethod
+    def backfill_recognition_totals(db, app, batch_size=500):
+        """
+        为旧的识别记录回填营养总量字段（新增字段前创建的记录）
+
+        需要先执行 migrate_schema 添加字段；新记录创建时即写入总量，只有旧记录为 NULL。
+        """
+        from src.models import FoodRecognition, RecognizedFood
+        from sqlalchemy.orm import selectinload
+        
+        with app.app_context():
+            updated = 0
+            while True:
+                recognitions = FoodRecognition.query.filter(FoodRecognition.total_calories.is_(None)) \
+                    .options(selectinload(FoodRecognition.recognized_foods)) \
+                    .limit(batch_size).all()
+                if not recognitions:
+                    break
+                for recognition in recognitions:
+                    recognition.update_totals(recognition.recognized_foods)
+                db.session.commit()
+                updated += len(recognitions)
+            print(f"已回填 {updated} 条识别记录的营养总量")
+    
+    @staticmethod
+    def purge_expired_recognitions(db, app, days=None, batch_size=None, pause=None, dry_run=False, sweep_orphans=True):
+        """
+        删除超过保存天数且未保存到日记的识别记录及其识别食物和图片文件、过期的识别结果缓存，
+        并把中断的异步识别任务标记为失败
+
+        按 (created_at, id) 分批删除，每批单独提交并在批次之间暂停，中断后重新执行即可继续。
+
+        Returns:
+            dict: 清理报告（删除的记录数、文件数、缓存条数和释放的字节数）
+        """
+        from src.models import FoodRecognition, RecognizedFood
+        from src.utils.storage import ContentStore, get_content_store
+        from src.utils.recognition_cache import recognition_cache
+        from src.utils.recognition_jobs import fail_stale_recognitions
+        
+        cfg = app.config
+        days = cfg['RECOGNITION_HISTORY_DAYS'] if days is None else days
+        batch_size = batch_size or cfg['RECOGNITION_PURGE_BATCH_SIZE']
+        pause = cfg['RECOGNITION_PURGE_PAUSE_SECONDS'] if pause is None else pause
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        # 宽限期内写入或重复上传过的文件可能属于尚未提交的新记录，不删除
+        grace = cfg['UPLOAD_DELETE_GRACE_SECONDS']
+        store = get_content_store()
+        
+        report = {
+            "cutoff": cutoff.isoformat(),
+            "dryRun": dry_run,
+            "batches": 0,
+            "recognitions": 0,
+            "recognizedFoods": 0,
+            "files": 0,
+            "orphanFiles": 0,
+            "cacheEntries": 0,
+            "staleJobs": 0,
+            "bytes": 0
+        }
+        started = time.monotonic()
+        
+        def remove_file(key):
+            if dry_run:
+                mtime = store.backend.mtime(key)
+                return store.backend.size(key) if mtime is not None and time.time() - mtime >= grace else None
+            return store.delete(key, min_age=grace)
+        
+        def unreferenced(urls, excluded_ids=()):
+            """返回没有（其他）识别记录引用的图片 URL；相同内容的图片可能被多条记录共用"""
+            query = FoodRecognition.query.with_entities(FoodRecognition.image_url) \
+                                         .filter(FoodRecognition.image_url.in_(list(urls)))
+            if excluded_ids:
+                query = query.filter(FoodRecognition.id.notin_(list(excluded_ids)))
+            referenced = {row.image_url for row in query.all()}
+            return [url for url in urls if url not in referenced]
+        
+        with app.app_context():
+            expired = db.and_(
+                FoodRecognition.created_at < cutoff,
+                db.or_(FoodRecognition.saved_to_diary.is_(False), FoodRecognition.saved_to_diary.is_(None))
+            )
+            last_position = None
+            while True:
+                query = FoodRecognition.query.with_entities(
+                    FoodRecognition.id, FoodRecognition.image_url, FoodRecognition.created_at
+                ).filter(expired)
+                if last_position:
+                    # dry_run 不删除数据，需要按游标向后翻页
+                    query = query.filter(db.or_(
+                        FoodRecognition.created_at > last_position[0],
+                        db.and_(FoodRecognition.created_at == last_position[0], FoodRecognition.id > last_position[1])
+                    ))
+                rows = query.order_by(FoodRecognition.created_at.asc(), FoodRecognition.id.asc()) \
+                            .limit(batch_size).all()
+                if not rows:
+                    break
+                
+                recognition_ids = [row.id for row in rows]
+                if dry_run:
+                    food_count = RecognizedFood.query.filter(RecognizedFood.recognition_id.in_(recognition_ids)).count()
+                    last_position = (rows[-1].created_at, rows[-1].id)
+                else:
+                    # 先删子表再删主表，批量语句不逐条加载对象
+                    food_count = RecognizedFood.query.filter(RecognizedFood.recognition_id.in_(recognition_ids)) \
+                                                     .delete(synchronize_session=False)
+                    FoodRecognition.query.filter(FoodRecognition.id.in_(recognition_ids)) \
+                                         .delete(synchronize_session=False)
+                    db.session.commit()
+                
+                # 数据提交后再删除图片，中断时最多留下孤立文件，由下面的孤立文件清理回收
+                image_urls = {row.image_url for row in rows if row.image_url}
+                for image_url in unreferenced(image_urls, recognition_ids) if image_urls else []:
+                    key = ContentStore.key_from_url(image_url)
+                    size = remove_file(key) if key else None
+                    if size is not None:
+                        report["files"] += 1
+                        report["bytes"] += size
+                
+                report["batches"] += 1
+                report["recognitions"] += len(rows)
+                report["recognizedFoods"] += food_count
+                print(f"已清理第 {report['batches']} 批，共 {report['recognitions']} 条识别记录")
+                
+                if len(rows) < batch_size:
+                    break
+                if pause:
+                    time.sleep(pause)
+            
+            # 清理超过宽限期、且没有识别记录引用的图片（如识别失败或中断时留下的文件）
+            if sweep_orphans:
+                cutoff_timestamp = time.time() - grace
+                candidates = {}
+                
+                def sweep(candidates):
+                    for image_url in unreferenced(candidates):
+                        size = remove_file(candidates[image_url])
+                        if size is not None:
+                            report["orphanFiles"] += 1
+                            report["bytes"] += size
+                
+                for key, size, mtime in store.iter_files('recognition'):
+                    if mtime >= cutoff_timestamp:
+                        continue
+                    candidates[ContentStore.url_for(key)] = key
+                    if len(candidates) >= batch_size:
+                        sweep(candidates)
+                        candidates = {}
+                if candidates:
+                    sweep(candidates)
+            
+            # 识别结果缓存只在读取时检查有效期，过期行在这里删除
+            report["cacheEntries"] = recognition_cache.purge_expired(batch_size, dry_run=dry_run)
+            
+            # 中断后一直停在排队或识别中的异步任务标记为失败
+            if not dry_run:
+                report["staleJobs"] = fail_stale_recognitions(cfg['RECOGNITION_JOB_TIMEOUT'])
+        
+        report["elapsedSeconds"] = round(time.monotonic() - started, 2)
+        print(f"识别记录清理完成: {report}")
+        return report
+    
     @staticmethod
     def create_upload_directories(app):
         """创建上传目录"""
@@ -0,0 +1,323 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from src.config.config import config
+from src.utils.search_index import FoodSearchIndex
+from src.utils.suggest_index import FoodSuggestIndex
+from src.utils.pinyin import name_pinyin, pinyin_initials
+
+# catalog_versions 表中食物库对应的行
+CATALOG_VERSION_NAME = 'foods'
+
+DEFAULT_SERVING_SIZE = "100克"
+
+# 增量刷新时向前多取的时间：晚提交的事务 created_at 可能略早于已加载的最新食物
+CATALOG_DELTA_OVERLAP_SECONDS = 60
+
+
+class FoodRecord:
+    """食物库缓存中的一条食物，只保留接口返回需要的字段"""
+
+    __slots__ = ('id', 'name', 'name_lower', 'category', 'category_name', 'description', 'image_url',
+                 'created_at', 'is_custom', 'popularity', 'has_nutrition', 'calories', 'protein', 'carbs', 'fat',
+                 'fiber', 'nutrition', 'serving_size', 'serving_sizes', 'tags', 'pinyin', 'initials')
+
+    def __init__(self, food, nutrition, serving_sizes, tags):
+        self.id = food.id
+        self.name = food.name
+        self.name_lower = food.name.lower()
+        self.category = food.category
+        self.category_name = food.category_name
+        self.description = food.description
+        self.image_url = food.image_url
+        self.created_at = food.created_at
+        self.is_custom = bool(food.is_custom)
+        self.popularity = food.popularity or 0
+
+        self.has_nutrition = nutrition is not None
+        self.calories = nutrition.calories if nutrition else 0
+        self.protein = nutrition.protein if nutrition else 0
+        self.carbs = nutrition.carbs if nutrition else 0
+        self.fat = nutrition.fat if nutrition else 0
+        self.fiber = nutrition.fiber if nutrition else 0
+        self.nutrition = {}
+        if nutrition:
+            self.nutrition = {
+                "calories": nutrition.calories,
+                "protein": nutrition.protein,
+                "carbs": nutrition.carbs,
+                "fat": nutrition.fat,
+                "fiber": nutrition.fiber,
+                "sugar": nutrition.sugar,
+                "sodium": nutrition.sodium,
+                "potassium": nutrition.potassium,
+                "vitaminA": nutrition.vitamin_a,
+                "vitaminC": nutrition.vitamin_c,
+                "calcium": nutrition.calcium,
+                "iron": nutrition.iron
+            }
+
+        self.serving_sizes = tuple(
+            {"name": serving.name, "weight": serving.weight, "isDefault": serving.is_default}
+            for serving in serving_sizes
+        )
+        default_serving = next((s for s in serving_sizes if s.is_default), None)
+        self.serving_size = default_serving.name if default_serving else DEFAULT_SERVING_SIZE
+        self.tags = tuple(tag.name for tag in tags)
+
+        # 名称的拼音音节和首字母，建立索引时一次算好
+        self.pinyin = name_pinyin(food.name)
+        self.initials = pinyin_initials(self.pinyin)
+
+
+def _insort(ordered, record, key):
+    """按 key 二分插入（bisect.insort 的 key 参数需要 Python 3.10+）"""
+    record_key = key(record)
+    lo, hi = 0, len(ordered)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key(ordered[mid]) <= record_key:
+            lo = mid + 1
+        else:
+            hi = mid
+    ordered.insert(lo, record)
+
+
+class CatalogSnapshot:
+    """
+    某个版本的食物库快照，更新时整体替换
+
+    foods、分类和排序列表构建后只读；搜索索引和联想索引为避免重建在各版本快照间共享，
+    新增食物时原地更新，旧快照也会查到新食物的ID，调用方需按 foods 过滤（foods 中没有的跳过）。
+    """
+
+    # 排序方式 -> 排序键
+    ORDER_KEYS = {
+        'name_asc': lambda r: (r.name, r.id),
+        'calories_asc': lambda r: (r.calories or 0, r.name, r.id),
+        'popularity': lambda r: (-r.popularity, r.name, r.id)
+    }
+
+    def __init__(self, version, records, categories, orders=None, search_index=None, suggest_index=None):
+        self.version = version
+        self.foods = {record.id: record for record in records}
+        self.categories = categories  # 分类ID -> {"id", "name", "description", "imageUrl"}
+        # 名称、描述、标签的倒排索引，新增食物时在各版本快照间共享并增量更新
+        self.search_index = search_index if search_index is not None else FoodSearchIndex(self.foods.values())
+        # 输入联想用的前缀索引，同样在各版本快照间共享
+        self.suggest_index = suggest_index if suggest_index is not None else FoodSuggestIndex(self.foods.values())
+
+        if orders is None:
+            orders = {order: sorted(self.foods.values(), key=key) for order, key in self.ORDER_KEYS.items()}
+        self._orders = orders
+        self._orders['name_desc'] = orders['name_asc'][::-1]
+        self._orders['calories_desc'] = orders['calories_asc'][::-1]
+
+        self.category_counts = {}
+        self.max_created_at = None
+        for record in self.foods.values():
+            self.category_counts[record.category] = self.category_counts.get(record.category, 0) + 1
+            if record.created_at and (self.max_created_at is None or record.created_at > self.max_created_at):
+                self.max_created_at = record.created_at
+
+    def ordered(self, order):
+        """按排序方式返回全部食物（预先排好序，不复制）"""
+        return self._orders[order]
+
+    def with_records(self, records, version):
+        """
+        返回加入（或替换）若干食物后的新快照，已排好的顺序按二分插入，不重新排序
+
+        注意：共享的搜索索引和联想索引会被原地更新，不会复制
+        """
+        changed = {record.id for record in records}
+        replaced = changed & self.foods.keys()
+        foods = [r for r in self.foods.values() if r.id not in replaced] if replaced else list(self.foods.values())
+        foods.extend(records)
+
+        orders = {}
+        for order, key in self.ORDER_KEYS.items():
+            ordered = [r for r in self._orders[order] if r.id not in replaced] if replaced else list(self._orders[order])
+            for record in records:
+                _insort(ordered, record, key)
+            orders[order] = ordered
+
+        for record in records:
+            self.search_index.add(record)
+            self.suggest_index.add(record)
+        return CatalogSnapshot(version, foods, self.categories, orders, self.search_index, self.suggest_index)
+
+
+class FoodCatalog:
+    """
+    进程内的只读食物库缓存，供搜索、分类、热门和详情接口使用
+
+    启动时一次性加载全部食物（营养信息、份量、标签）为快照；本进程写入自定义食物时
+    直接把新食物放入快照，其他进程写入时会递增 catalog_versions 中的版本号，
+    每隔 check_interval 秒比较一次版本号，不一致时增量加载新创建的食物。
+
+    增量加载只能发现新创建的食物：每新增一条食物版本号加 1，版本号增加得比新食物多
+    （其他进程修改、删除了食物或重新生成了数据）或食物总数对不上时，改为整体重新加载。
+    """
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._last_check = 0.0
+        self._loads = 0
+        self._patches = 0
+        self._local_ids = set()  # 本进程写入、但快照版本号尚未包含的食物
+
+    @staticmethod
+    def _current_version():
+        from src.models import db, CatalogVersion
+
+        version = db.session.query(CatalogVersion.version).filter_by(name=CATALOG_VERSION_NAME).scalar()
+        return version or 0
+
+    @staticmethod
+    def _load_records(query):
+        from sqlalchemy.orm import selectinload
+        from src.models import Food
+
+        foods = query.options(
+            selectinload(Food.nutrition),
+            selectinload(Food.serving_sizes),
+            selectinload(Food.tags)
+        ).all()
+        return [FoodRecord(food, food.nutrition, food.serving_sizes, food.tags) for food in foods]
+
+    def _load(self, version):
+        from src.models import Food, FoodCategory
+
+        records = self._load_records(Food.query)
+        categories = {
+            category.id: {
+                "id": category.id,
+                "name": category.name,
+                "description": category.description,
+                "imageUrl": category.image_url
+            }
+            for category in FoodCategory.query.all()
+        }
+        return CatalogSnapshot(version, records, categories)
+
+    def _load_delta(self, snapshot, version):
+        """
+        只加载快照中最新食物之后创建的食物，食物库很大时避免整体重建
+
+        版本号的增量与新食物数量或食物总数对不上时返回 None，由调用方整体重新加载
+        """
+        from src.models import db, Food
+
+        if version < snapshot.version:
+            return None
+        since = snapshot.max_created_at - timedelta(seconds=CATALOG_DELTA_OVERLAP_SECONDS)
+        records = self._load_records(Food.query.filter(Food.created_at >= since))
+        new_ids = {record.id for record in records if record.id not in snapshot.foods}
+        if version - snapshot.version > len(new_ids | self._local_ids):
+            return None
+        if db.session.query(Food.id).count() != len(snapshot.foods) + len(new_ids):
+            return None
+        return snapshot.with_records(records, version)
+
+    def snapshot(self, force_check=False):
+        """返回当前快照，到达检查间隔（或 force_check）时先比较跨进程版本号"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and not force_check and now - self._last_check < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and not force_check and now - self._last_check < self.check_interval:
+                return snapshot
+            version = self._current_version()
+            patched = None
+            if snapshot is not None and snapshot.max_created_at is not None and snapshot.version != version:
+                patched = self._load_delta(snapshot, version)
+            if patched is not None:
+                snapshot = patched
+                self._patches += 1
+            elif snapshot is None or snapshot.version != version or snapshot.max_created_at is None:
+                snapshot = self._load(version)
+                self._loads += 1
+            if snapshot.version == version:
+                self._local_ids.clear()
+            self._snapshot = snapshot
+            self._last_check = now
+            return snapshot
+
+    def warm(self):
+        """启动时预先加载快照（需要在 app 上下文中调用）"""
+        return self.snapshot(force_check=True)
+
+    def get(self, food_id):
+        """按ID取食物；本地快照中没有时立即检查一次版本号，以便看到其他进程刚写入的食物"""
+        record = self.snapshot().foods.get(food_id)
+        if record is None:
+            record = self.snapshot(force_check=True).foods.get(food_id)
+        return record
+
+    def put(self, record, version):
+        """本进程写入食物并提交后调用，只更新这一条食物"""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return
+            if version == snapshot.version + 1:
+                self._snapshot = snapshot.with_records([record], version)
+            else:
+                # 期间还有其他进程写入：先放入这条食物，保留旧版本号，下次访问时增量加载其他进程新增的食物
+                self._snapshot = snapshot.with_records([record], snapshot.version)
+                self._local_ids.add(record.id)
+                self._last_check = 0.0
+            self._patches += 1
+
+    def invalidate(self):
+        """丢弃当前快照，下次访问时整体重新加载（本进程更新快照失败时的兜底）"""
+        with self._lock:
+            self._snapshot = None
+            self._local_ids.clear()
+            self._last_check = 0.0
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "foods": len(snapshot.foods) if snapshot else 0,
+            "loads": self._loads,
+            "patches": self._patches,
+            "searchIndex": snapshot.search_index.stats() if snapshot else None,
+            "suggestIndex": snapshot.suggest_index.stats() if snapshot else None
+        }
+
+
+def bump_catalog_version(session):
+    """在写入食物的事务中递增食物库版本号，返回新版本号（随事务一起提交）"""
+    from src.models import CatalogVersion
+
+    for _ in range(2):
+        updated = session.query(CatalogVersion).filter_by(name=CATALOG_VERSION_NAME).update(
+            {CatalogVersion.version: CatalogVersion.version + 1, CatalogVersion.updated_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+        if updated:
+            break
+        try:
+            # 首次写入时创建版本行；并发创建冲突时回到更新分支
+            with session.begin_nested():
+                session.add(CatalogVersion(name=CATALOG_VERSION_NAME, version=1))
+            break
+        except IntegrityError:
+            continue
+    return session.query(CatalogVersion.version).filter_by(name=CATALOG_VERSION_NAME).scalar()
+
+
+food_catalog = FoodCatalog(
+    check_interval=config['default'].FOOD_CATALOG_VERSION_CHECK_SECONDS
+)
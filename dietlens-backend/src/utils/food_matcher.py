@@ -0,0 +1,213 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from src.config.config import config
+
+# 常见别名 -> 食物库中的标准名称
+FOOD_NAME_ALIASES = {
+    '米饭': '白米饭',
+    '大米饭': '白米饭',
+    '白饭': '白米饭',
+    '全麦吐司': '全麦面包',
+    '麦片': '燕麦片',
+    '燕麦': '燕麦片',
+    '玉米': '玉米粒',
+    '西兰花菜': '西兰花',
+    '西蓝花': '西兰花',
+    '花椰菜': '西兰花',
+    '红萝卜': '胡萝卜',
+    '西红柿': '番茄',
+    '青瓜': '黄瓜',
+    '奇异果': '猕猴桃',
+    '鸡胸': '鸡胸肉',
+    '鸡肉': '鸡胸肉',
+    '水煮蛋': '鸡蛋',
+    '煮鸡蛋': '鸡蛋',
+    '荷包蛋': '鸡蛋',
+    '牛排': '牛肉',
+    '三文鱼刺身': '三文鱼',
+    '鲑鱼': '三文鱼',
+    '牛奶': '全脂牛奶',
+    '纯牛奶': '全脂牛奶',
+    '芝士': '奶酪',
+    '乳酪': '奶酪'
+}
+
+_STRIP_PATTERN = re.compile(r'[\s　·・,，.。、()（）\[\]【】\-_/]+')
+
+
+def normalize_name(name):
+    """统一全角/半角、大小写，并去除空白和标点"""
+    if not name:
+        return ''
+    name = unicodedata.normalize('NFKC', name).lower()
+    return _STRIP_PATTERN.sub('', name)
+
+
+def bigrams(text):
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def edit_distance(a, b, max_distance=None):
+    """Levenshtein 编辑距离，超过 max_distance 时提前返回 max_distance + 1"""
+    if a == b:
+        return 0
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+# 不超过该长度的名称只按二元组比较：短名称改一个字往往就是另一种食物（红烧肉 / 红烧鱼）
+SHORT_NAME_LENGTH = 3
+
+
+def similarity(query, candidate):
+    """
+    名称相似度（0-1）：二元组 Dice 系数，两个名称都较长时取它与编辑距离相似度的较大者；
+    一方是另一方的后缀时额外加分（中文名称的中心词在末尾，"清炒西兰花" 仍是西兰花，"鸡蛋饼" 不是鸡蛋）
+    """
+    query_grams = bigrams(query)
+    candidate_grams = bigrams(candidate)
+    score = 2 * len(query_grams & candidate_grams) / (len(query_grams) + len(candidate_grams))
+    if min(len(query), len(candidate)) > SHORT_NAME_LENGTH:
+        score = max(score, 1 - edit_distance(query, candidate) / max(len(query), len(candidate)))
+    if query.endswith(candidate) or candidate.endswith(query):
+        score = min(score + 0.1, 1.0)
+    return score
+
+
+class FoodNameIndex:
+    """
+    内存中的食物名称索引，用于把识别出的食物名称批量匹配到食物库
+
+    匹配顺序：标准化名称精确匹配 -> 别名 -> 基于二元组倒排索引召回候选后按相似度模糊匹配；
+    分数低于 confirm_score 的模糊匹配只作为建议，需要用户确认后才写入
+    """
+
+    def __init__(self, min_score, refresh_interval, confirm_score=0.9):
+        self.min_score = min_score
+        self.confirm_score = confirm_score
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._exact = {}  # 标准化名称 -> food_id
+        self._names = {}  # food_id -> 标准化名称
+        self._display_names = {}  # food_id -> 原始名称
+        self._grams = defaultdict(set)  # 二元组（单字名称为该字） -> food_id 集合
+        self._loaded = False
+        self._last_created_at = None
+        self._last_refresh = 0.0
+
+    def _add_locked(self, food_id, name):
+        normalized = normalize_name(name)
+        if not normalized:
+            return
+        # 同名食物保留先加入的（通常是基础食物库中的条目）
+        self._exact.setdefault(normalized, food_id)
+        self._names[food_id] = normalized
+        self._display_names[food_id] = name
+        for gram in bigrams(normalized):
+            self._grams[gram].add(food_id)
+
+    def _refresh(self):
+        """首次调用时全量加载，之后按 created_at 增量加载其他进程新增的食物"""
+        from src.models import Food
+
+        now = time.monotonic()
+        if self._loaded and now - self._last_refresh < self.refresh_interval:
+            return
+
+        query = Food.query.with_entities(Food.id, Food.name, Food.created_at)
+        if self._loaded and self._last_created_at is not None:
+            query = query.filter(Food.created_at > self._last_created_at)
+        rows = query.order_by(Food.created_at.asc()).all()
+
+        with self._lock:
+            for food_id, name, created_at in rows:
+                self._add_locked(food_id, name)
+                if created_at and (self._last_created_at is None or created_at > self._last_created_at):
+                    self._last_created_at = created_at
+            self._loaded = True
+            self._last_refresh = now
+
+    def add(self, food_id, name):
+        """新增食物（如自定义食物）时增量更新索引"""
+        with self._lock:
+            if self._loaded:
+                self._add_locked(food_id, name)
+
+    def _match_locked(self, name):
+        normalized = normalize_name(name)
+        if not normalized:
+            return None
+
+        food_id = self._exact.get(normalized)
+        if food_id:
+            return food_id, 1.0
+
+        alias = FOOD_NAME_ALIASES.get(normalized)
+        if alias:
+            food_id = self._exact.get(normalize_name(alias))
+            if food_id:
+                return food_id, 0.95
+
+        # 至少共享一个二元组的食物作为候选（单字倒排表对 肉、菜、饭 这类常见字几乎是全表）
+        candidates = set()
+        for gram in bigrams(normalized):
+            candidates |= self._grams.get(gram, set())
+
+        best_id, best_score = None, 0.0
+        for candidate_id in candidates:
+            candidate_name = self._names[candidate_id]
+            score = similarity(normalized, candidate_name)
+            if score > best_score or (score == best_score and best_id and len(candidate_name) < len(self._names[best_id])):
+                best_id, best_score = candidate_id, score
+
+        if best_id and best_score >= self.min_score:
+            return best_id, round(best_score, 3)
+        return None
+
+    def confirmed(self, match):
+        """匹配分数足够高、可以直接写入的 food_id，否则为 None"""
+        return match[0] if match and match[1] >= self.confirm_score else None
+
+    def suggestion(self, match):
+        """需要用户确认的匹配，返回 {"id", "name", "score"}，没有或已可直接写入时为 None"""
+        if not match or match[1] >= self.confirm_score:
+            return None
+        with self._lock:
+            name = self._display_names.get(match[0])
+        return {"id": match[0], "name": name, "score": match[1]}
+
+    def match(self, name):
+        """匹配单个名称，返回 (food_id, 匹配分数) 或 None"""
+        return self.match_many([name]).get(name)
+
+    def match_many(self, names):
+        """批量匹配，返回 {名称: (food_id, 匹配分数) 或 None}，不产生逐条数据库查询"""
+        self._refresh()
+        with self._lock:
+            return {name: self._match_locked(name) for name in names if name is not None}
+
+
+food_name_index = FoodNameIndex(
+    min_score=config['default'].FOOD_MATCH_MIN_SCORE,
+    confirm_score=config['default'].FOOD_MATCH_CONFIRM_SCORE,
+    refresh_interval=config['default'].FOOD_INDEX_REFRESH_SECONDS
+)
@@ -0,0 +1,266 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.config.config import config
+from src.utils.circuit_breaker import CircuitBreaker
+
+# 需要重试的上游状态码
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ClientBusyError(requests.RequestException):
+    """等待空闲连接超时，请求没有发出"""
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 头（秒数或 HTTP 日期），返回等待秒数或 None"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class StreamedResponse:
+    """
+    流式响应：连接名额一直占用到响应关闭，熔断器在关闭时按读取过程是否出错记录结果
+
+    其余属性直接转发给 requests.Response；调用方读完或放弃读取后必须调用 close()
+    """
+
+    def __init__(self, client, response):
+        self._client = client
+        self._response = response
+        self._failed = False
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def iter_lines(self, *args, **kwargs):
+        try:
+            yield from self._response.iter_lines(*args, **kwargs)
+        except requests.RequestException:
+            # 读取中途停滞超时或连接中断
+            self._failed = True
+            raise
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._response.close()
+        finally:
+            self._client._finish_stream(failed=self._failed)
+
+
+class VisionApiClient:
+    """视觉识别接口的共享 HTTP 客户端：长连接池 + 连接/读取超时"""
+
+    def __init__(self, base_url, api_key, pool_size, connect_timeout, read_timeout,
+                 max_retries=0, backoff_base=0.5, backoff_max=8, retry_after_max=10, breaker=None, queue_timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self.breaker = breaker
+        self.queue_timeout = queue_timeout
+
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+
+        # 并发请求数不超过连接池大小，超出的请求最多排队等待 queue_timeout 秒
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self._requests = 0
+        self._errors = 0
+        self._retries = 0
+        self._rejected = 0
+
+    def _backoff_delay(self, attempt, response=None):
+        """第 attempt 次重试前的等待时间：优先 Retry-After，否则指数退避加全抖动"""
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return retry_after
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, path, payload, **kwargs):
+        """
+        发送 JSON POST 请求，返回 requests.Response
+
+        429/5xx 和网络错误按指数退避重试；重试耗尽后仍失败会计入熔断器。
+        熔断打开时抛出 CircuitOpenError，等待空闲连接超时抛出 ClientBusyError，
+        网络错误和超时抛出 requests.RequestException
+
+        stream=True 且返回 200 时返回 StreamedResponse：连接名额保持占用，
+        读取完成并 close() 后才释放名额并记录熔断结果
+        """
+        stream = kwargs.get('stream', False)
+        if self.breaker:
+            self.breaker.before_call()
+
+        attempt = 0
+        while True:
+            try:
+                response = self._send(path, payload, **kwargs)
+            except ClientBusyError:
+                # 请求没有发出，不重试，也不计入熔断
+                if self.breaker:
+                    self.breaker.cancel_call()
+                raise
+            except requests.RequestException:
+                if attempt >= self.max_retries:
+                    if self.breaker:
+                        self.breaker.record_failure()
+                    raise
+                delay = self._backoff_delay(attempt)
+            else:
+                if stream and response.status_code == 200:
+                    return StreamedResponse(self, response)
+                if stream:
+                    # 错误响应的内容很短，读完后立即归还名额
+                    try:
+                        response.content
+                    except requests.RequestException:
+                        pass
+                    finally:
+                        self._release_slot()
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    if self.breaker:
+                        self.breaker.record_success()
+                    return response
+                delay = self._backoff_delay(attempt, response)
+                # 重试次数用尽，或上游要求等待过久时不再重试
+                if attempt >= self.max_retries or delay > self.retry_after_max:
+                    if self.breaker:
+                        self.breaker.record_failure()
+                    return response
+                response.close()
+
+            attempt += 1
+            with self._lock:
+                self._retries += 1
+            time.sleep(delay)
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _finish_stream(self, failed):
+        """流式响应关闭时调用：归还连接名额，读取出错计入熔断器"""
+        self._release_slot()
+        if failed:
+            with self._lock:
+                self._errors += 1
+        if self.breaker:
+            if failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+    def _send(self, path, payload, **kwargs):
+        """发送单次请求；流式请求成功发出后由调用方归还连接名额"""
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+        with self._lock:
+            self._queued += 1
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._queued -= 1
+                self._rejected += 1
+            raise ClientBusyError(f"识别服务繁忙，{self.queue_timeout}秒内没有空闲连接")
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+            self._requests += 1
+
+        try:
+            response = self.session.post(
+                f"{self.base_url}{path}",
+                headers=headers,
+                json=payload,
+                timeout=kwargs.pop('timeout', self.timeout),
+                **kwargs
+            )
+        except BaseException as e:
+            if isinstance(e, requests.RequestException):
+                with self._lock:
+                    self._errors += 1
+            self._release_slot()
+            raise
+        if not kwargs.get('stream'):
+            self._release_slot()
+        return response
+
+    def stats(self):
+        """连接池指标：进行中、排队中的请求数，新建与复用的连接数"""
+        connections_opened = 0
+        pooled_requests = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections_opened += pool.num_connections
+            pooled_requests += pool.num_requests
+
+        with self._lock:
+            return {
+                "poolSize": self.pool_size,
+                "connectTimeout": self.timeout[0],
+                "readTimeout": self.timeout[1],
+                "queueTimeout": self.queue_timeout,
+                "inFlight": self._in_flight,
+                "queued": self._queued,
+                "rejected": self._rejected,
+                "requests": self._requests,
+                "errors": self._errors,
+                "retries": self._retries,
+                "connectionsOpened": connections_opened,
+                "connectionsReused": max(pooled_requests - connections_opened, 0)
+            }
+
+
+def create_vision_client(base_url, api_key=None):
+    """按配置创建视觉识别接口客户端"""
+    return VisionApiClient(
+        base_url=base_url,
+        api_key=api_key or config['default'].OPENAI_API_KEY,
+        pool_size=config['default'].VISION_API_POOL_SIZE,
+        connect_timeout=config['default'].VISION_API_CONNECT_TIMEOUT,
+        read_timeout=config['default'].VISION_API_READ_TIMEOUT,
+        max_retries=config['default'].VISION_API_MAX_RETRIES,
+        backoff_base=config['default'].VISION_API_BACKOFF_BASE,
+        backoff_max=config['default'].VISION_API_BACKOFF_MAX,
+        retry_after_max=config['default'].VISION_API_RETRY_AFTER_MAX,
+        queue_timeout=config['default'].VISION_API_QUEUE_TIMEOUT,
+        breaker=CircuitBreaker(
+            failure_threshold=config['default'].VISION_API_BREAKER_THRESHOLD,
+            reset_timeout=config['default'].VISION_API_BREAKER_RESET_TIMEOUT,
+            half_open_max_calls=config['default'].VISION_API_BREAKER_HALF_OPEN_CALLS
+        )
+    )
@@ -0,0 +1,146 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageOps
+
+from src.config.config import config
+
+
+def dhash(file_path, hash_size=8):
+    """计算图片的差值哈希（dHash），返回 16 位十六进制字符串"""
+    with Image.open(file_path) as image:
+        # 先按 EXIF 方向摆正，同一张照片横拍、竖拍存储的像素方向不同
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+        pixels = list(image.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(hash_a, hash_b):
+    """两个十六进制哈希之间的汉明距离"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+
+class BKTree:
+    """以汉明距离为度量的 BK 树，用于查找相近的感知哈希"""
+
+    def __init__(self):
+        self._root = None  # [hash, payloads, children]
+        self.size = 0
+
+    def add(self, image_hash, payload):
+        self.size += 1
+        if self._root is None:
+            self._root = [image_hash, [payload], {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(image_hash, node[0])
+            if distance == 0:
+                node[1].append(payload)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [image_hash, [payload], {}]
+                return
+            node = child
+
+    def search(self, image_hash, max_distance):
+        """返回 [(distance, payload)]，按距离升序"""
+        if self._root is None:
+            return []
+
+        results = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(image_hash, node[0])
+            if distance <= max_distance:
+                results.extend((distance, payload) for payload in node[1])
+            # 三角不等式剪枝：只需访问距离在 [d - max, d + max] 内的子树
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+
+        results.sort(key=lambda item: item[0])
+        return results
+
+
+class NearDuplicateIndex:
+    """按用户划分的近似重复图片索引，懒加载用户最近的识别记录"""
+
+    def __init__(self, threshold, window_hours, max_users=1000):
+        self.threshold = threshold
+        self.window = timedelta(hours=window_hours)
+        self.max_users = max_users
+        self._trees = OrderedDict()  # user_id -> BKTree
+        self._lock = threading.Lock()
+
+    def _load(self, user_id):
+        from src.models import FoodRecognition
+
+        tree = BKTree()
+        since = datetime.utcnow() - self.window
+        rows = FoodRecognition.query.with_entities(
+            FoodRecognition.id, FoodRecognition.image_phash, FoodRecognition.created_at
+        ).filter(
+            FoodRecognition.user_id == user_id,
+            FoodRecognition.status == FoodRecognition.STATUS_DONE,
+            FoodRecognition.image_phash.isnot(None),
+            FoodRecognition.created_at >= since
+        ).all()
+        for recognition_id, image_phash, created_at in rows:
+            tree.add(image_phash, (recognition_id, created_at))
+        return tree
+
+    def _tree(self, user_id):
+        with self._lock:
+            tree = self._trees.get(user_id)
+            if tree is not None:
+                self._trees.move_to_end(user_id)
+                return tree
+
+        tree = self._load(user_id)
+        with self._lock:
+            self._trees[user_id] = tree
+            self._trees.move_to_end(user_id)
+            while len(self._trees) > self.max_users:
+                self._trees.popitem(last=False)
+        return tree
+
+    def add(self, user_id, image_phash, recognition_id, created_at):
+        """登记一条已完成的识别记录"""
+        with self._lock:
+            tree = self._trees.get(user_id)
+            if tree is not None:
+                tree.add(image_phash, (recognition_id, created_at))
+
+    def find(self, user_id, image_phash):
+        """查找阈值内最相近的最近识别记录，返回 (recognition_id, distance) 或 None"""
+        if self.threshold <= 0 or not image_phash:
+            return None
+
+        tree = self._tree(user_id)
+        since = datetime.utcnow() - self.window
+        with self._lock:
+            matches = tree.search(image_phash, self.threshold)
+
+        for distance, (recognition_id, created_at) in matches:
+            if created_at and created_at >= since:
+                return recognition_id, distance
+        return None
+
+
+near_duplicate_index = NearDuplicateIndex(
+    threshold=config['default'].RECOGNITION_PHASH_THRESHOLD,
+    window_hours=config['default'].RECOGNITION_PHASH_WINDOW_HOURS
+)
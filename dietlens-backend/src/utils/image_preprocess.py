@@ -0,0 +1,119 @@
+import base64
+import io
+import threading
+import time
+from collections import deque
+
+from PIL import Image, ImageOps
+
+from src.config.config import config
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+    'PNG': 'image/png'
+}
+
+
+def detect_mime_type(data):
+    """根据文件头判断图片类型"""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+def preprocess_image(data, max_edge=None, image_format=None, quality=None):
+    """
+    上传识别前的图片预处理：按 EXIF 方向旋转、限制最长边、去除元数据并重新编码
+
+    Returns:
+        tuple: (处理后的字节, MIME 类型)
+    """
+    max_edge = max_edge or config['default'].RECOGNITION_IMAGE_MAX_EDGE
+    image_format = (image_format or config['default'].RECOGNITION_IMAGE_FORMAT).upper()
+    quality = quality or config['default'].RECOGNITION_IMAGE_QUALITY
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            # 透明背景按白色填充
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        output = io.BytesIO()
+        # 不传 exif 参数，重新编码后不保留原图元数据
+        image.save(output, format=image_format, quality=quality, optimize=True)
+
+    # 重新编码后即使比原图大也使用重新编码的结果，原图的 EXIF（含 GPS 位置）不能发给上游
+    return output.getvalue(), MIME_TYPES.get(image_format, 'image/jpeg')
+
+
+class PreprocessStats:
+    """记录每次预处理前后的字节数和耗时"""
+
+    def __init__(self, history_size=100):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=history_size)
+        self._count = 0
+        self._bytes_before = 0
+        self._bytes_after = 0
+        self._elapsed_ms = 0.0
+
+    def record(self, entry):
+        with self._lock:
+            self._recent.append(entry)
+            self._count += 1
+            self._bytes_before += entry["bytesBefore"]
+            self._bytes_after += entry["bytesAfter"]
+            self._elapsed_ms += entry["elapsedMs"]
+
+    def snapshot(self):
+        with self._lock:
+            count = self._count
+            return {
+                "count": count,
+                "bytesBefore": self._bytes_before,
+                "bytesAfter": self._bytes_after,
+                "compressionRatio": round(self._bytes_after / self._bytes_before, 4) if self._bytes_before else 0,
+                "avgElapsedMs": round(self._elapsed_ms / count, 2) if count else 0,
+                "recent": list(self._recent)[-10:]
+            }
+
+
+preprocess_stats = PreprocessStats()
+
+
+def encode_image_bytes(data):
+    """
+    预处理图片字节并编码为 data URL
+
+    Returns:
+        tuple: (data URL, 本次预处理统计)
+    """
+    started = time.perf_counter()
+    try:
+        processed, mime_type = preprocess_image(data)
+    except Exception as e:
+        # 无法解码时按原图上传
+        print(f"Error in preprocessing image: {str(e)}")
+        processed, mime_type = data, detect_mime_type(data)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    entry = {
+        "bytesBefore": len(data),
+        "bytesAfter": len(processed),
+        "mimeType": mime_type,
+        "elapsedMs": round(elapsed_ms, 2)
+    }
+    preprocess_stats.record(entry)
+
+    base64_image = base64.b64encode(processed).decode('utf-8')
+    return f"data:{mime_type};base64,{base64_image}", entry
+
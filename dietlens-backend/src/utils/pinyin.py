@@ -0,0 +1,87 @@
+import re
+import unicodedata
+
+from pypinyin import lazy_pinyin
+
+# 全部拼音音节（ü 写作 v，与拼音输入法一致），用于把用户输入的拼音切分成音节
+PINYIN_SYLLABLES = frozenset("""
+    a ai an ang ao ba bai ban bang bao bei ben beng bi bian biang biao bie bin bing bo bong bu ca
+    cai can cang cao ce cei cen ceng cha chai chan chang chao che chen cheng chi chong chou chu chua
+    chuai chuan chuang chui chun chuo ci cong cou cu cuan cui cun cuo da dai dan dang dao de dei den
+    deng di dia dian diao die din ding diu dong dou du duan dui dun duo e ei en eng er fa fan fang
+    fei fen feng fiao fo fou fu ga gai gan gang gao ge gei gen geng gong gou gu gua guai guan guang
+    gui gun guo ha hai han hang hao he hei hen heng hong hou hu hua huai huan huang hui hun huo ji
+    jia jian jiang jiao jie jin jing jiong jiu ju juan jue jun ka kai kan kang kao ke kei ken keng
+    kong kou ku kua kuai kuan kuang kui kun kuo la lai lan lang lao le lei len leng li lia lian
+    liang liao lie lin ling liu lo long lou lu luan lun luo lv lve ma mai man mang mao me mei men
+    meng mi mian miao mie min ming miu mo mou mu na nai nan nang nao ne nei nen neng ni nia nian
+    niang niao nie nin ning niu nong nou nu nuan nun nuo nv nve o ou pa pai pan pang pao pei pen
+    peng pi pian piao pie pin ping po pou pu qi qia qian qiang qiao qie qin qing qiong qiu qu quan
+    que qun ran rang rao re ren reng ri rong rou ru rua ruan rui run ruo sa sai san sang sao se sen
+    seng sha shai shan shang shao she shei shen sheng shi shou shu shua shuai shuan shuang shui shun
+    shuo si song sou su suan sui sun suo ta tai tan tang tao te tei teng ti tian tiao tie ting tong
+    tou tu tuan tui tun tuo wa wai wan wang wei wen weng wo wong wu xi xia xian xiang xiao xie xin
+    xing xiong xiu xu xuan xue xun ya yan yang yao ye yi yin ying yo yong you yu yuan yue yun za zai
+    zan zang zao ze zei zen zeng zha zhai zhan zhang zhao zhe zhei zhen zheng zhi zhong zhou zhu
+    zhua zhuai zhuan zhuang zhui zhun zhuo zi zong zou zu zuan zui zun zuo
+""".split())
+
+_MAX_SYLLABLE_LENGTH = max(len(syllable) for syllable in PINYIN_SYLLABLES)
+_PINYIN_QUERY_PATTERN = re.compile(r'[a-z]+')
+_SEPARATOR_PATTERN = re.compile(r"[\s'’]+")
+
+
+def name_pinyin(name):
+    """
+    食物名称中汉字的拼音音节（按词组判断多音字），非汉字部分忽略
+
+    例如 "白米饭" -> ('bai', 'mi', 'fan')
+    """
+    if not name:
+        return ()
+    syllables = lazy_pinyin(name, errors='ignore', v_to_u=False)
+    return tuple(syllable for syllable in syllables if syllable in PINYIN_SYLLABLES)
+
+
+def pinyin_initials(syllables):
+    """拼音首字母，例如 ('bai', 'mi', 'fan') -> 'bmf'"""
+    return ''.join(syllable[0] for syllable in syllables)
+
+
+def compact_pinyin_query(query):
+    """去掉空格和隔音符号后的小写拼音输入，不是纯字母时返回 None"""
+    query = _SEPARATOR_PATTERN.sub('', unicodedata.normalize('NFKC', query or '').lower())
+    return query if _PINYIN_QUERY_PATTERN.fullmatch(query) else None
+
+
+def _segment_part(text):
+    # best[i]: text[i:] 的最少音节切分
+    best = [None] * len(text) + [[]]
+    for start in range(len(text) - 1, -1, -1):
+        for length in range(min(_MAX_SYLLABLE_LENGTH, len(text) - start), 0, -1):
+            rest = best[start + length]
+            syllable = text[start:start + length]
+            if rest is None or syllable not in PINYIN_SYLLABLES:
+                continue
+            if best[start] is None or len(rest) + 1 < len(best[start]):
+                best[start] = [syllable] + rest
+    return best[0]
+
+
+def segment_pinyin(query):
+    """
+    把用户输入的拼音切分成音节，空格和隔音符号处一定断开；
+    音节数最少的切法优先（同样多时前面的音节尽量长）
+
+    例如 "mifan" -> ['mi', 'fan']，"xi'an" -> ['xi', 'an']，无法完整切分时返回 None
+    """
+    query = unicodedata.normalize('NFKC', query or '').lower()
+    syllables = []
+    for part in _SEPARATOR_PATTERN.split(query.strip()):
+        if not _PINYIN_QUERY_PATTERN.fullmatch(part):
+            return None
+        segmented = _segment_part(part)
+        if segmented is None:
+            return None
+        syllables.extend(segmented)
+    return syllables or None
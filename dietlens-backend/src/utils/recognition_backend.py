@@ -0,0 +1,487 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+import requests
+
+from src.config.config import config
+from src.utils.http_client import create_vision_client, ClientBusyError
+from src.utils.image_preprocess import encode_image_bytes
+
+SYSTEM_PROMPT = "你是一个专业的食物识别助手，能够精确识别图片中的食物，并提供详细的营养成分信息。"
+
+USER_PROMPT = "请识别这张图片中的食物，并提供以下信息：\n1. 食物名称\n2. 大致份量（如1碗、2片等）\n3. 估计重量（克）\n4. 热量（千卡）\n5. 蛋白质（克）\n6. 碳水化合物（克）\n7. 脂肪（克）\n8. 膳食纤维（克）\n9. 识别置信度（0-1之间的小数）\n\n请以JSON格式返回，格式如下：\n{\"foods\": [{\"name\": \"食物名称\", \"amount\": \"份量描述\", \"weight\": 重量, \"calories\": 热量, \"protein\": 蛋白质, \"carbs\": 碳水, \"fat\": 脂肪, \"fiber\": 纤维, \"confidence\": 置信度}]}"
+
+# 结构化输出模式使用的精简提示，字段含义由 schema 约束
+LEAN_SYSTEM_PROMPT = "识别图片中的食物。weight为克，calories为千卡，protein/carbs/fat/fiber为克，confidence为0-1。"
+
+FOOD_NUMBER_FIELDS = ('weight', 'calories', 'protein', 'carbs', 'fat', 'fiber', 'confidence')
+
+FOOD_RESULT_SCHEMA = {
+    "name": "food_recognition",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "foods": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": dict(
+                        {"name": {"type": "string"}, "amount": {"type": "string"}},
+                        **{field: {"type": "number"} for field in FOOD_NUMBER_FIELDS}
+                    ),
+                    "required": ["name", "amount"] + list(FOOD_NUMBER_FIELDS),
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["foods"],
+        "additionalProperties": False
+    }
+}
+
+RESPONSE_MODE_TEXT = 'text'
+RESPONSE_MODE_JSON_SCHEMA = 'json_schema'
+
+
+def parse_food_json(content):
+    """从模型返回的文本中提取食物 JSON，失败时返回包含 error 的字典"""
+    try:
+        # 尝试直接解析整个内容
+        return json.loads(content)
+    except json.JSONDecodeError:
+        pass
+
+    # 如果失败，尝试从文本中提取JSON部分
+    json_match = re.search(r'```json\n(.*?)\n```', content, re.DOTALL)
+    if json_match:
+        json_str = json_match.group(1)
+    else:
+        # 尝试找到 { 和 } 之间的内容
+        json_match = re.search(r'{.*}', content, re.DOTALL)
+        if json_match:
+            json_str = json_match.group(0)
+        else:
+            return {"error": "无法从响应中提取JSON数据"}
+
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        return {"error": "无法解析提取的JSON数据"}
+
+
+def validate_food_result(data):
+    """
+    按 schema 校验并规整识别结果：名称为非空字符串，数值字段转为非负数，置信度限制在 0-1
+
+    Returns:
+        dict: 规整后的 {"foods": [...]}，不符合格式时返回包含 error 的字典
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("foods"), list):
+        return {"error": "识别结果缺少foods数组"}
+
+    foods = []
+    for item in data["foods"]:
+        if not isinstance(item, dict):
+            return {"error": "识别结果中的食物格式不正确"}
+        name = item.get("name")
+        if not isinstance(name, str) or not name.strip():
+            return {"error": "识别结果中的食物缺少名称"}
+
+        food = {"name": name.strip(), "amount": str(item.get("amount") or "")}
+        for field in FOOD_NUMBER_FIELDS:
+            value = item.get(field, 0)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    return {"error": f"识别结果中的 {field} 不是数值"}
+            food[field] = max(value, 0)
+        food["confidence"] = min(food["confidence"], 1)
+        foods.append(food)
+    return {"foods": foods}
+
+
+def parse_structured_result(content):
+    """解析结构化输出模式的响应，不做正则回退"""
+    try:
+        data = json.loads(content)
+    except (TypeError, json.JSONDecodeError):
+        return {"error": "结构化输出不是合法JSON"}
+    return validate_food_result(data)
+
+
+class RecognitionCallStats:
+    """按响应模式统计识别调用次数、解析失败率和 token 用量"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes = {}
+
+    def record(self, mode, parsed, usage=None):
+        usage = usage or {}
+        with self._lock:
+            stats = self._modes.setdefault(mode, {
+                "calls": 0,
+                "parseFailures": 0,
+                "promptTokens": 0,
+                "completionTokens": 0
+            })
+            stats["calls"] += 1
+            if not parsed:
+                stats["parseFailures"] += 1
+            stats["promptTokens"] += usage.get("prompt_tokens") or 0
+            stats["completionTokens"] += usage.get("completion_tokens") or 0
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for mode, stats in self._modes.items():
+                calls = stats["calls"]
+                result[mode] = dict(
+                    stats,
+                    parseFailureRate=round(stats["parseFailures"] / calls, 4) if calls else 0,
+                    avgPromptTokens=round(stats["promptTokens"] / calls, 1) if calls else 0,
+                    avgCompletionTokens=round(stats["completionTokens"] / calls, 1) if calls else 0
+                )
+            return result
+
+
+recognition_call_stats = RecognitionCallStats()
+
+# 记录当前线程最近一次识别调用的 token 用量，供限流按实际用量结算
+_call_usage = threading.local()
+
+
+def pop_call_usage():
+    """返回并清除当前线程最近一次识别调用消耗的 token 总数"""
+    tokens = getattr(_call_usage, 'tokens', 0)
+    _call_usage.tokens = 0
+    return tokens
+
+
+class FoodStreamParser:
+    """
+    增量解析模型流式输出的 {"foods": [...]}，每当 foods 数组中的一个对象完整时立即返回
+
+    只做括号和字符串状态跟踪，不依赖输出是否包裹在 ```json 代码块中
+    """
+
+    def __init__(self):
+        self.text = ''
+        self._pos = 0
+        self._array_start = None  # foods 数组 '[' 之后的位置
+        self._depth = 0  # 相对 foods 数组的嵌套深度
+        self._in_string = False
+        self._escaped = False
+        self._item_start = None
+        self._done = False
+
+    def feed(self, chunk):
+        """追加一段文本，返回新解析出的完整食物对象列表"""
+        self.text += chunk
+        items = []
+
+        if self._array_start is None:
+            match = re.search(r'"foods"\s*:\s*\[', self.text)
+            if not match:
+                return items
+            self._array_start = self._pos = match.end()
+
+        text = self.text
+        while self._pos < len(text) and not self._done:
+            char = text[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0 and char == '{':
+                    self._item_start = self._pos
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    # foods 数组结束
+                    self._done = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._item_start is not None:
+                        try:
+                            items.append(json.loads(text[self._item_start:self._pos + 1]))
+                        except json.JSONDecodeError:
+                            pass
+                        self._item_start = None
+            self._pos += 1
+        return items
+
+
+class RecognitionBackend:
+    """
+    食物识别后端接口，recognize 返回 {"foods": [...]} 或 {"error": "..."}
+
+    上游连接全部占用、排队超时时错误结果带 "busy": True，接口据此返回 503
+    """
+
+    name = 'base'
+    client = None
+
+    def recognize(self, image_data, max_tokens=None):
+        raise NotImplementedError
+
+    def recognize_stream(self, image_data, max_tokens=None):
+        """
+        流式识别，依次产出 ("food", 食物) 事件，最后产出 ("result", 完整结果)
+
+        不支持流式的后端一次性识别后逐条产出
+        """
+        result = self.recognize(image_data, max_tokens=max_tokens)
+        if "error" not in result:
+            for food_item in result.get("foods", []):
+                yield "food", food_item
+        yield "result", result
+
+
+class OpenAIRecognitionBackend(RecognitionBackend):
+    """调用 OpenAI 兼容的 chat/completions 接口（也用于本地桩服务）"""
+
+    name = 'openai'
+
+    def __init__(self, client, model, max_tokens, record_dir=None, response_mode=RESPONSE_MODE_TEXT):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.record_dir = record_dir
+        self.response_mode = response_mode
+
+    def build_payload(self, image_data_url, max_tokens):
+        if self.response_mode == RESPONSE_MODE_JSON_SCHEMA:
+            # 结构化输出：精简提示 + 严格 JSON Schema，模型只能返回符合 schema 的 JSON
+            return {
+                "model": self.model,
+                "messages": [
+                    {
+                        "role": "system",
+                        "content": LEAN_SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "image_url", "image_url": {"url": image_data_url}}
+                        ]
+                    }
+                ],
+                "response_format": {"type": "json_schema", "json_schema": FOOD_RESULT_SCHEMA},
+                "max_tokens": max_tokens
+            }
+
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": USER_PROMPT},
+                        {"type": "image_url", "image_url": {"url": image_data_url}}
+                    ]
+                }
+            ],
+            "max_tokens": max_tokens
+        }
+
+    def recognize(self, image_data, max_tokens=None):
+        # 预处理图片（缩放、去除元数据、重新编码）并转为base64
+        image_data_url, _ = encode_image_bytes(image_data)
+        payload = self.build_payload(image_data_url, max_tokens or self.max_tokens)
+
+        # 发送请求（共享连接池，带超时、重试和熔断）
+        try:
+            response = self.client.post("/chat/completions", payload)
+        except ClientBusyError as e:
+            return {"error": str(e), "busy": True}
+        except requests.RequestException as e:
+            return {"error": f"API请求失败: {str(e)}"}
+
+        if response.status_code != 200:
+            return {"error": f"API请求失败: {response.status_code} - {response.text}"}
+
+        body = response.json()
+        food_data = self.parse_content(body["choices"][0]["message"]["content"], body.get("usage"))
+
+        if self.record_dir and "error" not in food_data:
+            save_fixture(self.record_dir, image_data, food_data)
+        return food_data
+
+    def parse_content(self, content, usage=None):
+        """按响应模式解析模型输出，并记录解析结果和 token 用量"""
+        if self.response_mode == RESPONSE_MODE_JSON_SCHEMA:
+            food_data = parse_structured_result(content)
+        else:
+            food_data = parse_food_json(content or '')
+        recognition_call_stats.record(self.response_mode, "error" not in food_data, usage)
+        if usage:
+            _call_usage.tokens = getattr(_call_usage, 'tokens', 0) + (
+                usage.get("total_tokens") or (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+            )
+        return food_data
+
+    def recognize_stream(self, image_data, max_tokens=None):
+        image_data_url, _ = encode_image_bytes(image_data)
+        payload = self.build_payload(image_data_url, max_tokens or self.max_tokens)
+        payload["stream"] = True
+        # 在最后一个分片中返回 token 用量
+        payload["stream_options"] = {"include_usage": True}
+
+        try:
+            response = self.client.post("/chat/completions", payload, stream=True)
+        except ClientBusyError as e:
+            yield "result", {"error": str(e), "busy": True}
+            return
+        except requests.RequestException as e:
+            yield "result", {"error": f"API请求失败: {str(e)}"}
+            return
+
+        if response.status_code != 200:
+            yield "result", {"error": f"API请求失败: {response.status_code} - {response.text}"}
+            return
+
+        parser = FoodStreamParser()
+        usage = None
+        try:
+            # 上游返回 SSE：每行 data: {chunk}，以 data: [DONE] 结束
+            # 按字节分行后再用 UTF-8 解码（text/* 响应默认按 ISO-8859-1 解码，中文会被错误分行）
+            for raw_line in response.iter_lines():
+                line = raw_line.decode('utf-8')
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    for food_item in parser.feed(delta):
+                        yield "food", food_item
+        except (requests.RequestException, ValueError) as e:
+            yield "result", {"error": f"API流式响应中断: {str(e)}"}
+            return
+        finally:
+            response.close()
+
+        food_data = self.parse_content(parser.text, usage)
+        if self.record_dir and "error" not in food_data:
+            save_fixture(self.record_dir, image_data, food_data)
+        yield "result", food_data
+
+
+def fixture_key(image_data):
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def save_fixture(fixtures_dir, image_data, result):
+    """将识别结果录制为回放用的样例文件"""
+    os.makedirs(fixtures_dir, exist_ok=True)
+    path = os.path.join(fixtures_dir, f"{fixture_key(image_data)}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+class ReplayRecognitionBackend(RecognitionBackend):
+    """
+    按录制的样例回放识别结果，不发起网络请求
+
+    样例目录下每个 <图片SHA-256>.json 对应一张图片的识别结果，
+    没有匹配时使用 default.json（不存在则返回错误）
+    """
+
+    name = 'replay'
+
+    def __init__(self, fixtures_dir):
+        self.fixtures_dir = fixtures_dir
+        self._fixtures = {}
+        self._lock = threading.Lock()
+
+    def _load(self, key):
+        with self._lock:
+            if key in self._fixtures:
+                return self._fixtures[key]
+
+        path = os.path.join(self.fixtures_dir, f"{key}.json")
+        fixture = None
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                fixture = json.load(f)
+
+        with self._lock:
+            self._fixtures[key] = fixture
+        return fixture
+
+    def recognize(self, image_data, max_tokens=None):
+        fixture = self._load(fixture_key(image_data))
+        if fixture is None:
+            fixture = self._load('default')
+        if fixture is None:
+            return {"error": "没有匹配的回放样例"}
+        return json.loads(json.dumps(fixture))
+
+
+def create_recognition_backend(backend_name=None, max_tokens=None):
+    """
+    按配置创建识别后端
+
+    openai: 真实接口；stub: 指向本地桩服务（src/utils/stub_vision_server.py）；replay: 回放录制样例
+    """
+    cfg = config['default']
+    backend_name = backend_name or cfg.RECOGNITION_BACKEND
+    response_mode = cfg.RECOGNITION_RESPONSE_MODE
+    if not max_tokens:
+        max_tokens = cfg.RECOGNITION_SCHEMA_MAX_TOKENS if response_mode == RESPONSE_MODE_JSON_SCHEMA else cfg.RECOGNITION_MAX_TOKENS
+
+    if backend_name == 'replay':
+        return ReplayRecognitionBackend(cfg.RECOGNITION_FIXTURES_DIR)
+
+    base_url = cfg.RECOGNITION_STUB_URL if backend_name == 'stub' else cfg.OPENAI_API_BASE
+    backend = OpenAIRecognitionBackend(
+        client=create_vision_client(base_url),
+        model=cfg.OPENAI_API_MODEL,
+        max_tokens=max_tokens,
+        record_dir=cfg.RECOGNITION_FIXTURES_DIR if cfg.RECOGNITION_RECORD_FIXTURES else None,
+        response_mode=response_mode
+    )
+    backend.name = backend_name
+    return backend
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_recognition_backend():
+    """进程内共享的识别后端"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_recognition_backend()
+    return _backend
+
+
+def set_recognition_backend(backend):
+    """替换进程内的识别后端（压测或离线运行时使用）"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
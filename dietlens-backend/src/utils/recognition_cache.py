@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from src.config.config import config
+
+
+class RecognitionCache:
+    """按图片内容哈希缓存识别结果：进程内 LRU（带过期时间）+ 数据库持久层"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # image_hash -> (expires_at, result)
+        self._lock = threading.Lock()
+        self._stats = {
+            "memoryHits": 0,
+            "dbHits": 0,
+            "misses": 0,
+            "stores": 0
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _remember(self, image_hash, result):
+        with self._lock:
+            self._entries[image_hash] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(image_hash)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, image_hash):
+        """查找缓存的识别结果，未命中返回 None"""
+        with self._lock:
+            entry = self._entries.get(image_hash)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(image_hash)
+                    self._stats["memoryHits"] += 1
+                    return result
+                del self._entries[image_hash]
+
+        # 进程内未命中，查询持久层
+        from src.models import db, RecognitionCacheEntry
+
+        try:
+            row = RecognitionCacheEntry.query.get(image_hash)
+            if row and row.created_at >= datetime.utcnow() - timedelta(seconds=self.ttl):
+                row.hit_count = (row.hit_count or 0) + 1
+                db.session.commit()
+                result = json.loads(row.result)
+                self._remember(image_hash, result)
+                self._count("dbHits")
+                return result
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error in reading recognition cache: {str(e)}")
+
+        self._count("misses")
+        return None
+
+    def set(self, image_hash, result):
+        """写入缓存（进程内和数据库）"""
+        from src.models import db, RecognitionCacheEntry
+
+        self._remember(image_hash, result)
+        self._count("stores")
+
+        try:
+            db.session.merge(RecognitionCacheEntry(
+                image_hash=image_hash,
+                result=json.dumps(result, ensure_ascii=False),
+                created_at=datetime.utcnow(),
+                hit_count=0
+            ))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error in writing recognition cache: {str(e)}")
+
+    def purge_expired(self, batch_size=500, dry_run=False):
+        """
+        删除数据库中超过有效期的缓存（读取时才检查有效期，过期行不会自动删除），返回删除的条数
+
+        按 created_at 分批删除，每批单独提交；需要在 app 上下文中调用
+        """
+        from src.models import db, RecognitionCacheEntry
+
+        expired = RecognitionCacheEntry.created_at < datetime.utcnow() - timedelta(seconds=self.ttl)
+        if dry_run:
+            return RecognitionCacheEntry.query.filter(expired).count()
+
+        deleted = 0
+        while True:
+            hashes = [row.image_hash for row in RecognitionCacheEntry.query.with_entities(RecognitionCacheEntry.image_hash)
+                                                                          .filter(expired).limit(batch_size).all()]
+            if not hashes:
+                break
+            RecognitionCacheEntry.query.filter(RecognitionCacheEntry.image_hash.in_(hashes)) \
+                                       .delete(synchronize_session=False)
+            db.session.commit()
+            deleted += len(hashes)
+            if len(hashes) < batch_size:
+                break
+        return deleted
+
+    def stats(self):
+        """命中统计，upstreamCallsSaved 即节省的上游调用次数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        hits = stats["memoryHits"] + stats["dbHits"]
+        lookups = hits + stats["misses"]
+        stats["upstreamCallsSaved"] = hits
+        stats["hitRate"] = round(hits / lookups, 4) if lookups else 0
+        return stats
+
+
+recognition_cache = RecognitionCache(
+    max_size=config['default'].RECOGNITION_CACHE_SIZE,
+    ttl=config['default'].RECOGNITION_CACHE_TTL
+)
@@ -0,0 +1,108 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from src.config.config import config
+
+
+class RecognitionJobQueue:
+    """有界的食物识别任务队列，识别请求在后台线程池中执行，不占用请求线程"""
+
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recognition')
+        # 排队中和执行中的任务总数不超过 max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def submit(self, app, func, *args, **kwargs):
+        """提交任务，队列已满时返回 False，任务在 app 上下文中执行"""
+        if not self._slots.acquire(blocking=False):
+            return False
+
+        with self._lock:
+            self._pending += 1
+
+        def run():
+            try:
+                with app.app_context():
+                    func(*args, **kwargs)
+            except Exception as e:
+                print(f"Error in recognition job: {str(e)}")
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                self._slots.release()
+
+        try:
+            self._executor.submit(run)
+        except RuntimeError:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            return False
+        return True
+
+    def stats(self):
+        """当前队列使用情况"""
+        with self._lock:
+            pending = self._pending
+        return {
+            "workers": self.max_workers,
+            "capacity": self.max_pending,
+            "pending": pending
+        }
+
+
+def fail_stale_recognitions(timeout=None):
+    """
+    把超过 timeout 秒仍处于排队或识别中的识别记录标记为失败，返回处理的条数
+
+    任务队列只在进程内存中，进程重启或任务线程异常退出后这些记录不会再被处理；
+    启动时和定时清理时调用（需要在 app 上下文中），只处理足够旧的记录，不影响其他进程正在执行的任务
+    """
+    from src.models import db, FoodRecognition
+
+    timeout = config['default'].RECOGNITION_JOB_TIMEOUT if timeout is None else timeout
+    stale = FoodRecognition.query.filter(
+        FoodRecognition.status.in_([FoodRecognition.STATUS_PENDING, FoodRecognition.STATUS_RUNNING]),
+        FoodRecognition.created_at < datetime.utcnow() - timedelta(seconds=timeout)
+    ).update({
+        FoodRecognition.status: FoodRecognition.STATUS_FAILED,
+        FoodRecognition.error_message: "识别任务中断（服务重启或超时），请重新识别"
+    }, synchronize_session=False)
+    db.session.commit()
+    return stale
+
+
+# 所有批量识别请求共享的上游并发上限
+_global_slots = threading.BoundedSemaphore(config['default'].RECOGNITION_GLOBAL_CONCURRENCY)
+
+
+def map_concurrently(app, func, items, max_concurrency):
+    """
+    并发执行 func(item)，同时受单次请求并发数和全局并发数限制
+
+    Returns:
+        list: 与 items 顺序一致的结果，执行出错的位置为异常对象
+    """
+    def run(item):
+        with _global_slots:
+            with app.app_context():
+                try:
+                    return func(item)
+                except Exception as e:
+                    return e
+
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items)))) as executor:
+        return list(executor.map(run, items))
+
+
+recognition_job_queue = RecognitionJobQueue(
+    max_workers=config['default'].RECOGNITION_WORKERS,
+    max_pending=config['default'].RECOGNITION_QUEUE_SIZE
+)
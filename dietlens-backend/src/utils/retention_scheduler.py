@@ -0,0 +1,86 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只在单进程开发环境中使用
+    fcntl = None
+
+from src.utils.database_utils import DatabaseUtils
+
+
+@contextmanager
+def purge_lock(lock_file):
+    """
+    非阻塞地获取清理任务的文件锁，产出是否获取成功
+
+    多个 worker 进程（以及 cron 执行的 purge_recognitions.py）共用同一个锁文件，
+    同一时刻只有一个进程执行清理；持有锁的进程退出后锁自动释放。
+    """
+    if fcntl is None or not lock_file:
+        yield True
+        return
+
+    os.makedirs(os.path.dirname(lock_file) or '.', exist_ok=True)
+    with open(lock_file, 'a') as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class RecognitionPurgeScheduler:
+    """
+    在后台线程中按固定间隔清理过期识别记录
+
+    每个 worker 进程都会启动调度线程，执行前先获取文件锁，没有获取到时跳过本次清理。
+    文件锁只在同一台机器内有效，多台机器部署时应关闭进程内定时清理，改由一台机器的 cron 执行 purge_recognitions.py。
+    """
+
+    def __init__(self, app, db, interval_hours, lock_file=None):
+        self.app = app
+        self.db = db
+        self.interval = interval_hours * 3600
+        self.lock_file = lock_file
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_report = None
+        self.skipped = 0
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name='recognition-purge', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # 启动后先等待一个间隔，避免和服务启动争抢资源
+        while not self._stop.wait(self.interval):
+            try:
+                with purge_lock(self.lock_file) as acquired:
+                    if not acquired:
+                        # 其他进程正在清理
+                        self.skipped += 1
+                        continue
+                    self.last_report = DatabaseUtils.purge_expired_recognitions(self.db, self.app)
+            except Exception as e:
+                print(f"Error in purging recognitions: {str(e)}")
+
+
+def start_purge_scheduler(app, db):
+    """RECOGNITION_PURGE_INTERVAL_HOURS 大于 0 时启动定时清理，返回调度器或 None"""
+    interval_hours = app.config.get('RECOGNITION_PURGE_INTERVAL_HOURS', 0)
+    if not interval_hours or interval_hours <= 0:
+        return None
+    scheduler = RecognitionPurgeScheduler(app, db, interval_hours, app.config.get('RECOGNITION_PURGE_LOCK_FILE'))
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,320 @@
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from array import array
+
+from src.utils.pinyin import segment_pinyin, compact_pinyin_query
+from src.utils.symspell import DeletionDictionary
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 各字段词频的权重（名称命中远比描述命中重要），以及是否额外索引中文单字
+FIELD_WEIGHTS = (
+    ('name', 3.0, True),
+    ('tags', 2.0, True),
+    ('description', 1.0, False)
+)
+
+# 名称拼音（全拼、首字母）的权重，略低于名称本身
+PINYIN_WEIGHT = 2.0
+
+# 英文单词前缀：索引名称和标签中单词的前缀（不少于 PREFIX_MIN_LENGTH 个字母），前缀命中的分数系数
+PREFIX_MIN_LENGTH = 3
+PREFIX_FACTOR = 0.8
+
+# 容错查询：每差一个字符分数乘以的系数、每个查询词最多尝试的替代词数、参与容错的查询词数上限
+FUZZY_PENALTY = 0.5
+FUZZY_MAX_ALTERNATIVES = 8
+FUZZY_MAX_TERMS = 8
+
+# 连续的中日韩文字，或连续的字母数字
+_CJK_RANGES = '\u3400-\u9fff\uf900-\ufaff'
+_TOKEN_PATTERN = re.compile(f'[{_CJK_RANGES}]+|[a-z0-9]+')
+_CJK_PATTERN = re.compile(f'[{_CJK_RANGES}]')
+
+
+def tokenize(text, unigrams=False):
+    """
+    分词：中文按相邻两字切分（二元组），字母数字按整词切分，单个汉字保留为单字
+
+    unigrams=True 时中文片段额外产出每个单字（用于名称和标签），以便单字查询也能命中；
+    查询时不产出单字，长度不少于 2 的中文片段只使用二元组，保证精确度。
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKC', text).lower()
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text):
+        if not _CJK_PATTERN.match(run):
+            tokens.append(run)
+            continue
+        if len(run) == 1:
+            tokens.append(run)
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        if unigrams:
+            tokens.extend(run)
+    return tokens
+
+
+def prefix_tokens(tokens):
+    """英文单词的前缀词（pre: 前缀，不含整词），"app"、"chick" 分别能命中 "apple"、"chicken" """
+    prefixes = []
+    for token in tokens:
+        if _CJK_PATTERN.match(token):
+            continue
+        prefixes.extend('pre:' + token[:i] for i in range(PREFIX_MIN_LENGTH, len(token)))
+    return prefixes
+
+
+def pinyin_tokens(syllables, initials, unigrams=False):
+    """
+    拼音分词：全拼按相邻两个音节组成一个词（py: 前缀），首字母按相邻两个字母（in: 前缀）
+
+    与中文二元组一一对应，"mifan" 和 "mf" 都能命中 "白米饭"；只有一个音节时保留单个音节。
+    """
+    tokens = []
+    if len(syllables) == 1 or unigrams:
+        tokens.extend('py:' + syllable for syllable in syllables)
+    tokens.extend('py:' + syllables[i] + syllables[i + 1] for i in range(len(syllables) - 1))
+    tokens.extend('in:' + initials[i:i + 2] for i in range(len(initials) - 1))
+    return tokens
+
+
+def query_interpretations(query):
+    """
+    查询的几种解读，每种是一组需要全部命中的词：中文/英文原文、全拼、首字母
+
+    拼音只对纯字母输入尝试，例如 "mifan" 同时按英文单词、全拼 mi fan、首字母 m-i-f-a-n 查找。
+    """
+    interpretations = []
+    tokens = tokenize(query)
+    if tokens:
+        interpretations.append(set(tokens))
+    syllables = segment_pinyin(query)
+    if syllables:
+        interpretations.append(set(pinyin_tokens(syllables, '')))
+    initials = compact_pinyin_query(query)
+    if initials and len(initials) >= 2:
+        interpretations.append(set(pinyin_tokens((), initials)))
+    return interpretations
+
+
+class FoodSearchIndex:
+    """
+    食物名称、描述、标签的倒排索引，按 BM25 计算相关性
+
+    每个词对应一组紧凑数组（文档序号、加权词频）；查询时从最短的倒排表开始求交集，
+    耗时只与命中的文档数有关，不随食物库总量增长。新增食物时增量追加，不重建索引。
+    """
+
+    def __init__(self, records=()):
+        self._lock = threading.Lock()
+        self._postings = {}  # 词 -> (array 文档序号, array 加权词频)
+        self._doc_ids = []  # 文档序号 -> food_id
+        self._doc_lengths = array('f')  # 文档序号 -> 加权长度
+        self._doc_index = {}  # food_id -> 当前文档序号
+        self._deleted = set()  # 被替换掉的旧文档序号
+        self._total_length = 0.0
+        # 容错查询用的删除字典，按词的类型分区
+        self._fuzzy_terms = set()
+        self._fuzzy = {
+            'cjk': DeletionDictionary(max_distance=1),
+            'py': DeletionDictionary(max_distance=2),
+            'word': DeletionDictionary(max_distance=2)
+        }
+        for record in records:
+            self._add_locked(record)
+
+    @staticmethod
+    def _field_text(record, field):
+        if field == 'tags':
+            return ' '.join(record.tags)
+        return getattr(record, field) or ''
+
+    def _add_locked(self, record):
+        previous = self._doc_index.get(record.id)
+        if previous is not None:
+            self._deleted.add(previous)
+            self._total_length -= self._doc_lengths[previous]
+
+        term_freqs = {}
+        length = 0.0
+        for field, weight, unigrams in FIELD_WEIGHTS:
+            tokens = tokenize(self._field_text(record, field), unigrams)
+            for token in tokens:
+                term_freqs[token] = term_freqs.get(token, 0.0) + weight
+                length += weight
+            # 名称和标签中的英文单词额外索引前缀，不计入文档长度
+            if unigrams:
+                for token in prefix_tokens(tokens):
+                    term_freqs[token] = term_freqs.get(token, 0.0) + weight
+        syllables = getattr(record, 'pinyin', ())
+        pinyin_terms = pinyin_tokens(syllables, getattr(record, 'initials', ''), unigrams=True)
+        for token in pinyin_terms:
+            term_freqs[token] = term_freqs.get(token, 0.0) + PINYIN_WEIGHT
+            length += PINYIN_WEIGHT
+
+        # 容错词典只收录名称中的二元组和全拼，描述里的词、单字和首字母不参与纠错
+        for token in tokenize(record.name) + pinyin_tokens(syllables, ''):
+            if token not in self._fuzzy_terms:
+                self._fuzzy_terms.add(token)
+                self._register_fuzzy_locked(token)
+
+        doc = len(self._doc_ids)
+        self._doc_ids.append(record.id)
+        self._doc_lengths.append(length)
+        self._doc_index[record.id] = doc
+        self._total_length += length
+        for token, freq in term_freqs.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = (array('I'), array('f'))
+            posting[0].append(doc)
+            posting[1].append(freq)
+
+    def add(self, record):
+        """新增或替换一条食物"""
+        with self._lock:
+            self._add_locked(record)
+
+    def __len__(self):
+        return len(self._doc_index)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "foods": len(self._doc_index),
+                "terms": len(self._postings),
+                "postings": sum(len(docs) for docs, _ in self._postings.values()),
+                "fuzzy": {namespace: dictionary.stats() for namespace, dictionary in self._fuzzy.items()}
+            }
+
+    def search(self, query):
+        """
+        返回 {food_id: BM25 分数}，只包含命中某种解读（原文、全拼或首字母）全部查询词的食物，
+        多种解读都命中时取最高分；英文查询词也可以按前缀命中名称和标签中的单词（分数乘以 PREFIX_FACTOR）
+
+        Returns:
+            dict: 查询为空或没有可用的查询词时返回空字典
+        """
+        results = {}
+        for terms in query_interpretations(query):
+            self._merge(results, self._score([[(term, 1.0)] + self._prefix_alternative(term) for term in terms]))
+        return results
+
+    def fuzzy_search(self, query):
+        """
+        容错查询：每个查询词都可以换成编辑距离 1-2 以内的索引词，每差一个字符分数乘以 FUZZY_PENALTY
+
+        精确查询命中太少时使用；无法切分成拼音的纯字母输入整体按一个全拼词纠错（如 "mifna"）。
+        """
+        interpretations = query_interpretations(query)
+        compact = compact_pinyin_query(query)
+        if compact and len(compact) >= 4 and not segment_pinyin(query):
+            interpretations.append({'py:' + compact})
+
+        results = {}
+        for terms in interpretations:
+            if len(terms) > FUZZY_MAX_TERMS:
+                continue
+            with self._lock:
+                groups = [[(term, 1.0)] + self._prefix_alternative(term) + self._fuzzy_alternatives(term) for term in terms]
+            self._merge(results, self._score(groups))
+        return results
+
+    @staticmethod
+    def _merge(results, scores):
+        for food_id, score in scores.items():
+            if score > results.get(food_id, 0.0):
+                results[food_id] = score
+
+    @staticmethod
+    def _fuzzy_namespace(term):
+        """纠错词典的分区和词本身：中文二元组、拼音、英文单词；首字母和单字不纠错"""
+        if term.startswith('py:'):
+            return 'py', term[3:]
+        if term.startswith('in:'):
+            return None, None
+        if _CJK_PATTERN.match(term):
+            return ('cjk', term) if len(term) == 2 else (None, None)
+        return ('word', term) if len(term) >= 3 else (None, None)
+
+    def _register_fuzzy_locked(self, term):
+        namespace, word = self._fuzzy_namespace(term)
+        if namespace:
+            self._fuzzy[namespace].add(word)
+
+    @staticmethod
+    def _prefix_alternative(term):
+        """英文查询词按前缀匹配的替代词；拼音、首字母和中文词没有"""
+        if term.startswith(('py:', 'in:')) or _CJK_PATTERN.match(term) or len(term) < PREFIX_MIN_LENGTH:
+            return []
+        return [('pre:' + term, PREFIX_FACTOR)]
+
+    def _fuzzy_alternatives(self, term):
+        namespace, word = self._fuzzy_namespace(term)
+        if not namespace:
+            return []
+        prefix = 'py:' if namespace == 'py' else ''
+        # 距离相同的候选优先取出现在更多食物中的词
+        matches = sorted(
+            self._fuzzy[namespace].lookup(word),
+            key=lambda match: (match[1], -len(self._postings[prefix + match[0]][0]))
+        )[:FUZZY_MAX_ALTERNATIVES]
+        return [(prefix + candidate, FUZZY_PENALTY ** distance) for candidate, distance in matches]
+
+    def _score(self, groups):
+        """
+        计算 BM25 分数：groups 中每组是可相互替代的 (词, 分数系数)，每组至少命中一个，
+        同一组命中多个词时取最高分
+        """
+        with self._lock:
+            resolved = []
+            for group in groups:
+                alternatives = [
+                    (posting[0], posting[1], len(posting[0]), factor)
+                    for posting, factor in ((self._postings.get(term), factor) for term, factor in group)
+                    if posting is not None
+                ]
+                if not alternatives:
+                    return {}
+                resolved.append(alternatives)
+            doc_count = len(self._doc_index)
+            avg_length = self._total_length / doc_count if doc_count else 1.0
+            deleted = set(self._deleted)
+            doc_ids = self._doc_ids
+            doc_lengths = self._doc_lengths
+
+        # 追加中的数组只读到取出时的长度；从最短的组开始，其余组与已有候选求交集
+        # （倒排表比候选短时遍历倒排表，否则对候选逐个二分查找）
+        resolved.sort(key=lambda alternatives: sum(size for _, _, size, _ in alternatives))
+        scores = None
+        for alternatives in resolved:
+            group_scores = {}
+            for docs, freqs, size, factor in alternatives:
+                idf = math.log(1 + (doc_count - size + 0.5) / (size + 0.5))
+                if scores is None:
+                    candidates = ((docs[i], freqs[i]) for i in range(size))
+                elif size <= len(scores):
+                    candidates = [(docs[i], freqs[i]) for i in range(size) if docs[i] in scores]
+                else:
+                    candidates = []
+                    for doc in scores:
+                        i = bisect.bisect_left(docs, doc, 0, size)
+                        if i < size and docs[i] == doc:
+                            candidates.append((doc, freqs[i]))
+                for doc, freq in candidates:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[doc] / avg_length)
+                    score = factor * idf * freq * (BM25_K1 + 1) / (freq + norm)
+                    if score > group_scores.get(doc, 0.0):
+                        group_scores[doc] = score
+            scores = {doc: (scores[doc] if scores else 0.0) + score for doc, score in group_scores.items()}
+            if not scores:
+                return {}
+
+        return {doc_ids[doc]: score for doc, score in scores.items() if doc not in deleted}
@@ -0,0 +1,312 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+
+from src.config.config import config
+
+# 上传文件的 URL 前缀，URL 去掉前缀即为存储键
+UPLOAD_URL_PREFIX = '/static/uploads/'
+
+
+class StorageBackend:
+    """上传文件存储后端接口，键形如 recognition/ab/cd/<sha256>.jpg"""
+
+    name = 'base'
+
+    def put(self, key, data):
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def read(self, key):
+        """返回文件内容，不存在时抛出 FileNotFoundError"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """删除文件，返回释放的字节数，不存在时返回 None"""
+        raise NotImplementedError
+
+    def size(self, key):
+        """文件字节数，不存在时返回 None"""
+        raise NotImplementedError
+
+    def mtime(self, key):
+        """文件修改时间戳，不存在时返回 None"""
+        raise NotImplementedError
+
+    def touch(self, key):
+        """把文件修改时间更新为当前时间（重复上传相同内容时调用）"""
+        raise NotImplementedError
+
+    def iter_files(self, prefix):
+        """遍历前缀下的文件，产出 (键, 字节数, 修改时间戳)"""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """文件在本地磁盘上的路径，非磁盘后端返回 None"""
+        return None
+
+
+class LocalDiskStorage(StorageBackend):
+    """本地磁盘存储，键直接对应 root 下的相对路径"""
+
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = root
+
+    def local_path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key, data):
+        path = self.local_path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再原子替换，并发写入同一内容时不会读到半个文件
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def exists(self, key):
+        return os.path.isfile(self.local_path(key))
+
+    def read(self, key):
+        with open(self.local_path(key), 'rb') as f:
+            return f.read()
+
+    def delete(self, key):
+        path = self.local_path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except OSError:
+            return None
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self.local_path(key))
+        except OSError:
+            return None
+
+    def mtime(self, key):
+        try:
+            return os.path.getmtime(self.local_path(key))
+        except OSError:
+            return None
+
+    def touch(self, key):
+        try:
+            os.utime(self.local_path(key))
+        except OSError:
+            pass
+
+    def iter_files(self, prefix):
+        base = self.local_path(prefix)
+        for directory, _, filenames in os.walk(base):
+            for filename in filenames:
+                if filename.startswith('.tmp-'):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                yield key, stat.st_size, stat.st_mtime
+
+
+class MemoryObjectStorage(StorageBackend):
+    """进程内的对象存储替身，接口与对象存储一致，用于本地开发和压测时替换磁盘"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._objects = {}  # 键 -> (内容, 修改时间戳)
+        self._lock = threading.Lock()
+
+    def put(self, key, data):
+        with self._lock:
+            self._objects[key] = (bytes(data), time.time())
+
+    def exists(self, key):
+        with self._lock:
+            return key in self._objects
+
+    def read(self, key):
+        with self._lock:
+            entry = self._objects.get(key)
+        if entry is None:
+            raise FileNotFoundError(key)
+        return entry[0]
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._objects.pop(key, None)
+        return len(entry[0]) if entry else None
+
+    def size(self, key):
+        with self._lock:
+            entry = self._objects.get(key)
+        return len(entry[0]) if entry else None
+
+    def mtime(self, key):
+        with self._lock:
+            entry = self._objects.get(key)
+        return entry[1] if entry else None
+
+    def touch(self, key):
+        with self._lock:
+            entry = self._objects.get(key)
+            if entry:
+                self._objects[key] = (entry[0], time.time())
+
+    def iter_files(self, prefix):
+        with self._lock:
+            items = [(key, entry) for key, entry in self._objects.items() if key.startswith(prefix.rstrip('/') + '/')]
+        for key, (data, mtime) in items:
+            yield key, len(data), mtime
+
+
+class StoredFile:
+    """保存结果：存储键、访问 URL、内容 SHA-256、字节数，以及是否复用了已有文件"""
+
+    __slots__ = ('key', 'url', 'digest', 'size', 'deduplicated')
+
+    def __init__(self, key, url, digest, size, deduplicated):
+        self.key = key
+        self.url = url
+        self.digest = digest
+        self.size = size
+        self.deduplicated = deduplicated
+
+
+class ContentStore:
+    """
+    按内容哈希寻址的上传文件存储
+
+    文件保存为 <namespace>/<哈希前2位>/<哈希3-4位>/<sha256><扩展名>，
+    两级分片使每个目录下的文件数保持在较小规模；相同内容只保存一份。
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def make_key(namespace, digest, extension):
+        extension = extension.lower().lstrip('.')
+        suffix = f".{extension}" if extension else ''
+        return f"{namespace}/{digest[:2]}/{digest[2:4]}/{digest}{suffix}"
+
+    def save(self, namespace, data, extension=''):
+        digest = hashlib.sha256(data).hexdigest()
+        key = self.make_key(namespace, digest, extension)
+        deduplicated = self.backend.exists(key)
+        if deduplicated:
+            # 刷新修改时间，清理任务按修改时间跳过刚被再次上传（记录可能尚未提交）的文件
+            self.backend.touch(key)
+        else:
+            self.backend.put(key, data)
+        return StoredFile(key, self.url_for(key), digest, len(data), deduplicated)
+
+    @staticmethod
+    def upload_extension(filename):
+        """
+        由客户端文件名得到扩展名，不是允许的图片格式时抛出 ValueError
+
+        只接受白名单内的扩展名，不用 secure_filename 处理整个文件名：它会丢掉中文文件名里的点（"早餐.jpg" -> "jpg"）
+        """
+        name = os.path.basename((filename or '').replace('\\', '/'))
+        extension = name.rsplit('.', 1)[1].lower() if '.' in name else ''
+        if extension not in config['default'].ALLOWED_IMAGE_EXTENSIONS:
+            raise ValueError(f"不支持的图片格式: {extension or '无扩展名'}")
+        return extension
+
+    def save_upload(self, namespace, file):
+        """保存上传的文件（FileStorage），扩展名取自原文件名并校验，不允许的格式抛出 ValueError"""
+        extension = self.upload_extension(file.filename)
+        return self.save(namespace, file.read(), extension)
+
+    def read(self, key):
+        return self.backend.read(key)
+
+    def delete(self, key, min_age=None):
+        """
+        删除文件，返回释放的字节数；文件不存在，或指定 min_age 且文件在 min_age 秒内被写入或重复上传时返回 None
+
+        相同内容的上传共用一个文件，新上传的记录提交前文件看起来没有被引用，清理时需要留出宽限期
+        """
+        if min_age:
+            mtime = self.backend.mtime(key)
+            if mtime is not None and time.time() - mtime < min_age:
+                return None
+        return self.backend.delete(key)
+
+    def iter_files(self, namespace):
+        return self.backend.iter_files(namespace)
+
+    @staticmethod
+    def url_for(key):
+        return f"{UPLOAD_URL_PREFIX}{key}"
+
+    @staticmethod
+    def key_from_url(url):
+        """由访问 URL 直接得到存储键，不访问存储"""
+        if not url or not url.startswith(UPLOAD_URL_PREFIX):
+            return None
+        key = url[len(UPLOAD_URL_PREFIX):]
+        # 拒绝路径穿越
+        if not key or key.startswith('/') or '..' in key.split('/'):
+            return None
+        return key
+
+    @staticmethod
+    def digest_from_key(key):
+        """内容寻址的键中包含 SHA-256，旧的按文件名保存的键返回 None"""
+        filename = key.rsplit('/', 1)[-1].split('.', 1)[0]
+        if len(filename) == 64 and all(char in '0123456789abcdef' for char in filename):
+            return filename
+        return None
+
+    def open(self, key):
+        """以文件对象形式读取，供图片处理使用"""
+        return io.BytesIO(self.read(key))
+
+
+def create_storage_backend(backend_name=None):
+    """按配置创建存储后端：local（本地磁盘）或 memory（进程内对象存储替身）"""
+    backend_name = backend_name or config['default'].STORAGE_BACKEND
+    if backend_name == 'memory':
+        return MemoryObjectStorage()
+    return LocalDiskStorage(config['default'].UPLOAD_FOLDER)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_content_store():
+    """进程内共享的上传文件存储"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ContentStore(create_storage_backend())
+    return _store
+
+
+def set_content_store(store):
+    """替换进程内的上传文件存储"""
+    global _store
+    with _store_lock:
+        _store = store
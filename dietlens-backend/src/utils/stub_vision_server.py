@@ -0,0 +1,225 @@
+"""
+本地视觉识别桩服务，模拟 OpenAI chat/completions 接口，用于离线压测整条识别链路
+
+用法（在 dietlens-backend 目录下）:
+    python -m src.utils.stub_vision_server --port 8089 --latency-ms 800 --jitter-ms 400 --failure-rate 0.05
+
+然后设置 RECOGNITION_BACKEND=stub（RECOGNITION_STUB_URL 默认为 http://127.0.0.1:8089/v1）启动后端。
+相同图片总是返回相同结果；延迟和故障按 --seed 生成，可复现。
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FOOD_DATA_PATH = os.path.join(os.path.dirname(__file__), 'food_data.json')
+
+# 流式响应：首包前的延迟占比和每个分片的字符数
+STREAM_FIRST_CHUNK_RATIO = 0.2
+STREAM_CHUNK_CHARS = 16
+
+
+def load_foods():
+    with open(FOOD_DATA_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def stub_recognition(image_key, foods):
+    """根据图片内容确定性地生成识别结果"""
+    rng = random.Random(image_key)
+    items = []
+    for food in rng.sample(foods, rng.randint(1, 3)):
+        weight = rng.choice([50, 100, 150, 200, 250])
+        ratio = weight / 100
+        nutrition = food["nutrition"]
+        items.append({
+            "name": food["name"],
+            "amount": f"{weight}克",
+            "weight": weight,
+            "calories": round(nutrition["calories"] * ratio, 1),
+            "protein": round(nutrition["protein"] * ratio, 1),
+            "carbs": round(nutrition["carbs"] * ratio, 1),
+            "fat": round(nutrition["fat"] * ratio, 1),
+            "fiber": round((nutrition.get("fiber") or 0) * ratio, 1),
+            "confidence": round(rng.uniform(0.6, 0.99), 2)
+        })
+    return {"foods": items}
+
+
+def estimate_usage(payload, content):
+    """粗略估算 token 用量：文本约 4 个字符 1 个 token，每张图片按 85 个 token 计"""
+    prompt_tokens = 0
+    for message in payload.get("messages", []):
+        parts = message.get("content")
+        if isinstance(parts, str):
+            parts = [{"type": "text", "text": parts}]
+        for part in parts or []:
+            if part.get("type") == "image_url":
+                prompt_tokens += 85
+            else:
+                prompt_tokens += len(part.get("text", "")) // 4 + 1
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+def image_key_from_payload(payload):
+    """取请求中的图片 data URL 作为结果的随机种子"""
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "image_url":
+                    return hashlib.sha256(part["image_url"]["url"].encode('utf-8')).hexdigest()
+    return "no-image"
+
+
+class StubVisionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0, jitter_ms=0, failure_rate=0.0,
+                 rate_limit_rate=0.0, seed=0):
+        super().__init__(address, StubVisionHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.foods = load_foods()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.request_count = 0
+
+    def next_behaviour(self):
+        """返回 (延迟秒数, 注入的状态码或 None)"""
+        with self._lock:
+            self.request_count += 1
+            delay = (self.latency_ms + self._rng.uniform(0, self.jitter_ms)) / 1000
+            roll = self._rng.random()
+        if roll < self.failure_rate:
+            return delay, 503
+        if roll < self.failure_rate + self.rate_limit_rate:
+            return delay, 429
+        return delay, None
+
+
+class StubVisionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(self, content, duration, usage=None):
+        """按 OpenAI 流式格式（SSE + chunked）分片返回内容"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        interval = duration / max(len(pieces), 1)
+        for piece in pieces:
+            chunk = {
+                "id": f"stub-{self.server.request_count}",
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+            }
+            self._send_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            time.sleep(interval)
+        if usage:
+            chunk = {"id": f"stub-{self.server.request_count}", "object": "chat.completion.chunk", "choices": [], "usage": usage}
+            self._send_chunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        self._send_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+
+        if not self.path.endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        delay, status = self.server.next_behaviour()
+        stream = bool(payload.get("stream")) and status is None
+        # 流式请求只在首包前等待一部分延迟，其余延迟分摊到各个分片
+        time.sleep(delay * STREAM_FIRST_CHUNK_RATIO if stream else delay)
+
+        if status == 429:
+            self._send_json(429, {"error": {"message": "rate limited"}}, headers={"Retry-After": "1"})
+            return
+        if status:
+            self._send_json(status, {"error": {"message": "injected failure"}})
+            return
+
+        result = stub_recognition(image_key_from_payload(payload), self.server.foods)
+        content = json.dumps(result, ensure_ascii=False)
+        usage = estimate_usage(payload, content)
+        if stream:
+            include_usage = (payload.get("stream_options") or {}).get("include_usage")
+            self._send_stream(content, delay * (1 - STREAM_FIRST_CHUNK_RATIO), usage if include_usage else None)
+            return
+        self._send_json(200, {
+            "id": f"stub-{self.server.request_count}",
+            "object": "chat.completion",
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DietLens 本地视觉识别桩服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=0, help='每个请求的基础延迟（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='在基础延迟上叠加的随机延迟上限（毫秒）')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='返回 503 的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='返回 429 的比例')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = StubVisionServer(
+        (args.host, args.port),
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed
+    )
+    print(f"Stub vision server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
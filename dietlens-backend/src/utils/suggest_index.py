@@ -0,0 +1,189 @@
+import bisect
+import heapq
+import sys
+import threading
+from array import array
+
+from src.utils.food_matcher import FOOD_NAME_ALIASES, normalize_name
+from src.utils.pinyin import name_pinyin, pinyin_initials
+
+# 每个前缀最多返回的建议数
+SUGGEST_MAX_LIMIT = 20
+
+# 不超过该长度的前缀预先算好 top-k，更长的前缀命中范围通常很小，查询时再排
+PRECOMPUTED_PREFIX_LENGTH = 2
+
+# 命中范围超过该条数的长前缀，排好的结果缓存起来（按条数上限淘汰）
+MEMO_MIN_RANGE = 256
+MEMO_MAX_ENTRIES = 4096
+
+# 估算内存时每个排好序的结果元组（排序键, 食物序号, 来源）的字节数
+_RANKED_ITEM_BYTES = 72
+
+# 建议的来源，同一食物经多个来源命中时取靠前的来源
+MATCH_KINDS = ('name', 'pinyin', 'initials', 'alias')
+
+
+class FoodSuggestIndex:
+    """
+    输入联想用的前缀索引：名称、别名、全拼、拼音首字母排成一个有序数组，按前缀二分查找
+
+    短前缀（命中范围大）的 top-k 预先算好，长前缀只在很小的范围内按人气取前 k 个；
+    新增食物时二分插入，并更新受影响前缀的 top-k。
+    """
+
+    def __init__(self, records=()):
+        self._lock = threading.Lock()
+        self._keys = []  # 有序的匹配键
+        self._entries = array('I')  # 与 _keys 对应：食物序号
+        self._kinds = array('B')  # 与 _keys 对应：来源（MATCH_KINDS 下标）
+        self._food_ids = []  # 食物序号 -> food_id
+        self._ranks = []  # 食物序号 -> 排序键（人气降序、名称升序）
+        self._food_index = {}  # food_id -> 最新的食物序号
+        self._names = {}  # 标准化名称 -> 食物序号列表，用于别名
+        self._top = {}  # 短前缀 -> [(排序键, 食物序号, 来源)]，已排好序
+        self._memo = {}  # 长前缀 -> 排好的结果
+
+        rows = []
+        for record in records:
+            rows.extend(self._register(record))
+        rows.extend(self._alias_rows())
+        rows.sort()
+        self._keys = [key for key, _, _ in rows]
+        self._entries = array('I', (food for _, food, _ in rows))
+        self._kinds = array('B', (kind for _, _, kind in rows))
+
+        # 短前缀的 top-k：先按前缀分组（同一食物只保留一条），再各取前 k 个
+        groups = {}
+        for key, food, kind in rows:
+            for length in range(1, min(PRECOMPUTED_PREFIX_LENGTH, len(key)) + 1):
+                group = groups.setdefault(key[:length], {})
+                if food not in group or kind < group[food][2]:
+                    group[food] = (self._ranks[food], food, kind)
+        self._top = {prefix: heapq.nsmallest(SUGGEST_MAX_LIMIT, group.values()) for prefix, group in groups.items()}
+
+    def _register(self, record):
+        """登记一条食物，返回它的 (键, 食物序号, 来源) 列表"""
+        food = len(self._food_ids)
+        self._food_ids.append(record.id)
+        self._ranks.append((-record.popularity, record.name))
+        self._food_index[record.id] = food
+
+        normalized = normalize_name(record.name)
+        self._names.setdefault(normalized, []).append(food)
+        rows = []
+        for kind, key in enumerate((normalized, ''.join(record.pinyin), record.initials)):
+            if key:
+                rows.append((key, food, kind))
+        return rows
+
+    def _alias_rows(self, foods=None):
+        """别名的中文、全拼和首字母都指向标准名称对应的食物；foods 为 None 时处理全部食物"""
+        rows = []
+        kind = MATCH_KINDS.index('alias')
+        for alias, name in FOOD_NAME_ALIASES.items():
+            targets = self._names.get(normalize_name(name), ())
+            if foods is not None:
+                targets = [food for food in targets if food in foods]
+            if not targets:
+                continue
+            syllables = name_pinyin(alias)
+            for key in {normalize_name(alias), ''.join(syllables), pinyin_initials(syllables)}:
+                if key:
+                    rows.extend((key, food, kind) for food in targets)
+        return rows
+
+    def _update_top(self, key, food, kind):
+        for length in range(1, min(PRECOMPUTED_PREFIX_LENGTH, len(key)) + 1):
+            top = self._top.setdefault(key[:length], [])
+            if any(existing == food and existing_kind <= kind for _, existing, existing_kind in top):
+                continue
+            # 去掉同一食物的旧条目（被替换的旧序号，或来源靠后的条目）
+            food_id = self._food_ids[food]
+            top[:] = [item for item in top if self._food_ids[item[1]] != food_id]
+            item = (self._ranks[food], food, kind)
+            if len(top) < SUGGEST_MAX_LIMIT:
+                bisect.insort(top, item)
+            elif item < top[-1]:
+                bisect.insort(top, item)
+                top.pop()
+
+    def add(self, record):
+        """新增或替换一条食物（替换时旧条目留在数组中，查询时按最新序号过滤）"""
+        with self._lock:
+            rows = self._register(record)
+            rows.extend(self._alias_rows({self._food_index[record.id]}))
+            for key, food, kind in rows:
+                index = bisect.bisect_right(self._keys, key)
+                self._keys.insert(index, key)
+                self._entries.insert(index, food)
+                self._kinds.insert(index, kind)
+                self._update_top(key, food, kind)
+            self._memo.clear()
+
+    def _live(self, food):
+        return self._food_index.get(self._food_ids[food]) == food
+
+    def suggest(self, prefix, limit=10):
+        """
+        按前缀返回人气最高的食物
+
+        Returns:
+            list: [(food_id, 来源)]，来源为 name / alias / pinyin / initials
+        """
+        prefix = normalize_name(prefix)
+        limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+        if not prefix:
+            return []
+
+        with self._lock:
+            if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+                ranked = self._top.get(prefix, [])
+            else:
+                ranked = self._memo.get(prefix)
+                if ranked is None:
+                    ranked = self._rank_range(prefix)
+
+            results = []
+            for _, food, kind in ranked:
+                if self._live(food):
+                    results.append((self._food_ids[food], MATCH_KINDS[kind]))
+                    if len(results) >= limit:
+                        break
+            return results
+
+    def _rank_range(self, prefix):
+        start = bisect.bisect_left(self._keys, prefix)
+        # 前缀范围的上界：前缀后接一个最大字符
+        end = bisect.bisect_left(self._keys, prefix + '\U0010ffff', start)
+        best = {}
+        for i in range(start, end):
+            food = self._entries[i]
+            kind = self._kinds[i]
+            if (food not in best or kind < best[food][2]) and self._live(food):
+                best[food] = (self._ranks[food], food, kind)
+        ranked = heapq.nsmallest(SUGGEST_MAX_LIMIT, best.values())
+        if end - start >= MEMO_MIN_RANGE:
+            if len(self._memo) >= MEMO_MAX_ENTRIES:
+                self._memo.pop(next(iter(self._memo)))
+            self._memo[prefix] = ranked
+        return ranked
+
+    def stats(self):
+        """条目数和大致内存占用（字节）"""
+        with self._lock:
+            keys_bytes = sys.getsizeof(self._keys) + sum(sys.getsizeof(key) for key in self._keys)
+            arrays_bytes = sys.getsizeof(self._entries) + sys.getsizeof(self._kinds)
+            foods_bytes = sys.getsizeof(self._food_ids) + sys.getsizeof(self._ranks) + sys.getsizeof(self._food_index) \
+                + sum(sys.getsizeof(rank) for rank in self._ranks)
+            top_bytes = sys.getsizeof(self._top) + sum(
+                sys.getsizeof(prefix) + sys.getsizeof(top) + len(top) * _RANKED_ITEM_BYTES for prefix, top in self._top.items()
+            )
+            memo_bytes = sys.getsizeof(self._memo) + sum(len(ranked) * _RANKED_ITEM_BYTES for ranked in self._memo.values())
+            return {
+                "entries": len(self._keys),
+                "foods": len(self._food_index),
+                "precomputedPrefixes": len(self._top),
+                "memoizedPrefixes": len(self._memo),
+                "memoryBytes": keys_bytes + arrays_bytes + foods_bytes + top_bytes + memo_bytes
+            }
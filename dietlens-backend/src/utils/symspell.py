@@ -0,0 +1,106 @@
+def edit_distance(a, b, max_distance):
+    """
+    编辑距离（相邻两字符交换算一次编辑，如 "mifna" 与 "mifan" 距离为 1），
+    确定超过 max_distance 时提前返回 max_distance + 1，否则可能返回更大的实际距离
+    """
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            cost = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            )
+            if before_previous is not None and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, before_previous[j - 2] + 1)
+            current.append(cost)
+        if min(current) > max_distance:
+            return max_distance + 1
+        before_previous, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word, max_distance):
+    """word 删除不超过 max_distance 个字符得到的全部字符串（含自身）"""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+class DeletionDictionary:
+    """
+    SymSpell 风格的删除字典：词典中每个词预先生成删除若干字符后的变体，
+    查询词同样生成删除变体，两边变体相同的词即为候选，再用编辑距离校验
+
+    只对前 prefix_length 个字符生成变体，词条和查询的开销都有上限。
+    """
+
+    def __init__(self, max_distance, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._deletes = {}  # 删除变体 -> 词，或多个词的列表
+        self._words = 0
+
+    def distance_limit(self, word):
+        """允许的编辑距离：7 个字符以内的词最多 1，更长的词最多 max_distance"""
+        return min(self.max_distance, 1 if len(word) <= 7 else 2)
+
+    def add(self, word):
+        self._words += 1
+        for variant in _deletes(word[:self.prefix_length], self.distance_limit(word)):
+            existing = self._deletes.get(variant)
+            if existing is None:
+                self._deletes[variant] = word
+            elif isinstance(existing, list):
+                existing.append(word)
+            else:
+                self._deletes[variant] = [existing, word]
+
+    def lookup(self, word):
+        """
+        查找编辑距离在允许范围内的词（不含 word 自身）
+
+        Returns:
+            list: [(词, 编辑距离)]，按编辑距离升序
+        """
+        limit = self.distance_limit(word)
+        candidates = set()
+        for variant in _deletes(word[:self.prefix_length], limit):
+            existing = self._deletes.get(variant)
+            if existing is None:
+                continue
+            if isinstance(existing, list):
+                candidates.update(existing)
+            else:
+                candidates.add(existing)
+        candidates.discard(word)
+
+        matches = []
+        for candidate in candidates:
+            allowed = min(limit, self.distance_limit(candidate))
+            # 等长且只有一个位置不同的两个词编辑距离为 1，不必计算完整的编辑距离
+            distance = sum(a != b for a, b in zip(word, candidate)) if len(candidate) == len(word) else None
+            if distance is None or distance > 1:
+                distance = edit_distance(word, candidate, allowed)
+            if distance <= allowed:
+                matches.append((candidate, distance))
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+    def __len__(self):
+        return self._words
+
+    def stats(self):
+        return {
+            "words": self._words,
+            "variants": len(self._deletes)
+        }
@@ -0,0 +1,193 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from src.config.config import config
+
+
+class LimitExceeded(Exception):
+    """超过用户并发或 token 预算限制"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _UserState:
+    __slots__ = ('in_flight', 'charges', 'charged_tokens')
+
+    def __init__(self):
+        self.in_flight = 0
+        self.charges = deque()  # [时间, token 数, 未结算的识别次数]
+        self.charged_tokens = 0
+
+
+class UserRecognitionLimiter:
+    """
+    按用户限制识别请求：同时进行中的识别数上限 + 滑动窗口内的 token 预算
+
+    请求进入时按预估 token 预扣预算，调用结束后按实际用量修正预扣记录（命中缓存时退还），
+    修正在原记录上进行，退还的额度不会比对应的预扣更晚过期；
+    超限时抛出 LimitExceeded，只做内存计数，拒绝的开销很小
+    """
+
+    def __init__(self, max_in_flight, token_budget, window_seconds, estimated_tokens, max_users=10000):
+        self.max_in_flight = max_in_flight
+        self.token_budget = token_budget
+        self.window = window_seconds
+        self.estimated_tokens = estimated_tokens
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # user_id -> _UserState，按最近使用排序
+        self._rejected = {"concurrency": 0, "budget": 0}
+
+    def _state(self, user_id):
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState()
+            # 淘汰最久未使用且没有进行中请求的用户
+            while len(self._users) > self.max_users:
+                oldest = next(iter(self._users.values()))
+                if oldest.in_flight:
+                    break
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    def _expire(self, state, now):
+        while state.charges and now - state.charges[0][0] >= self.window:
+            state.charged_tokens -= state.charges.popleft()[1]
+
+    def _budget_retry_after(self, state, needed, now):
+        """预算释放出 needed 个 token 需要等待的秒数"""
+        freed = 0
+        over = state.charged_tokens + needed - self.token_budget
+        for charged_at, tokens, _ in state.charges:
+            freed += tokens
+            if freed >= over:
+                return max(self.window - (now - charged_at), 0)
+        return self.window
+
+    def acquire(self, user_id, count=1, calls=None, partial=False):
+        """
+        为用户占用 count 个识别名额并按 calls 次识别预扣预算，返回实际占用的名额数，超限时抛出 LimitExceeded
+
+        partial 为 True 时名额不足也不拒绝，按剩余名额（至少 1 个）占用
+        """
+        calls = calls or count
+        estimate = self.estimated_tokens * calls
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(user_id)
+
+            available = self.max_in_flight - state.in_flight
+            if partial and available >= 1:
+                count = min(count, available)
+            if count > available:
+                self._rejected["concurrency"] += 1
+                # 正在进行的识别通常数秒内结束
+                raise LimitExceeded("concurrency", 1)
+
+            self._expire(state, now)
+            if self.token_budget and state.charged_tokens + estimate > self.token_budget:
+                self._rejected["budget"] += 1
+                raise LimitExceeded("budget", math.ceil(self._budget_retry_after(state, estimate, now)))
+
+            state.in_flight += count
+            if estimate:
+                state.charges.append([now, estimate, calls])
+                state.charged_tokens += estimate
+        return count
+
+    def settle(self, user_id, actual_tokens, count=1):
+        """
+        按 count 次识别的实际 token 用量修正预扣的预算
+
+        差额记在最早的未结算预扣记录上；对应记录已过期时只把实际用量记在当前时间
+        """
+        if self.estimated_tokens == 0 and not actual_tokens:
+            return
+        now = time.monotonic()
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                return
+            self._expire(state, now)
+
+            matched = []
+            remaining = count
+            for entry in state.charges:
+                if remaining <= 0:
+                    break
+                if entry[2] > 0:
+                    calls = min(entry[2], remaining)
+                    entry[2] -= calls
+                    remaining -= calls
+                    matched.append(entry)
+
+            # 匹配到的识别按实际用量与预扣之差修正原记录，不会减到负数
+            settled = count - remaining
+            settled_tokens = round(actual_tokens * settled / count) if count else 0
+            delta = settled_tokens - self.estimated_tokens * settled
+            for entry in matched:
+                if delta >= 0:
+                    entry[1] += delta
+                    state.charged_tokens += delta
+                    break
+                refund = min(-delta, entry[1])
+                entry[1] -= refund
+                state.charged_tokens -= refund
+                delta += refund
+                if not delta:
+                    break
+
+            # 预扣记录已过期的识别，实际用量记在当前时间
+            extra = actual_tokens - settled_tokens
+            if extra > 0:
+                state.charges.append([now, extra, 0])
+                state.charged_tokens += extra
+
+    def release(self, user_id, count=1):
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is not None:
+                state.in_flight = max(state.in_flight - count, 0)
+
+    def usage(self, user_id):
+        """用户当前的并发数和窗口内 token 用量"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._users.get(user_id)
+            in_flight, used = 0, 0
+            if state is not None:
+                self._expire(state, now)
+                in_flight, used = state.in_flight, max(state.charged_tokens, 0)
+        return {
+            "inFlight": in_flight,
+            "maxInFlight": self.max_in_flight,
+            "tokensUsed": used,
+            "tokenBudget": self.token_budget,
+            "windowSeconds": self.window
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "trackedUsers": len(self._users),
+                "inFlight": sum(state.in_flight for state in self._users.values()),
+                "maxInFlightPerUser": self.max_in_flight,
+                "tokenBudget": self.token_budget,
+                "windowSeconds": self.window,
+                "rejected": dict(self._rejected)
+            }
+
+
+user_recognition_limiter = UserRecognitionLimiter(
+    max_in_flight=config['default'].RECOGNITION_USER_MAX_IN_FLIGHT,
+    token_budget=config['default'].RECOGNITION_USER_TOKEN_BUDGET,
+    window_seconds=config['default'].RECOGNITION_USER_BUDGET_WINDOW,
+    estimated_tokens=config['default'].RECOGNITION_ESTIMATED_TOKENS
+)
@@ -0,0 +1,55 @@
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from src.config.config import config
+from src.models import db, User
+from src.routes import food_recognition_bp, food_search_bp
+from src.utils.storage import ContentStore, MemoryObjectStorage, set_content_store
+
+
+@pytest.fixture
+def app():
+    """使用内存 SQLite 的应用，只注册测试用到的蓝图，并创建一个测试用户"""
+    app = Flask(__name__)
+    app.config.from_object(config['testing'])
+    db.init_app(app)
+    app.register_blueprint(food_recognition_bp, url_prefix='/api/food-recognition')
+    app.register_blueprint(food_search_bp, url_prefix='/api/food-search')
+    set_content_store(ContentStore(MemoryObjectStorage()))
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id='user_test001', username='testuser', email='test@example.com',
+                            password_hash='x', join_date=datetime.utcnow()))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@contextmanager
+def count_queries(engine):
+    """统计代码块内执行的 SQL 语句，产出语句列表"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,72 @@
+from src.models import db, Food, FoodCategory
+from src.utils.food_catalog import FoodCatalog, bump_catalog_version
+
+
+def add_food(food_id, name):
+    db.session.add(Food(id=food_id, name=name, category='staple', category_name='主食'))
+    bump_catalog_version(db.session)
+    db.session.commit()
+
+
+def make_catalog():
+    db.session.add(FoodCategory(id='staple', name='主食'))
+    db.session.commit()
+    add_food('food_1', '白米饭')
+    add_food('food_2', '馒头')
+    catalog = FoodCatalog(check_interval=3600)
+    catalog.warm()
+    return catalog
+
+
+def test_new_foods_from_other_workers_are_patched_in(app):
+    catalog = make_catalog()
+    add_food('food_3', '花卷')
+
+    snapshot = catalog.snapshot(force_check=True)
+    assert 'food_3' in snapshot.foods
+    assert catalog.stats()['loads'] == 1
+    assert catalog.stats()['patches'] == 1
+
+
+def test_deleted_foods_trigger_a_full_reload(app):
+    catalog = make_catalog()
+    Food.query.filter_by(id='food_2').delete()
+    bump_catalog_version(db.session)
+    db.session.commit()
+
+    snapshot = catalog.snapshot(force_check=True)
+    assert set(snapshot.foods) == {'food_1'}
+    assert catalog.stats()['loads'] == 2
+
+
+def test_edited_foods_trigger_a_full_reload(app):
+    catalog = make_catalog()
+    Food.query.filter_by(id='food_1').update({Food.name: '糙米饭'})
+    bump_catalog_version(db.session)
+    db.session.commit()
+
+    snapshot = catalog.snapshot(force_check=True)
+    assert snapshot.foods['food_1'].name == '糙米饭'
+    assert catalog.stats()['loads'] == 2
+
+
+def test_custom_food_is_created_when_the_cache_update_fails(app, client, monkeypatch):
+    from src.utils.food_catalog import food_catalog
+
+    catalog = make_catalog()
+    monkeypatch.setattr(food_catalog, '_snapshot', catalog._snapshot)
+
+    def fail_put(record, version):
+        raise RuntimeError('cache update failed')
+
+    monkeypatch.setattr(food_catalog, 'put', fail_put)
+    response = client.post('/api/food-search/custom', data={
+        'name': '杂粮饭', 'category': 'staple', 'calories': '120',
+        'servingSize': '1碗', 'servingWeight': '150', 'userId': 'user_test001'
+    })
+    body = response.get_json()
+
+    assert body['status'] == 201
+    # 缓存被丢弃，下次访问整体重新加载并包含新食物
+    assert food_catalog._snapshot is None
+    assert body['data']['id'] in food_catalog.snapshot().foods
@@ -0,0 +1,57 @@
+import pytest
+
+from src.models import db, Food
+from src.utils.food_matcher import FoodNameIndex, similarity
+
+
+@pytest.mark.parametrize('query, candidate', [
+    ('红烧肉', '红烧鱼'),
+    ('牛肉面', '牛肉饭'),
+])
+def test_short_names_differing_in_one_character_do_not_match(query, candidate):
+    assert similarity(query, candidate) < 0.6
+
+
+def test_suffix_keeps_the_head_noun():
+    # "清炒西兰花" 仍是西兰花，"鸡蛋饼" 不是鸡蛋
+    assert similarity('清炒西兰花', '西兰花') > similarity('鸡蛋饼', '鸡蛋')
+
+
+@pytest.fixture
+def index(app):
+    for food_id, name in [('egg', '鸡蛋'), ('pork', '红烧肉'), ('rice', '白米饭'), ('broccoli', '西兰花')]:
+        db.session.add(Food(id=food_id, name=name, category='staple'))
+    db.session.commit()
+    return FoodNameIndex(min_score=0.6, refresh_interval=3600, confirm_score=0.9)
+
+
+def test_exact_and_alias_matches_are_confirmed(index):
+    assert index.confirmed(index.match('鸡蛋')) == 'egg'
+    assert index.confirmed(index.match('米饭')) == 'rice'
+
+
+def test_low_score_matches_are_only_suggestions(index):
+    match = index.match('鸡蛋饼')
+    assert index.confirmed(match) is None
+    assert index.suggestion(match) == {"id": "egg", "name": "鸡蛋", "score": match[1]}
+    assert index.match('红烧鱼') is None
+
+
+def test_save_to_diary_returns_suggestions_instead_of_saving(client, index, monkeypatch):
+    from src.models import FoodRecognition, RecognizedFood
+    from src.routes import food_recognition
+
+    monkeypatch.setattr(food_recognition, 'food_name_index', index)
+    recognition = FoodRecognition(user_id='user_test001', image_url='/static/uploads/recognition/x.jpg')
+    db.session.add(recognition)
+    db.session.add(RecognizedFood(recognition_id=recognition.id, name='鸡蛋饼', calories=200))
+    db.session.commit()
+
+    response = client.post('/api/food-recognition/save-to-diary', json={
+        'userId': 'user_test001', 'recognitionId': recognition.id, 'date': '2024-01-01', 'mealType': 'breakfast'
+    })
+    data = response.get_json()
+    assert response.status_code == 409
+    assert data['data']['unmatchedFoods'] == ['鸡蛋饼']
+    assert data['data']['suggestions']['鸡蛋饼']['id'] == 'egg'
+    assert not db.session.get(FoodRecognition, recognition.id).saved_to_diary
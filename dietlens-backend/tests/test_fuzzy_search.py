@@ -0,0 +1,52 @@
+import pytest
+
+from src.models import db, Food, FoodCategory, FoodNutrition
+from src.utils.food_catalog import food_catalog
+from src.utils.search_index import FoodSearchIndex
+from src.utils.symspell import DeletionDictionary, edit_distance
+from tests.test_search_index import make_record
+
+
+def test_edit_distance_counts_a_transposition_once():
+    assert edit_distance('mifna', 'mifan', 2) == 1
+    assert edit_distance('mifan', 'mantou', 2) > 2
+
+
+def test_deletion_dictionary_finds_transposed_word():
+    dictionary = DeletionDictionary(max_distance=2)
+    dictionary.add('mifan')
+    assert dictionary.lookup('mifna') == [('mifan', 1)]
+
+
+def test_fuzzy_search_corrects_transposed_pinyin():
+    index = FoodSearchIndex([make_record('rice', '白米饭'), make_record('bun', '馒头')])
+    assert index.search('mifna') == {}
+    assert set(index.fuzzy_search('mifna')) == {'rice'}
+
+
+@pytest.fixture
+def foods(app, monkeypatch):
+    """
+    主食分类下一条精确命中（炒米饭）和两条只能容错命中的食物（米粉）；
+    其他分类里的大量米饭使"米饭"的 IDF 很低，容错命中的原始分数反而更高
+    """
+    db.session.add(FoodCategory(id='staple', name='主食'))
+    db.session.add(FoodCategory(id='set_meal', name='套餐'))
+    foods = [('fried_rice', '炒米饭', 'staple', 0), ('rice_noodle', '米粉', 'staple', 100),
+             ('rice_noodle_soup', '米粉汤', 'staple', 90)]
+    foods.extend((f'set_{i}', f'套餐{i}号米饭', 'set_meal', 0) for i in range(20))
+    for food_id, name, category, popularity in foods:
+        db.session.add(Food(id=food_id, name=name, category=category, popularity=popularity))
+        db.session.add(FoodNutrition(food_id=food_id, calories=100, protein=1, carbs=20, fat=1))
+    db.session.commit()
+    # 全局食物库缓存里可能是其他测试的数据
+    monkeypatch.setattr(food_catalog, '_snapshot', None)
+
+
+def test_fuzzy_results_rank_after_exact_results(client, foods):
+    response = client.get('/api/food-search/search?query=米饭&category=staple')
+    data = response.get_json()['data']
+
+    assert data['fuzzy'] is True
+    assert [food['id'] for food in data['foods']][0] == 'fried_rice'
+    assert {food['id'] for food in data['foods']} == {'fried_rice', 'rice_noodle', 'rice_noodle_soup'}
@@ -0,0 +1,47 @@
+import io
+
+import pytest
+
+from src.routes import openai_api
+from src.utils.recognition_backend import RecognitionBackend, get_recognition_backend, set_recognition_backend
+from src.utils.user_limiter import UserRecognitionLimiter
+
+
+class FixedBackend(RecognitionBackend):
+    def recognize(self, image_data, max_tokens=None):
+        return {"foods": [{"name": "白米饭"}]}
+
+
+@pytest.fixture
+def limiter(app, monkeypatch):
+    app.register_blueprint(openai_api.openai_api_bp, url_prefix='/api/openai')
+    limiter = UserRecognitionLimiter(max_in_flight=1, token_budget=1000, window_seconds=3600, estimated_tokens=400)
+    monkeypatch.setattr(openai_api, 'user_recognition_limiter', limiter)
+    previous = get_recognition_backend()
+    set_recognition_backend(FixedBackend())
+    yield limiter
+    set_recognition_backend(previous)
+
+
+def post_image(client, data=b'image', **form):
+    form['image'] = (io.BytesIO(data), 'meal.jpg')
+    return client.post('/api/openai/analyze-food', data=form, content_type='multipart/form-data')
+
+
+def test_empty_image_does_not_reserve_budget(client, limiter):
+    assert post_image(client, data=b'').get_json()['status'] == 400
+    assert limiter.usage('ip:127.0.0.1')['tokensUsed'] == 0
+
+
+def test_reservation_is_settled_after_recognition(client, limiter):
+    assert post_image(client).get_json()['status'] == 200
+    usage = limiter.usage('ip:127.0.0.1')
+    assert usage['inFlight'] == 0
+    assert usage['tokensUsed'] == 0
+
+
+def test_supplied_user_id_gets_its_own_limit(client, limiter):
+    post_image(client, userId='user_a')
+    assert limiter.stats()['trackedUsers'] == 1
+    assert limiter.usage('user:user_a')['inFlight'] == 0
+    assert 'ip:127.0.0.1' not in limiter._users
@@ -0,0 +1,30 @@
+from src.utils.pinyin import compact_pinyin_query, name_pinyin, pinyin_initials, segment_pinyin
+from src.utils.search_index import FoodSearchIndex
+from tests.test_search_index import make_record
+
+
+def test_segment_pinyin_breaks_at_separators():
+    assert segment_pinyin("xi'an") == ['xi', 'an']
+    assert segment_pinyin('xi an') == ['xi', 'an']
+    assert segment_pinyin('xian') == ['xian']
+    assert segment_pinyin('mifan') == ['mi', 'fan']
+
+
+def test_segment_pinyin_rejects_non_pinyin():
+    assert segment_pinyin('mifna') is None
+    assert segment_pinyin('米饭') is None
+    assert segment_pinyin('') is None
+
+
+def test_name_pinyin_and_initials():
+    assert name_pinyin('白米饭') == ('bai', 'mi', 'fan')
+    assert pinyin_initials(name_pinyin('白米饭')) == 'bmf'
+    assert compact_pinyin_query("Xi'an") == 'xian'
+
+
+def test_full_pinyin_and_initials_find_the_food():
+    index = FoodSearchIndex([make_record('rice', '白米饭'), make_record('bun', '馒头')])
+    assert set(index.search('mifan')) == {'rice'}
+    assert set(index.search('mi fan')) == {'rice'}
+    assert set(index.search('mf')) == {'rice'}
+    assert set(index.search('bmf')) == {'rice'}
@@ -0,0 +1,17 @@
+from datetime import datetime, timedelta
+
+from src.models import db, RecognitionCacheEntry
+from src.utils.recognition_cache import RecognitionCache
+
+
+def test_purge_expired_deletes_only_expired_rows(app):
+    now = datetime.utcnow()
+    for i in range(5):
+        db.session.add(RecognitionCacheEntry(image_hash=f'old{i}', result='{}', created_at=now - timedelta(days=8)))
+    db.session.add(RecognitionCacheEntry(image_hash='fresh', result='{}', created_at=now))
+    db.session.commit()
+
+    cache = RecognitionCache(max_size=10, ttl=7 * 24 * 3600)
+    assert cache.purge_expired(batch_size=2, dry_run=True) == 5
+    assert cache.purge_expired(batch_size=2) == 5
+    assert [row.image_hash for row in RecognitionCacheEntry.query.all()] == ['fresh']
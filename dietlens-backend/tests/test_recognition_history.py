@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+from src.models import db, FoodRecognition, RecognizedFood
+from tests.conftest import count_queries
+
+
+def add_recognitions(count, foods_per_recognition=3):
+    started = datetime(2024, 1, 1)
+    for i in range(count):
+        recognition = FoodRecognition(user_id='user_test001', image_url=f'/static/uploads/recognition/{i}.jpg')
+        recognition.created_at = started + timedelta(minutes=i)
+        db.session.add(recognition)
+        foods = [RecognizedFood(recognition_id=recognition.id, name=f'食物{i}-{j}', calories=100)
+                 for j in range(foods_per_recognition)]
+        db.session.add_all(foods)
+        recognition.update_totals(foods)
+    db.session.commit()
+
+
+def fetch_history(client, limit):
+    with count_queries(db.engine) as statements:
+        response = client.get(f'/api/food-recognition/history?userId=user_test001&limit={limit}')
+    assert response.status_code == 200
+    return response.get_json()['data'], statements
+
+
+def test_history_query_count_does_not_grow_with_page_size(client):
+    add_recognitions(60)
+    db.session.expunge_all()
+
+    small_page, small_statements = fetch_history(client, 5)
+    large_page, large_statements = fetch_history(client, 50)
+
+    assert len(small_page['items']) == 5
+    assert len(large_page['items']) == 50
+    assert all(len(item['foods']) == 3 for item in large_page['items'])
+    # 用户、计数、识别记录、识别食物（一条 IN 查询）
+    assert len(small_statements) == len(large_statements) == 4
+
+
+def test_history_keyset_pages_do_not_overlap(client):
+    add_recognitions(12, foods_per_recognition=1)
+
+    first_page, _ = fetch_history(client, 5)
+    response = client.get(f"/api/food-recognition/history?userId=user_test001&limit=5&cursor={first_page['nextCursor']}")
+    second_page = response.get_json()['data']
+
+    first_ids = [item['recognitionId'] for item in first_page['items']]
+    second_ids = [item['recognitionId'] for item in second_page['items']]
+    assert len(second_ids) == 5
+    assert not set(first_ids) & set(second_ids)
+    assert second_page['total'] is None
@@ -0,0 +1,47 @@
+import io
+from datetime import datetime, timedelta
+
+from src.models import db, FoodRecognition
+from src.routes import food_recognition
+from src.utils.recognition_jobs import fail_stale_recognitions
+from src.utils.user_limiter import UserRecognitionLimiter
+
+
+def add_recognition(status, age):
+    recognition = FoodRecognition(user_id='user_test001', image_url='/static/uploads/recognition/x.jpg', status=status)
+    recognition.created_at = datetime.utcnow() - timedelta(seconds=age)
+    db.session.add(recognition)
+    db.session.commit()
+    return recognition.id
+
+
+def test_fail_stale_recognitions_only_touches_old_unfinished_records(app):
+    stale_pending = add_recognition(FoodRecognition.STATUS_PENDING, 3600)
+    stale_running = add_recognition(FoodRecognition.STATUS_RUNNING, 3600)
+    fresh_running = add_recognition(FoodRecognition.STATUS_RUNNING, 10)
+    old_done = add_recognition(FoodRecognition.STATUS_DONE, 3600)
+
+    assert fail_stale_recognitions(timeout=900) == 2
+    statuses = {r.id: r.status for r in FoodRecognition.query.all()}
+    assert statuses[stale_pending] == statuses[stale_running] == FoodRecognition.STATUS_FAILED
+    assert statuses[fresh_running] == FoodRecognition.STATUS_RUNNING
+    assert statuses[old_done] == FoodRecognition.STATUS_DONE
+
+
+def test_queue_full_refunds_the_reservation_and_drops_the_record(client, monkeypatch):
+    limiter = UserRecognitionLimiter(max_in_flight=1, token_budget=10000, window_seconds=3600, estimated_tokens=1000)
+    monkeypatch.setattr(food_recognition, 'user_recognition_limiter', limiter)
+    monkeypatch.setattr(food_recognition.recognition_job_queue, 'submit', lambda *args, **kwargs: False)
+
+    response = client.post('/api/food-recognition/analyze', data={
+        'image': (io.BytesIO(b'not really a jpeg'), 'meal.jpg'),
+        'userId': 'user_test001',
+        'async': 'true'
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 503
+    assert response.get_json()['error'] == 'QUEUE_FULL'
+    assert FoodRecognition.query.count() == 0
+    usage = limiter.usage('user_test001')
+    assert usage['inFlight'] == 0
+    assert usage['tokensUsed'] == 0
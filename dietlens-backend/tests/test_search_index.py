@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+from src.utils.pinyin import name_pinyin, pinyin_initials
+from src.utils.search_index import FoodSearchIndex, tokenize
+
+
+def make_record(food_id, name, tags=(), description=''):
+    syllables = name_pinyin(name)
+    return SimpleNamespace(id=food_id, name=name, tags=tuple(tags), description=description,
+                           pinyin=syllables, initials=pinyin_initials(syllables))
+
+
+def test_tokenize_uses_cjk_bigrams_and_whole_words():
+    assert tokenize('白米饭 Apple') == ['白米', '米饭', 'apple']
+    assert tokenize('白米饭', unigrams=True) == ['白米', '米饭', '白', '米', '饭']
+
+
+def test_chinese_query_matches_bigrams():
+    index = FoodSearchIndex([make_record('rice', '白米饭'), make_record('corn', '玉米粒')])
+    assert set(index.search('米饭')) == {'rice'}
+
+
+def test_latin_prefixes_match_words_in_name_and_tags():
+    index = FoodSearchIndex([
+        make_record('pie', 'Apple pie'),
+        make_record('breast', '鸡胸肉', tags=['Chicken']),
+        make_record('milk', 'milk'),
+    ])
+    assert set(index.search('app')) == {'pie'}
+    assert set(index.search('chick')) == {'breast'}
+    # 整词命中的分数高于前缀命中
+    assert index.search('apple')['pie'] > index.search('app')['pie']
+    # 前缀至少 3 个字母，避免两个字母的拼音查询命中英文单词
+    assert 'milk' not in index.search('mi')
+
+
+def test_add_replaces_a_food_in_place():
+    index = FoodSearchIndex([make_record('food_1', '白米饭')])
+    index.add(make_record('food_1', '馒头'))
+
+    assert len(index) == 1
+    assert index.search('米饭') == {}
+    assert set(index.search('馒头')) == {'food_1'}
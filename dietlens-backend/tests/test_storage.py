@@ -0,0 +1,54 @@
+import io
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from src.utils.storage import ContentStore, MemoryObjectStorage
+
+
+@pytest.mark.parametrize('filename, extension', [
+    ('早餐.JPG', 'jpg'),
+    ('../photo.png', 'png'),
+    ('a.b.jpeg', 'jpeg'),
+])
+def test_upload_extension_accepts_image_formats(filename, extension):
+    assert ContentStore.upload_extension(filename) == extension
+
+
+@pytest.mark.parametrize('filename', ['x.html', 'a./x', 'noext', '', None])
+def test_upload_extension_rejects_other_names(filename):
+    with pytest.raises(ValueError):
+        ContentStore.upload_extension(filename)
+
+
+def test_save_upload_rejects_html_without_storing():
+    backend = MemoryObjectStorage()
+    store = ContentStore(backend)
+    with pytest.raises(ValueError):
+        store.save_upload('community', FileStorage(io.BytesIO(b'<script></script>'), filename='x.html'))
+    assert list(store.iter_files('community')) == []
+
+    stored = store.save_upload('community', FileStorage(io.BytesIO(b'image'), filename='x.PNG'))
+    assert stored.key.endswith('.png')
+
+
+def test_dedup_hit_refreshes_mtime():
+    backend = MemoryObjectStorage()
+    store = ContentStore(backend)
+    stored = store.save('recognition', b'image', 'jpg')
+    backend._objects[stored.key] = (b'image', 0.0)
+
+    assert store.save('recognition', b'image', 'jpg').deduplicated
+    assert backend.mtime(stored.key) > 0.0
+
+
+def test_delete_skips_files_within_grace_period():
+    backend = MemoryObjectStorage()
+    store = ContentStore(backend)
+    stored = store.save('recognition', b'image', 'jpg')
+
+    assert store.delete(stored.key, min_age=3600) is None
+    assert backend.exists(stored.key)
+
+    backend._objects[stored.key] = (b'image', 0.0)
+    assert store.delete(stored.key, min_age=3600) == len(b'image')
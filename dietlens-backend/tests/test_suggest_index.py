@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+from src.utils.pinyin import name_pinyin, pinyin_initials
+from src.utils.suggest_index import FoodSuggestIndex
+
+
+def make_record(food_id, name, popularity=0):
+    syllables = name_pinyin(name)
+    return SimpleNamespace(id=food_id, name=name, popularity=popularity,
+                           pinyin=syllables, initials=pinyin_initials(syllables))
+
+
+def suggested_ids(index, prefix, limit=10):
+    return [food_id for food_id, _ in index.suggest(prefix, limit)]
+
+
+def test_suggest_matches_name_pinyin_and_initials():
+    index = FoodSuggestIndex([make_record('rice', '白米饭', 5), make_record('bun', '馒头', 3)])
+    assert index.suggest('白米') == [('rice', 'name')]
+    assert index.suggest('baimi') == [('rice', 'pinyin')]
+    assert index.suggest('bmf') == [('rice', 'initials')]
+    assert index.suggest('') == []
+
+
+def test_added_food_is_ranked_by_popularity():
+    index = FoodSuggestIndex([make_record('rice', '白米饭', 5), make_record('congee', '白粥', 1)])
+    index.add(make_record('radish', '白萝卜', 9))
+
+    # 短前缀走预先算好的 top-k，长前缀在范围内现排
+    assert suggested_ids(index, '白') == ['radish', 'rice', 'congee']
+    assert suggested_ids(index, 'bai') == ['radish', 'rice', 'congee']
+    assert suggested_ids(index, '白', limit=1) == ['radish']
+
+
+def test_add_replaces_a_food_in_place():
+    index = FoodSuggestIndex([make_record('rice', '白米饭', 5), make_record('congee', '白粥', 1)])
+    index.add(make_record('rice', '糙米饭', 5))
+
+    assert suggested_ids(index, '白') == ['congee']
+    assert suggested_ids(index, 'bai') == ['congee']
+    assert suggested_ids(index, '糙') == ['rice']